@@ -1,26 +1,15 @@
 import pandas as pd # 导入 pandas，虽然这里直接用 backtrader 的 feed，但保持导入是个好习惯
 import backtrader as bt 
 import matplotlib.pyplot as plt # 导入 matplotlib 的 pyplot 模块
+from data_cache import load_price_csv
+from indicator_cache import cached_indicator
 
 # 定义下载的文件
 data_file = "GC=F_historical_data.csv"
-column_names = ['Date', 'Close', 'High', 'Low', 'Open', 'Volume']
 
-# 使用 pandas 读取 CSV 文件，跳过前三行 (header=3)，并且手动指定列名
-df = pd.read_csv(
-    data_file,
-    header=None,
-    skiprows=3,
-    names=column_names, # 手动指定列名
-    index_col=0,   # 将第一列（日期）设置为索引
-    parse_dates=True # 将索引列解析为日期时间对象
-)
-
-if 'Adj Close' not in df.columns:
-    df['Adj Close'] = df['Close']
-
-# 我们需要重新排列一下 df 的列
-df = df[['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']]
+# 第一次运行时把 CSV 转换成二进制列式缓存，之后直接内存映射读取，不再解析日期
+# 返回的列顺序为 ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']
+df = load_price_csv(data_file)
 # 打印数据的前几行和列信息，方便调试
 print("Pandas DataFrame 前几行：")
 print(df.head())
@@ -34,7 +23,8 @@ class DualMovingAverage(bt.Strategy):
     params = (('fast_length', 25),
               ('slow_length', 200),
               ('atr_period', 14),   # ATR周期
-              ('atr_multiple', 2.0) # ATR的倍数，用于计算止损距离
+              ('atr_multiple', 2.0), # ATR的倍数，用于计算止损距离
+              ('use_indicator_cache', False) # 是否使用共享指标缓存中的预计算指标
              )
     
     def __init__(self):
@@ -45,11 +35,17 @@ class DualMovingAverage(bt.Strategy):
         self.buyprice = None
         self.comm = None
         self.stop_price = None
-        # 均线指标
-        self.fast_ma = bt.indicators.SMA(self.dataclose, period=self.p.fast_length)
-        self.slow_ma = bt.indicators.SMA(self.dataclose, period=self.p.slow_length)
-        # ATR指标
-        self.atr = bt.indicators.ATR(self.datas[0], period=self.p.atr_period)
+        if self.p.use_indicator_cache:
+            # 参数优化时相同参数的指标只计算一次，各参数组合共享
+            self.fast_ma = cached_indicator(self.datas[0], 'SMA', period=self.p.fast_length)
+            self.slow_ma = cached_indicator(self.datas[0], 'SMA', period=self.p.slow_length)
+            self.atr = cached_indicator(self.datas[0], 'ATR', period=self.p.atr_period)
+        else:
+            # 均线指标
+            self.fast_ma = bt.indicators.SMA(self.dataclose, period=self.p.fast_length)
+            self.slow_ma = bt.indicators.SMA(self.dataclose, period=self.p.slow_length)
+            # ATR指标
+            self.atr = bt.indicators.ATR(self.datas[0], period=self.p.atr_period)
 
     def notify_order(self, order):
         if order.status in [order.Submitted, order.Accepted]:
@@ -122,10 +118,24 @@ if __name__ == '__main__':
     cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
     cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years) # 添加夏普比率
-    data = bt.feeds.PandasData(
-        dataname=df,
-        timeframe=bt.TimeFrame.Days # 明确指定数据的时间框架是日线
-    )
+    # 快速报告 (默认关闭)：记录资金曲线和交易列表，用 report 模块一次算出全部指标，
+    # 并用降采样的资金曲线代替 cerebro.plot()
+    fast_report = False
+    if fast_report:
+        from opt_runner import EquityCurve, TradeList
+        cerebro.addanalyzer(EquityCurve, _name="equity_curve")
+        cerebro.addanalyzer(TradeList, _name="trade_list")
+    # 大数据模式 (默认关闭)：填入分钟线列式存储目录 (可以用 minute_feed.csv_to_store 从 CSV 转换)，
+    # 分块流式读取并在流中合成日线，配合 exactbars=1 内存不随历史长度增长 (此模式下不画图)
+    minute_store = None
+    if minute_store:
+        from minute_feed import ChunkedMinuteData
+        data = ChunkedMinuteData(dataname=minute_store, resample=True)
+    else:
+        data = bt.feeds.PandasData(
+            dataname=df,
+            timeframe=bt.TimeFrame.Days # 明确指定数据的时间框架是日线
+        )
 
     # 将数据 Feed 添加到 Cerebro 引擎
     cerebro.adddata(data)
@@ -138,8 +148,16 @@ if __name__ == '__main__':
     # 打印初始资金
     print(f"初始资金: {cerebro.broker.getvalue():.2f}")
 
+    # 性能剖析 (默认关闭)：打开后在结果汇总后面打印各阶段和回调的耗时
+    profile_run = False
     # 运行回测
-    results = cerebro.run()  # 建议将变量名改为复数形式，以提醒自己它是一个列表
+    run_kwargs = {'exactbars': 1} if minute_store else {}
+    if profile_run:
+        from profiling import RunProfiler, print_summary
+        profiler = RunProfiler()
+        results = profiler.run(cerebro, **run_kwargs)
+    else:
+        results = cerebro.run(**run_kwargs)  # 建议将变量名改为复数形式，以提醒自己它是一个列表
     thestrat = results[0]    # 获取列表中的第一个策略实例
     # 通过策略实例访问分析器
     trade_analyzer = thestrat.analyzers.trade_analyzer.get_analysis()
@@ -161,6 +179,17 @@ if __name__ == '__main__':
         print(f"夏普比率: {sharpe_ratio_value:.4f}")
     else:
         print("夏普比率: N/A")
-
-    # 绘制图表
-    cerebro.plot()
+    if profile_run:
+        print_summary(profiler.summary())
+
+    if fast_report:
+        from report import make_trades, plot_equity, print_metrics, run_metrics
+        equity = thestrat.analyzers.equity_curve.get_analysis()
+        dates = None if minute_store else df.index
+        print_metrics(run_metrics(equity, make_trades(**thestrat.analyzers.trade_list.get_analysis()), dates,
+                                  cash=100000.0))
+        plot_equity(equity, dates)
+        plt.show()
+    # 绘制图表 (exactbars=1 时 backtrader 不保留完整数据，无法绘图)
+    elif not minute_store:
+        cerebro.plot()
@@ -1,26 +1,15 @@
 import pandas as pd # 导入 pandas，虽然这里直接用 backtrader 的 feed，但保持导入是个好习惯
 import backtrader as bt 
 import matplotlib.pyplot as plt # 导入 matplotlib 的 pyplot 模块
+from data_cache import load_price_csv
+from indicator_cache import cached_indicator
 
 # 定义下载的文件
 data_file = "GC=F_historical_data.csv"
-column_names = ['Date', 'Close', 'High', 'Low', 'Open', 'Volume']
 
-# 使用 pandas 读取 CSV 文件，跳过前三行 (header=3)，并且手动指定列名
-df = pd.read_csv(
-    data_file,
-    header=None,
-    skiprows=3,
-    names=column_names, # 手动指定列名
-    index_col=0,   # 将第一列（日期）设置为索引
-    parse_dates=True # 将索引列解析为日期时间对象
-)
-
-if 'Adj Close' not in df.columns:
-    df['Adj Close'] = df['Close']
-
-# 我们需要重新排列一下 df 的列
-df = df[['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']]
+# 第一次运行时把 CSV 转换成二进制列式缓存，之后直接内存映射读取，不再解析日期
+# 返回的列顺序为 ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']
+df = load_price_csv(data_file)
 # 打印数据的前几行和列信息，方便调试
 print("Pandas DataFrame 前几行：")
 print(df.head())
@@ -31,6 +20,7 @@ class DualMovingAverage(bt.Strategy):
     # 定义策略的参数
     params = (('fast_length', 20), # 快速移动平均线周期
               ('slow_length', 60), # 慢速移动平均线周期
+              ('use_indicator_cache', False), # 是否使用共享指标缓存中的预计算均线
              )
     
     def __init__(self):
@@ -41,8 +31,13 @@ class DualMovingAverage(bt.Strategy):
         self.buyprice = None # 记录买入价格
         self.comm = None     # 记录佣金
         # 创建两条移动平均线指标
-        self.fast_ma = bt.indicators.SMA(self.dataclose, period=self.p.fast_length)
-        self.slow_ma = bt.indicators.SMA(self.dataclose, period=self.p.slow_length)
+        if self.p.use_indicator_cache:
+            # 参数优化时同一周期的均线只计算一次，各参数组合共享
+            self.fast_ma = cached_indicator(self.datas[0], 'SMA', period=self.p.fast_length)
+            self.slow_ma = cached_indicator(self.datas[0], 'SMA', period=self.p.slow_length)
+        else:
+            self.fast_ma = bt.indicators.SMA(self.dataclose, period=self.p.fast_length)
+            self.slow_ma = bt.indicators.SMA(self.dataclose, period=self.p.slow_length)
         # 我们将不再使用 bt.indicators.CrossOver 指标，直接在 next 方法中判断交叉
         
     def notify_order(self, order):
@@ -117,63 +112,164 @@ if __name__ == "__main__":
     # ************************************************************
     # 核心优化部分：定义参数范围
     # ************************************************************
-    cerebro.optstrategy(
-        DualMovingAverage, # 我们要优化的策略类
-        fast_length=range(10, 31, 5), # fast_length 从 10 到 30，步长为 5 (10, 15, 20, 25, 30)
-        slow_length=range(50, 200, 10) # slow_length 从 50 到 100，步长为 10 (50, 60, 70, 80, 90, 100)
-    )
-    # ************************************************************
-    # 添加分析器来收集回测结果
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
-    cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years) # 添加夏普比率
-    # 打印提示
+    fast_lengths = range(10, 31, 5) # fast_length 从 10 到 30，步长为 5 (10, 15, 20, 25, 30)
+    slow_lengths = range(50, 200, 10) # slow_length 从 50 到 190，步长为 10
+    # 优化模式：'process' (默认) 使用 opt_runner 的进程池分块运行，每个组合仍是一次完整的 Cerebro 回测，
+    # 结果逐条流式返回，内存不随网格增大，并且可以通过 result_store 复用之前跑过的组合；
+    # 'backtrader' 使用 cerebro.optstrategy 逐 bar 回测 (每次都全部重新计算)；
+    # 'vector' 使用 vector_sma 的向量化引擎，结果与 backtrader 一致，适合先筛选大规模参数网格；
+    # 'walk_forward' 使用 walk_forward 做滚动前推优化，只给出样本外结果 (不做整段历史的样本内汇总和回放)
+    opt_mode = 'process'
+    opt_workers = None  # 进程数，None 表示使用全部 CPU 核
+    opt_chunk_size = 4  # 每个任务包含的参数组合数
+    use_result_store = True  # 'process' 模式下把完成的回测存入 result_store，重跑时只计算缺失的组合
+    # 最佳参数的汇总直接取自优化记录 (命中 result_store 时不再回测)；只有需要画图或剖析时才重新运行一次
+    plot_best = True
+    # 性能剖析 (默认关闭，关闭时没有额外开销)：
+    # opt_profile_index 为 'process' 模式下要剖析的参数组合序号 (这一组不从 result_store 取缓存)，
+    # profile_best_run 剖析最佳参数的重新运行
+    opt_profile_index = None
+    profile_best_run = False
+    # 参数网格报告 (默认关闭)：保留每个组合的资金曲线和交易列表，用 report 模块一次算出全部指标，
+    # 画出 fast/slow 热力图和收益最高几组的资金曲线，代替 cerebro_best.plot()
+    opt_report = False
+    # 'walk_forward' 模式的窗口设置：训练 wf_train_bars 根 bar，测试 wf_test_bars 根 bar；
+    # wf_anchored 为 True 时训练窗口起点固定在历史开头
+    wf_train_bars = 252 * 5
+    wf_test_bars = 252
+    wf_anchored = False
     print("开始运行参数优化回测...")
-    # 运行优化回测
-    results = cerebro.run()
-    print("参数优化回测完成！")
-    print("\n开始分析优化结果...")
+    opt_records = [] # 每个参数组合一条记录：fast_length, slow_length, rtot, total_trades, sharpe_ratio
+    if opt_mode == 'walk_forward':
+        from walk_forward import walk_forward
+        wf_summary, oos_equity = walk_forward(df, fast_lengths, slow_lengths,
+                                              train_bars=wf_train_bars, test_bars=wf_test_bars,
+                                              anchored=wf_anchored, workers=opt_workers,
+                                              size=10, commission=0.0001, cash=initial_cash)
+        print("\n--- Walk-forward 各窗口结果 (样本外) ---")
+        for _, w in wf_summary.iterrows():
+            print(f"  训练 {w['train_start'].date()} ~ {w['train_end'].date()} | "
+                  f"测试 {w['test_start'].date()} ~ {w['test_end'].date()} | "
+                  f"fast_length: {w['fast_length']}, slow_length: {w['slow_length']} | "
+                  f"样本外收益率: {w['test_rtot'] * 100:.2f}%, 交易次数: {w['test_trades']}"
+                  + (" | 窗口结束时平仓" if w['forced_exit'] else ""))
+        if len(oos_equity):
+            print(f"样本外拼接后最终资金: {oos_equity.iloc[-1]:.2f}")
+            print(f"样本外总收益率: {(oos_equity.iloc[-1] / initial_cash - 1) * 100:.2f}%")
+            if plot_best:
+                oos_equity.plot(title="Walk-forward 样本外资金曲线")
+                plt.show()
+        else:
+            print("数据不足一个训练窗口，没有样本外结果。")
+    elif opt_mode == 'vector':
+        from vector_sma import run_vector_grid
+        opt_records = run_vector_grid(df, fast_lengths, slow_lengths,
+                                      size=10, commission=0.0001, initial_cash=initial_cash,
+                                      keep_equity=opt_report)
+    elif opt_mode == 'process':
+        from opt_runner import iter_optimize, param_grid
+        grid = param_grid(fast_length=fast_lengths, slow_length=slow_lengths, use_indicator_cache=True)
+        # 生成器：下面的汇总循环会随着子进程完成逐条处理记录
+        if use_result_store:
+            from result_store import ResultStore, cached_optimize
+            result_store = ResultStore()
+            opt_records = cached_optimize(result_store, DualMovingAverage, df, grid,
+                                          workers=opt_workers, chunk_size=opt_chunk_size,
+                                          cash=initial_cash, commission=0.0001, keep_equity=opt_report,
+                                          profile_index=opt_profile_index)
+        else:
+            opt_records = iter_optimize(DualMovingAverage, df, grid,
+                                        workers=opt_workers, chunk_size=opt_chunk_size,
+                                        cash=initial_cash, commission=0.0001, keep_equity=opt_report,
+                                        profile_index=opt_profile_index)
+    else:
+        cerebro.optstrategy(
+            DualMovingAverage, # 我们要优化的策略类
+            fast_length=fast_lengths,
+            slow_length=slow_lengths,
+            use_indicator_cache=True # 各参数组合共享预计算的均线
+        )
+        # 添加分析器来收集回测结果
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+        cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years) # 添加夏普比率
+        if opt_report:
+            from opt_runner import EquityCurve, TradeList
+            cerebro.addanalyzer(EquityCurve, _name="equity_curve")
+            cerebro.addanalyzer(TradeList, _name="trade_list")
+        # 运行优化回测
+        results = cerebro.run()
+        for stratrun in results: # 遍历每次策略运行
+            for s in stratrun: # 遍历每次运行中的策略实例 (通常只有一个)
+                # 获取分析器的结果
+                trade_analyzer = s.analyzers.trade_analyzer.get_analysis()
+                returns_analyzer = s.analyzers.returns_analyzer.get_analysis()
+                sharpe_ratio = s.analyzers.sharpe_ratio.get_analysis()
+                opt_records.append({
+                    'fast_length': s.p.fast_length,
+                    'slow_length': s.p.slow_length,
+                    # returns_analyzer.rtot 是总收益率，已经考虑了资金变动
+                    'rtot': returns_analyzer['rtot'] if 'rtot' in returns_analyzer else 0.0,
+                    # 确保 trade_analyzer 有效数据再访问
+                    'total_trades': trade_analyzer.total.closed if 'total' in trade_analyzer and 'closed' in trade_analyzer.total else 0,
+                    'sharpe_ratio': sharpe_ratio.get('sharperatio') if sharpe_ratio else None,
+                })
+                if opt_report:
+                    opt_records[-1]['equity'] = s.analyzers.equity_curve.get_analysis()
+                    opt_records[-1]['trades'] = s.analyzers.trade_list.get_analysis()
+    if opt_mode != 'walk_forward':
+        print("\n开始分析优化结果...")
     # -----------------------------------------------------------
     # 分析和打印优化结果
     # -----------------------------------------------------------
     best_strategy = None
     best_returns = -float('inf') # 初始化为负无穷，用于找到最大收益
-    print("\n--- 优化结果汇总 ---")
-    for stratrun in results: # 遍历每次策略运行
-        for s in stratrun: # 遍历每次运行中的策略实例 (通常只有一个)
-            # 获取策略的参数
-            p = s.p
-            # 获取分析器的结果
-            trade_analyzer = s.analyzers.trade_analyzer.get_analysis()
-            returns_analyzer = s.analyzers.returns_analyzer.get_analysis()
-            sharpe_ratio = s.analyzers.sharpe_ratio.get_analysis()
-            # 获取总收益率 (Total Returns)
-            # returns_analyzer.rtot 是总收益率，已经考虑了资金变动
-            total_returns_percentage = returns_analyzer['rtot'] * 100 if 'rtot' in returns_analyzer else 0.0
-            # 最终资金可以通过初始资金 + 初始资金 * 总收益率 计算
-            final_value = initial_cash * (1 + total_returns_percentage / 100)
-            # 打印当前参数组合的结果
-            print(f"  fast_length: {p.fast_length}, slow_length: {p.slow_length}")
-            print(f"    最终资金: {final_value:.2f}")
-            print(f"    总收益率: {total_returns_percentage:.2f}%")
-            # 确保 trade_analyzer 有效数据再访问
-            total_closed_trades = trade_analyzer.total.closed if 'total' in trade_analyzer and 'closed' in trade_analyzer.total else 0
-            print(f"    交易总数: {total_closed_trades}")
-            if sharpe_ratio and sharpe_ratio.get('sharperatio') is not None:
-                print(f"    夏普比率: {sharpe_ratio['sharperatio']:.4f}") # 使用字典访问
-            else:
-                print("    夏普比率: N/A (可能数据不足或波动为0)")
-            # 记录最佳参数
-            if total_returns_percentage > best_returns:
-                best_returns = total_returns_percentage
-                best_strategy = {
-                    'fast_length': p.fast_length,
-                    'slow_length': p.slow_length,
-                    'returns': total_returns_percentage,
-                    'final_value': final_value,
-                    'total_trades': total_closed_trades,
-                    'sharpe_ratio': sharpe_ratio['sharperatio'] if sharpe_ratio and sharpe_ratio.get('sharperatio') is not None else 'N/A'
-                }
+    profiled_record = None # 做过性能剖析的那一次运行
+    report_records = [] # opt_report 打开时收集全部记录
+    if opt_mode != 'walk_forward':
+        print("\n--- 优化结果汇总 ---")
+    for record in opt_records:
+        if 'profile' in record:
+            profiled_record = record
+        if opt_report:
+            report_records.append(record)
+        total_returns_percentage = record['rtot'] * 100
+        # 最终资金可以通过初始资金 + 初始资金 * 总收益率 计算
+        final_value = initial_cash * (1 + total_returns_percentage / 100)
+        # 打印当前参数组合的结果
+        print(f"  fast_length: {record['fast_length']}, slow_length: {record['slow_length']}")
+        print(f"    最终资金: {final_value:.2f}")
+        print(f"    总收益率: {total_returns_percentage:.2f}%")
+        print(f"    交易总数: {record['total_trades']}")
+        if record['sharpe_ratio'] is not None:
+            print(f"    夏普比率: {record['sharpe_ratio']:.4f}")
+        else:
+            print("    夏普比率: N/A (可能数据不足或波动为0)")
+        # 记录最佳参数
+        if total_returns_percentage > best_returns:
+            best_returns = total_returns_percentage
+            best_strategy = {
+                'fast_length': record['fast_length'],
+                'slow_length': record['slow_length'],
+                'returns': total_returns_percentage,
+                'final_value': final_value,
+                'total_trades': record['total_trades'],
+                'sharpe_ratio': record['sharpe_ratio'] if record['sharpe_ratio'] is not None else 'N/A',
+                'cached': record.get('cached', False),
+            }
+    if opt_mode != 'walk_forward':
+        print("参数优化回测完成！")
+    if profiled_record is not None:
+        from profiling import print_summary
+        print(f"\n--- 参数组合 fast_length: {profiled_record['fast_length']}, "
+              f"slow_length: {profiled_record['slow_length']} 的运行剖析 ---")
+        print_summary(profiled_record['profile'])
+    if opt_report and report_records:
+        from report import sweep_report
+        report_table, report_fig = sweep_report(report_records, df.index, cash=initial_cash)
+        print("\n--- 参数网格指标 (按总收益排序，前 10 组) ---")
+        print(report_table.sort_values('rtot', ascending=False).head(10).to_string(index=False))
+        plt.show()
     if best_strategy:
         print("\n--- 最佳参数组合 ---")
         print(f"  快速均线周期 (Fast MA Length): {best_strategy['fast_length']}")
@@ -182,7 +278,12 @@ if __name__ == "__main__":
         print(f"  最高收益率 (基于优化): {best_strategy['returns']:.2f}%")
         print(f"  交易总数 (基于优化): {best_strategy['total_trades']}")
         print(f"  夏普比率 (基于优化): {best_strategy['sharpe_ratio']:.4f}" if best_strategy['sharpe_ratio'] != 'N/A' else f"  夏普比率: {best_strategy['sharpe_ratio']}")
-        print("\n--- 重新运行最佳策略进行验证 ---")
+        if best_strategy['cached']:
+            print("  (以上结果来自 result_store，没有重新回测)")
+    replay_best = best_strategy is not None and (profile_best_run or (plot_best and not opt_report))
+    if replay_best:
+        # 只有画图 / 剖析需要 Cerebro 的完整运行对象，汇总数字已经在上面给出
+        print("\n--- 重新运行最佳策略 (用于画图) ---")
         cerebro_best = bt.Cerebro()
         cerebro_best.adddata(data) # 确保数据再次被添加
         # 设置相同的初始资金和佣金
@@ -200,7 +301,12 @@ if __name__ == "__main__":
         cerebro_best.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer_best", timeframe=bt.TimeFrame.Days)
         cerebro_best.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio_best", timeframe=bt.TimeFrame.Years)
         print(f"初始资金: {cerebro_best.broker.getvalue():.2f}")
-        best_results = cerebro_best.run() # 运行最佳策略的回测
+        if profile_best_run:
+            from profiling import RunProfiler, print_summary
+            best_profiler = RunProfiler()
+            best_results = best_profiler.run(cerebro_best)
+        else:
+            best_results = cerebro_best.run() # 运行最佳策略的回测
         # 获取最佳策略运行的分析结果
         best_s = best_results[0] # 优化运行返回的是列表的列表，单次回测也是如此，所以取第一个
         trade_analyzer_best = best_s.analyzers.trade_analyzer_best.get_analysis()
@@ -215,6 +321,9 @@ if __name__ == "__main__":
         print(f"重新运行总收益率: {total_returns_percentage_best:.2f}%")
         print(f"重新运行交易总数: {total_closed_trades_best}")
         print(f"重新运行夏普比率: {sharpe_value_best:.4f}" if sharpe_value_best != 'N/A' else f"重新运行夏普比率: {sharpe_value_best}")
-        cerebro_best.plot()
-    else:
+        if profile_best_run:
+            print_summary(best_profiler.summary())
+        if plot_best and not opt_report:
+            cerebro_best.plot()
+    elif best_strategy is None and opt_mode != 'walk_forward':
         print("\n没有找到有效的优化结果，无法重新运行最佳策略。")
\ No newline at end of file
@@ -0,0 +1,264 @@
+# 多标的批量回测
+# BOLL_Strategy / MACD_Strategy / RSI_Strategy 只读 self.datas[0]，要在 1000 只股票上跑就得建 1000 个
+# Cerebro，每个都要重新加载数据、构造指标、走一遍 Python 事件循环。这里：
+#   - 把 {代码: OHLCV DataFrame} 按日期外连接对齐成 (日期 x 标的) 的矩阵，缺失的 bar 为 NaN
+#   - 每一列把有效的 bar "压紧"到前面 (稳定排序，保持时间顺序)，这样每只股票看到的 bar 序列与单独
+#     跑 Cerebro 时完全一样，指标预热位置也对齐到同一行，可以整列一起计算
+#   - 指标和买卖条件都是整列的数组运算；持仓相关的成交逻辑按时间逐行推进，每一行对所有标的同时处理
+#     (下一根 bar 开盘价成交、下单时和成交时各检查一次现金、按成交金额收佣金，与 backtrader 一致)
+#   - 输出每个标的以及整个组合的 rtot、夏普比率、最大回撤、胜率、盈亏比 (与笔记本中的计算方式相同)
+# 组合 = 每个标的各自一个独立账户 (初始资金 cash) 的资金曲线之和，缺失的 bar 沿用上一个值。
+import math
+
+import numpy as np
+import pandas as pd
+
+from momentum_panel import align_panel
+from vector_sma import sharpe_from_values
+
+
+# ----------------------------------------------------------------
+# 按列计算的指标 (axis=0 为时间)，前 minperiod-1 行为 NaN
+# ----------------------------------------------------------------
+def _shift(x, n=1):
+    out = np.full(x.shape, np.nan)
+    out[n:] = x[:-n]
+    return out
+
+
+def sma_2d(x, period):
+    out = np.full(x.shape, np.nan)
+    if period <= len(x):
+        windows = np.lib.stride_tricks.sliding_window_view(x, period, axis=0)
+        out[period - 1:] = windows.sum(axis=-1) / period
+    return out
+
+
+def smoothing_2d(x, period, alpha, start=0):
+    # backtrader 的 ExponentialSmoothing；start 为输入第一行有效值的位置 (各列相同)
+    out = np.full(x.shape, np.nan)
+    seed_row = start + period - 1
+    if seed_row >= len(x):
+        return out
+    prev = np.array([math.fsum(col) for col in x[start:seed_row + 1].T]) / period
+    out[seed_row] = prev
+    alpha1 = 1.0 - alpha
+    for i in range(seed_row + 1, len(x)):
+        out[i] = prev = prev * alpha1 + x[i] * alpha
+    return out
+
+
+def ema_2d(x, period, start=0):
+    return smoothing_2d(x, period, 2.0 / (1.0 + period), start)
+
+
+def boll_rules(o, h, l, c, boll_period=20, boll_devfactor=2.0):
+    mid = sma_2d(c, boll_period)
+    meansq = sma_2d(c ** 2, boll_period)
+    stddev = boll_devfactor * np.abs(meansq - mid ** 2) ** 0.5
+    top, bot = mid + stddev, mid - stddev
+    prev_c = _shift(c)
+    buy = (c <= bot) & (prev_c >= _shift(bot))
+    sell = (c >= top) & (prev_c <= _shift(top))
+    return buy, sell, boll_period
+
+
+def macd_rules(o, h, l, c, macd_fast=14, macd_slow=26, macd_signal=9):
+    line = ema_2d(c, macd_fast) - ema_2d(c, macd_slow)
+    signal = ema_2d(line, macd_signal, start=max(macd_fast, macd_slow) - 1)
+    prev_line, prev_signal = _shift(line), _shift(signal)
+    buy = (line > signal) & (prev_line < prev_signal)
+    sell = (line < signal) & (prev_line > prev_signal)
+    return buy, sell, max(macd_fast, macd_slow) + macd_signal - 1
+
+
+def rsi_rules(o, h, l, c, rsi_period=14, oversold=30, overbought=70):
+    change = c - _shift(c)
+    with np.errstate(invalid='ignore'):
+        maup = ema_2d(np.maximum(change, 0.0), rsi_period, start=1)
+        madown = ema_2d(np.maximum(-change, 0.0), rsi_period, start=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100.0 - 100.0 / (1.0 + maup / madown)
+    return rsi < oversold, rsi > overbought, rsi_period + 1
+
+
+# 策略类名 -> 买卖条件函数 (参数名与默认值与 strategies.py 中的策略类相同)
+RULES = {
+    'BOLL_Strategy': boll_rules,
+    'MACD_Strategy': macd_rules,
+    'RSI_Strategy': rsi_rules,
+}
+
+
+def _compact(panel_fields, valid):
+    # 每列把有效行稳定地移到前面，返回压紧后的矩阵和每个位置对应的原始行号
+    order = np.argsort(~valid, axis=0, kind='stable')
+    return [np.take_along_axis(x, order, axis=0) for x in panel_fields], order
+
+
+def _simulate(o, c, buy, sell, minperiod, n_valid, size, commission, cash0):
+    # 所有标的一起逐行推进的多头成交模拟，返回资金曲线和交易统计
+    n_rows, n_tickers = c.shape
+    cash = np.full(n_tickers, cash0)
+    holding = np.zeros(n_tickers, dtype=bool)
+    entry = np.zeros(n_tickers)
+    entry_comm = np.zeros(n_tickers)
+    pend_buy = np.zeros(n_tickers, dtype=bool)
+    pend_sell = np.zeros(n_tickers, dtype=bool)
+    created = np.zeros(n_tickers)
+    trades = np.zeros(n_tickers, dtype=np.int64)
+    won = np.zeros(n_tickers, dtype=np.int64)
+    gross_profit = np.zeros(n_tickers)
+    gross_loss = np.zeros(n_tickers)
+    equity = np.full(c.shape, np.nan)
+    for t in range(n_rows):
+        active = t < n_valid
+        ot, ct = o[t], c[t]
+        # ---- 执行上一根 bar 的挂单 ----
+        if pend_buy.any():
+            b = pend_buy & active
+            with np.errstate(invalid='ignore'):
+                ok = b & ((cash - size * created) - size * commission * created >= 0.0) \
+                    & ((cash - size * ot) - size * commission * ot >= 0.0)
+            comm = size * commission * ot
+            cash = np.where(ok, (cash - size * ot) - comm, cash)
+            holding |= ok
+            entry = np.where(ok, ot, entry)
+            entry_comm = np.where(ok, comm, entry_comm)
+            pend_buy &= ~b
+        if pend_sell.any():
+            s = pend_sell & active
+            pnl = size * (ot - entry)
+            comm = size * commission * ot
+            cash = np.where(s, (cash + (size * entry + pnl)) - comm, cash)
+            pnlcomm = pnl - (entry_comm + comm)
+            win = s & (pnlcomm >= 0.0)
+            trades += s
+            won += win
+            gross_profit += np.where(win, pnlcomm, 0.0)
+            gross_loss += np.where(s & ~win, pnlcomm, 0.0)
+            holding &= ~s
+            pend_sell &= ~s
+        # ---- 当前 bar 收盘后的信号 ----
+        if t >= minperiod - 1:
+            new_buy = active & ~holding & buy[t]
+            pend_buy |= new_buy
+            created = np.where(new_buy, ct, created)
+            pend_sell |= active & holding & sell[t]
+        equity[t] = np.where(active, cash + np.where(holding, size * ct, 0.0), np.nan)
+    return equity, {'total_trades': trades, 'won': won, 'gross_profit': gross_profit, 'gross_loss': gross_loss}
+
+
+def _trade_stats(trades, won, gross_profit, gross_loss):
+    # 与笔记本相同：胜率 = 盈利交易数 / 已平仓交易数，盈亏比 = 盈利总额 / |亏损总额|
+    win_rate = won / trades * 100 if trades > 0 else 0.0
+    profit_factor = gross_profit / abs(gross_loss) if abs(gross_loss) > 0 else float('inf')
+    return win_rate, profit_factor
+
+
+def _curve_stats(values, year_values, cash, riskfreerate):
+    # rtot (Returns 分析器的对数总收益)、SharpeRatio(timeframe=Years)、DrawDown 的最大回撤 (%)
+    final_value = float(values[-1])
+    peak = np.maximum.accumulate(np.concatenate(([cash], values)))[1:]
+    max_drawdown = float(np.max(100.0 * (peak - values) / peak))
+    return {
+        'final_value': final_value,
+        'rtot': math.log(final_value / cash) if final_value > 0 else float('-inf'),
+        'sharpe_ratio': sharpe_from_values(year_values, cash, riskfreerate),
+        'max_drawdown': max_drawdown,
+    }
+
+
+def _year_ends(years):
+    return np.append(np.flatnonzero(np.diff(years) != 0), len(years) - 1)
+
+
+def batch_backtest(frames, strategy='BOLL_Strategy', cash=100000.0, commission=0.0001, size=10,
+                   riskfreerate=0.01, keep_equity=False, **params):
+    # frames：{代码: OHLCV DataFrame}；strategy：策略类或类名；params：策略参数
+    # 返回 {'per_ticker': DataFrame, 'aggregate': dict, 'equity': 组合资金曲线 Series,
+    #       'ticker_equity': 各标的资金曲线 DataFrame (keep_equity=True 时)}
+    name = strategy if isinstance(strategy, str) else strategy.__name__
+    rules = RULES[name]
+    close_panel = align_panel(frames, 'Close')
+    index, tickers = close_panel.index, list(close_panel.columns)
+    fields = [close_panel.to_numpy(dtype=np.float64)]
+    fields += [align_panel(frames, f).reindex(index).to_numpy(dtype=np.float64) for f in ('Open', 'High', 'Low')]
+    valid = ~np.isnan(fields[0]) & ~np.isnan(fields[1])
+    (c, o, h, l), order = _compact(fields, valid)
+    n_valid = valid.sum(axis=0)
+
+    with np.errstate(invalid='ignore'):
+        buy, sell, minperiod = rules(o, h, l, c, **params)
+    equity, trade_counts = _simulate(o, c, buy, sell, minperiod, n_valid, size, commission, cash)
+
+    # 每个标的的指标：在自己的 bar 序列上计算，与单独跑 Cerebro 一致
+    years = pd.DatetimeIndex(index).year.to_numpy()
+    records = []
+    for j, ticker in enumerate(tickers):
+        n = n_valid[j]
+        record = {'ticker': ticker}
+        if n == 0:
+            records.append(record)
+            continue
+        values = equity[:n, j]
+        record.update(_curve_stats(values, values[_year_ends(years[order[:n, j]])], cash, riskfreerate))
+        record.update({k: v[j].item() for k, v in trade_counts.items()})
+        record['win_rate'], record['profit_factor'] = _trade_stats(
+            record['total_trades'], record['won'], record['gross_profit'], record['gross_loss'])
+        records.append(record)
+    per_ticker = pd.DataFrame(records).set_index('ticker')
+
+    # 各标的资金曲线放回共同的日期索引，缺失的 bar 沿用上一个值，第一根 bar 之前为初始资金
+    ticker_equity = np.full(equity.shape, np.nan)
+    rows, cols = np.nonzero(np.arange(len(index))[:, None] < n_valid[None, :])
+    ticker_equity[order[rows, cols], cols] = equity[rows, cols]
+    ticker_equity = pd.DataFrame(ticker_equity, index=index, columns=tickers).ffill().fillna(cash)
+    total = ticker_equity.sum(axis=1)
+    total.name = 'value'
+
+    aggregate = _curve_stats(total.to_numpy(), total.to_numpy()[_year_ends(years)], cash * len(tickers),
+                             riskfreerate)
+    for k in trade_counts:
+        aggregate[k] = per_ticker[k].sum().item()
+    aggregate['win_rate'], aggregate['profit_factor'] = _trade_stats(
+        aggregate['total_trades'], aggregate['won'], aggregate['gross_profit'], aggregate['gross_loss'])
+    result = {'per_ticker': per_ticker, 'aggregate': aggregate, 'equity': total}
+    if keep_equity:
+        result['ticker_equity'] = ticker_equity
+    return result
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import time
+
+    import backtrader as bt
+
+    import strategies
+    from benchmark import synthetic_ohlcv
+
+    n_tickers, n_bars, n_sample = 1000, 6000, 5
+    frames = {f"SYN{i:04d}": synthetic_ohlcv(n_bars, seed=i) for i in range(n_tickers)}
+    for name in RULES:
+        t0 = time.perf_counter()
+        result = batch_backtest(frames, name)
+        batch_time = time.perf_counter() - t0
+        # 逐个标的跑 Cerebro 太慢，只抽几个标的计时后按标的数外推
+        t0 = time.perf_counter()
+        for ticker in list(frames)[:n_sample]:
+            cerebro = bt.Cerebro(stdstats=False)
+            cerebro.adddata(bt.feeds.PandasData(dataname=frames[ticker]))
+            cerebro.broker.setcash(100000.0)
+            cerebro.broker.setcommission(commission=0.0001)
+            cerebro.addstrategy(getattr(strategies, name))
+            with contextlib.redirect_stdout(io.StringIO()):
+                cerebro.run()
+            assert math.isclose(cerebro.broker.getvalue(), result['per_ticker'].loc[ticker, 'final_value'])
+        cerebro_time = (time.perf_counter() - t0) / n_sample * n_tickers
+        agg = result['aggregate']
+        print(f"{name}: 批量 {batch_time:.2f} 秒, 逐个 Cerebro 约 {cerebro_time:.0f} 秒 "
+              f"({cerebro_time / batch_time:.0f}x) | 组合收益率 {agg['rtot'] * 100:.2f}%, "
+              f"交易 {agg['total_trades']}, 胜率 {agg['win_rate']:.2f}%, 盈亏比 {agg['profit_factor']:.2f}, "
+              f"最大回撤 {agg['max_drawdown']:.2f}%")
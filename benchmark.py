@@ -0,0 +1,319 @@
+# 回测性能基准测试
+# 对仓库里的每个策略 (SMA 双均线、SMA+ATR、BOLL、MACD、RSI、多标的相对动量) 测量：
+#   - 单次回测的 bars/sec，以及数据加载 / 指标初始化 / 事件循环三个阶段各自的耗时
+#   - 参数优化 (optstrategy / 向量化 / 多进程) 的总耗时和峰值内存 (RSS)
+#   - 扩展模式：1x / 10x / 100x 的 bar 数量，1 到 500 个标的
+# 数据使用仓库自带的 GC=F_historical_data.csv 和随机生成的 OHLCV 序列，不需要联网。
+# 结果写入 JSON 文件，方便不同提交之间对比。
+#
+# 用法示例：
+#   python benchmark.py                              # 单次回测 + 默认参数网格优化
+#   python benchmark.py --scale 1 10 100 --tickers 1 10 100 500
+#   python benchmark.py --no-sweep --strategies SMA RSI --output bench_results.json
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import time
+import traceback
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from data_cache import load_price_csv, read_yf_csv
+import strategies
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，峰值内存记为 None
+    resource = None
+
+DATA_FILE = "GC=F_historical_data.csv"
+
+
+def _import_script_strategies():
+    # SMA_Opt_Strategy.py / SMA_ATR_Strategy.py 在导入时会加载数据并打印信息，这里屏蔽输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        import SMA_ATR_Strategy
+        import SMA_Opt_Strategy
+    return SMA_Opt_Strategy.DualMovingAverage, SMA_ATR_Strategy.DualMovingAverage
+
+
+def strategy_specs():
+    # 策略名 -> (策略类, 参数, 佣金, 是否多标的)，参数和佣金与各脚本 / 笔记本一致
+    sma_cls, sma_atr_cls = _import_script_strategies()
+    return {
+        'SMA': (sma_cls, {'fast_length': 20, 'slow_length': 60}, 0.0001, False),
+        'SMA_ATR': (sma_atr_cls, {}, 0.0001, False),
+        'BOLL': (strategies.BOLL_Strategy, {}, 0.0006, False),
+        'MACD': (strategies.MACD_Strategy, {}, 0.0006, False),
+        'RSI': (strategies.RSI_Strategy, {}, 0.0006, False),
+        'Momentum': (strategies.RelativeMomentumStrategy, {'top_n': 1}, 0.0001, True),
+    }
+
+
+def synthetic_ohlcv(n_bars, seed=0, start_price=100.0, start='2000-01-03'):
+    # 几何随机游走生成的日线 OHLCV，列顺序与策略脚本中的 df 一致
+    # 以秒为时间单位，100x 长度 (几十万根日线) 也不会超出 datetime64[ns] 的范围
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0.0002, 0.012, n_bars)))
+    open_ = close * np.exp(rng.normal(0.0, 0.004, n_bars))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0.0, 0.006, n_bars)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0.0, 0.006, n_bars)))
+    volume = rng.integers(100, 10000, n_bars).astype(np.float64)
+    index = pd.bdate_range(start=start, periods=n_bars, unit='s', name='Date')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close,
+                         'Volume': volume, 'Adj Close': close}, index=index)
+
+
+def _timed_strategy(strategy_cls, marks):
+    # 动态生成一个子类，记录策略 __init__ (创建指标) 的开始和结束时间
+    class Timed(strategy_cls):
+        def __init__(self):
+            marks.setdefault('init_start', time.perf_counter())
+            super().__init__()
+            marks['init_end'] = time.perf_counter()
+
+    Timed.__name__ = strategy_cls.__name__
+    return Timed
+
+
+def bench_single(name, strategy_cls, frames, params, commission, cash=100000.0):
+    # 单次回测：frames 为 {标的名: DataFrame}；策略日志输出到 /dev/null，但打印本身的开销计入
+    marks = {}
+    cerebro = bt.Cerebro()
+    for ticker, df in frames.items():
+        cerebro.adddata(bt.feeds.PandasData(dataname=df, timeframe=bt.TimeFrame.Days), name=ticker)
+    cerebro.addstrategy(_timed_strategy(strategy_cls, marks), **params)
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+    cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown_analyzer")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        cerebro.run()
+        end = time.perf_counter()
+    n_bars = max(len(df) for df in frames.values())
+    total = end - start
+    # 阶段划分：run() 开始到策略 __init__ 之前是数据预加载，__init__ 是指标初始化，之后是事件循环
+    # (runonce 模式下指标的向量化计算发生在事件循环阶段)
+    data_load = marks['init_start'] - start
+    indicator_setup = marks['init_end'] - marks['init_start']
+    event_loop = end - marks['init_end']
+    return {
+        'kind': 'single',
+        'strategy': name,
+        'tickers': len(frames),
+        'bars': n_bars,
+        'wall_time': total,
+        'bars_per_sec': n_bars / total if total > 0 else None,
+        'phases': {'data_load': data_load, 'indicator_setup': indicator_setup, 'event_loop': event_loop},
+        'final_value': cerebro.broker.getvalue(),
+    }
+
+
+def _sweep_child(mode, df, fast, slow, results):
+    # 在子进程中运行参数优化，ru_maxrss 只反映这一次优化的峰值内存
+    # 出错时把异常信息放进队列，父进程据此报告失败而不是一直等待
+    try:
+        results.put(_run_sweep(mode, df, fast, slow))
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+
+
+def _run_sweep(mode, df, fast, slow):
+    sma_cls, _ = _import_script_strategies()
+    baseline_rss_mb = _maxrss_mb()
+    start = time.perf_counter()
+    if mode == 'vector':
+        from vector_sma import run_vector_grid
+        n_runs = len(run_vector_grid(df, fast, slow))
+    elif mode == 'process':
+        from opt_runner import iter_optimize, param_grid
+        n_runs = sum(1 for _ in iter_optimize(sma_cls, df, param_grid(fast_length=fast, slow_length=slow),
+                                              workers=None))
+    else:
+        cerebro = bt.Cerebro(maxcpus=1)
+        cerebro.adddata(bt.feeds.PandasData(dataname=df, timeframe=bt.TimeFrame.Days))
+        cerebro.broker.setcash(100000.0)
+        cerebro.broker.setcommission(commission=0.0001)
+        cerebro.optstrategy(sma_cls, fast_length=fast, slow_length=slow)
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+        cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            n_runs = len(cerebro.run())
+    wall_time = time.perf_counter() - start
+    # baseline 为子进程开始优化前的内存 (fork 继承的父进程页面)，workers 为多进程模式下子进程的峰值
+    return {'wall_time': wall_time, 'runs': n_runs,
+            'baseline_rss_mb': baseline_rss_mb,
+            'peak_rss_mb': _maxrss_mb(),
+            'workers_peak_rss_mb': _maxrss_mb(children=True)}
+
+
+def _maxrss_mb(children=False):
+    # Linux 下 ru_maxrss 的单位是 KB，macOS 下是字节；没有 resource 模块时返回 None
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def bench_sweep(mode, df, fast, slow, timeout=None, poll_interval=1.0):
+    # timeout 为整个优化允许的最长秒数 (None 表示不限)；子进程异常退出或超时都记为失败，不会一直等待
+    ctx = multiprocessing.get_context('fork' if sys.platform != 'win32' else 'spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_sweep_child, args=(mode, df, list(fast), list(slow), results))
+    proc.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=poll_interval)
+        except queue.Empty:
+            if not proc.is_alive():
+                # 子进程退出前写入的结果已经全部送达，再取一次仍为空说明它没来得及写就退出了
+                try:
+                    result = results.get_nowait()
+                except queue.Empty:
+                    result = {'error': f"子进程异常退出，退出码 {proc.exitcode}"}
+            elif deadline is not None and time.monotonic() > deadline:
+                proc.terminate()
+                result = {'error': f"超过 {timeout} 秒仍未完成，已终止子进程"}
+    proc.join()
+    record = {
+        'kind': 'sweep',
+        'strategy': 'SMA',
+        'mode': mode,
+        'bars': len(df),
+        'grid': {'fast_length': list(fast), 'slow_length': list(slow)},
+        **result,
+    }
+    if 'error' not in result:
+        record['runs_per_sec'] = result['runs'] / result['wall_time'] if result['wall_time'] > 0 else None
+    return record
+
+
+def bench_data_load():
+    # GC=F 数据的加载耗时：CSV 解析 vs 列式缓存内存映射
+    start = time.perf_counter()
+    read_yf_csv(DATA_FILE)
+    csv_time = time.perf_counter() - start
+    load_price_csv(DATA_FILE)  # 确保缓存已生成
+    start = time.perf_counter()
+    load_price_csv(DATA_FILE)
+    cache_time = time.perf_counter() - start
+    return {'kind': 'data_load', 'source': DATA_FILE, 'csv_parse': csv_time, 'cached_mmap': cache_time}
+
+
+def _parse_range(text):
+    # "10:31:5" -> range(10, 31, 5)
+    return range(*(int(x) for x in text.split(':')))
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'backtrader': bt.__version__,
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_suite(args):
+    specs = strategy_specs()
+    names = args.strategies or list(specs)
+    gold = load_price_csv(DATA_FILE)
+    results = [bench_data_load()]
+
+    for name in names:
+        strategy_cls, params, commission, multi = specs[name]
+        if multi:
+            # 多标的策略：随机生成 N 个标的，默认 7 个 (与笔记本中的股票池规模相同)
+            for n_tickers in args.tickers:
+                frames = {f'T{i:04d}': synthetic_ohlcv(args.bars, seed=i) for i in range(n_tickers)}
+                result = bench_single(name, strategy_cls, frames, params, commission)
+                result['data'] = 'synthetic'
+                results.append(result)
+                _report(result)
+            continue
+        result = bench_single(name, strategy_cls, {'GC=F': gold}, params, commission)
+        result['data'] = DATA_FILE
+        results.append(result)
+        _report(result)
+        for scale in args.scale:
+            frames = {'SYN': synthetic_ohlcv(args.bars * scale, seed=scale)}
+            result = bench_single(name, strategy_cls, frames, params, commission)
+            result['data'] = 'synthetic'
+            result['scale'] = scale
+            results.append(result)
+            _report(result)
+
+    if args.sweep:
+        for mode in args.sweep_modes:
+            result = bench_sweep(mode, gold, _parse_range(args.fast), _parse_range(args.slow),
+                                 timeout=args.sweep_timeout)
+            results.append(result)
+            _report(result)
+    return results
+
+
+def _report(result):
+    if result['kind'] == 'single':
+        phases = result['phases']
+        print(f"{result['strategy']:>9} | 标的 {result['tickers']:>4} | bars {result['bars']:>8} | "
+              f"耗时 {result['wall_time']:8.3f}s | {result['bars_per_sec']:>10.0f} bars/s | "
+              f"加载 {phases['data_load']:.3f}s 指标 {phases['indicator_setup']:.3f}s "
+              f"事件循环 {phases['event_loop']:.3f}s")
+    elif result['kind'] == 'sweep' and 'error' in result:
+        print(f"参数优化 [{result['mode']}] 失败: {result['error']}")
+    elif result['kind'] == 'sweep':
+        memory = "峰值内存未知 (没有 resource 模块)" if result['peak_rss_mb'] is None else (
+            f"峰值内存 {result['peak_rss_mb']:.1f} MB (起始 {result['baseline_rss_mb']:.1f} MB，"
+            f"子进程 {result['workers_peak_rss_mb']:.1f} MB)")
+        print(f"参数优化 [{result['mode']}] {result['runs']} 组参数 | 耗时 {result['wall_time']:.3f}s | {memory}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回测性能基准测试")
+    parser.add_argument('--strategies', nargs='*', help="只测试指定策略：SMA SMA_ATR BOLL MACD RSI Momentum")
+    parser.add_argument('--bars', type=int, default=6106, help="随机数据的基础 bar 数 (默认与 GC=F 数据相同)")
+    parser.add_argument('--scale', type=int, nargs='*', default=[1], help="随机数据长度的倍数，例如 1 10 100")
+    parser.add_argument('--tickers', type=int, nargs='*', default=[7], help="动量策略的标的数量，例如 1 10 100 500")
+    parser.add_argument('--no-sweep', dest='sweep', action='store_false', help="不测试参数优化")
+    parser.add_argument('--sweep-modes', nargs='*', default=['optstrategy', 'vector'],
+                        choices=['optstrategy', 'vector', 'process'])
+    parser.add_argument('--fast', default='10:31:5', help="fast_length 范围 start:stop:step")
+    parser.add_argument('--slow', default='50:200:10', help="slow_length 范围 start:stop:step")
+    parser.add_argument('--sweep-timeout', type=float, default=None, help="每种参数优化模式的最长秒数，超时记为失败")
+    parser.add_argument('--output', default='bench_results.json', help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': _environment(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"基准测试结果已保存到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
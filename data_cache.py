@@ -0,0 +1,104 @@
+# yfinance CSV 的二进制列式缓存
+# yf.download(...).to_csv() 生成的文件前三行是表头 (Price / Ticker / Date)，每次用
+# pd.read_csv(skiprows=3, parse_dates=True) 解析都要重新解析日期。这里第一次读取时把它转换成
+# 列式的 .npy 文件 (float64 的 OHLCV + int64 的纳秒时间戳)，之后直接内存映射读取：
+#   - 缓存目录以 源文件绝对路径的哈希 + 文件内容哈希 + 修改时间 作为键，源文件变化后自动失效，
+#     不同目录下的同名文件互不影响
+#   - np.load(mmap_mode='r') 只映射不拷贝，多个优化子进程共享同一份页缓存
+#   - 返回的 DataFrame 可以直接交给 bt.feeds.PandasData
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '.data_cache'
+# 与策略脚本中 df = df[['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']] 的列顺序一致
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']
+
+
+def file_key(path):
+    # 缓存键：文件内容的 sha256 前 16 位 + 修改时间 (纳秒)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return f"{digest.hexdigest()[:16]}-{os.stat(path).st_mtime_ns}"
+
+
+def read_yf_csv(path):
+    # 解析 yfinance 导出的三行表头 CSV，返回按 COLUMNS 排列的 DataFrame
+    with open(path) as f:
+        price_columns = f.readline().strip().split(',')[1:]
+    df = pd.read_csv(
+        path,
+        header=None,
+        skiprows=3,
+        names=['Date'] + price_columns,
+        index_col=0,
+        parse_dates=True
+    )
+    if 'Adj Close' not in df.columns:
+        df['Adj Close'] = df['Close']
+    return df[COLUMNS].astype(np.float64)
+
+
+def write_store(df, store_dir, meta=None):
+    # 把 DataFrame 写成列式存储：每列一个 .npy，日期存为 int64 纳秒时间戳；meta 中的额外字段一并写入 meta.json
+    # 先写到临时目录再重命名，多个进程同时转换时不会读到写了一半的文件
+    parent = os.path.dirname(store_dir) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        dates = pd.DatetimeIndex(df.index).as_unit('ns').asi8
+        np.save(os.path.join(tmp_dir, 'Date.npy'), dates.astype(np.int64))
+        for col in df.columns:
+            np.save(os.path.join(tmp_dir, f'{col}.npy'), df[col].to_numpy(dtype=np.float64))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'columns': list(df.columns), 'rows': len(df), **(meta or {})}, f)
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        # 另一个进程已经写好了同一个缓存
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(store_dir):
+            raise
+
+
+def read_meta(store_dir):
+    with open(os.path.join(store_dir, 'meta.json')) as f:
+        return json.load(f)
+
+
+def read_store(store_dir, mmap=True):
+    # 内存映射读取列式存储，重建 DataFrame 时不再解析日期
+    mode = 'r' if mmap else None
+    meta = read_meta(store_dir)
+    dates = np.load(os.path.join(store_dir, 'Date.npy'), mmap_mode=mode)
+    index = pd.DatetimeIndex(np.asarray(dates).view('datetime64[ns]'), name='Date')
+    columns = {col: np.load(os.path.join(store_dir, f'{col}.npy'), mmap_mode=mode)
+               for col in meta['columns']}
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def path_key(path):
+    # 源文件的身份：绝对路径 (解析符号链接后) 的 sha1 前 12 位
+    return hashlib.sha1(os.path.realpath(path).encode()).hexdigest()[:12]
+
+
+def load_price_csv(path, cache_dir=CACHE_DIR, mmap=True):
+    # 策略脚本的统一入口：命中缓存直接映射读取，否则解析 CSV 并写入缓存
+    # 目录名为 <文件名>-<路径哈希>-<内容哈希>-<修改时间>，文件名只是为了便于辨认
+    stem = os.path.splitext(os.path.basename(path))[0]
+    prefix = f"{stem}-{path_key(path)}-"
+    store_dir = os.path.join(cache_dir, prefix + file_key(path))
+    if not os.path.isdir(store_dir):
+        write_store(read_yf_csv(path), store_dir)
+        # 只清理同一个路径的旧版本缓存
+        for name in os.listdir(cache_dir):
+            old_dir = os.path.join(cache_dir, name)
+            if name.startswith(prefix) and old_dir != store_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+    return read_store(store_dir, mmap=mmap)
@@ -0,0 +1,257 @@
+# 参数优化共享的指标缓存
+# 优化时每个策略实例都会在 __init__ 里重新创建 bt.indicators.SMA / ATR 等指标，
+# 75 个参数组合反复计算的其实只是 5 条快线、15 条慢线和同一条 ATR。
+# 这里按 (数据指纹, 指标类型, 参数) 为键，把每条指标序列用 NumPy 只算一次，
+# 在内存预算内按 LRU 淘汰；策略通过 cached_indicator() 拿到一个"预计算指标"，
+# 用法与 backtrader 指标对象相同 (self.fast_ma[0]、self.boll.top[-1] ...)。
+# 各指标的计算方式与 backtrader 的实现保持一致 (SMA 预热、EMA/Wilder 平滑的递推公式等)。
+import hashlib
+import math
+from array import array
+from collections import OrderedDict
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+
+def data_fingerprint(df):
+    # 数据指纹：日期索引 + 价格列的字节内容做哈希
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    for col in ('Open', 'High', 'Low', 'Close', 'Volume'):
+        if col in df.columns:
+            digest.update(np.ascontiguousarray(df[col].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+# ----------------------------------------------------------------
+# NumPy 版本的指标计算，前 minperiod-1 个位置填充 NaN
+# ----------------------------------------------------------------
+def sma(values, period):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return out
+    first = valid[0]
+    x = values[first:]
+    if period <= len(x):
+        # 逐窗口求和而不是累计和相减，避免 BollingerBands 里平方均值相减时放大舍入误差
+        windows = np.lib.stride_tricks.sliding_window_view(x, period)
+        out[first + period - 1:] = windows.sum(axis=1) / period
+    return out
+
+
+def smoothing(values, period, alpha):
+    # backtrader 的 ExponentialSmoothing：先用前 period 个值的简单平均作为种子，再按
+    # prev * (1 - alpha) + x * alpha 递推
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0 or valid[0] + period > len(values):
+        return out
+    start = valid[0] + period - 1
+    prev = math.fsum(values[valid[0]:start + 1]) / period
+    out[start] = prev
+    alpha1 = 1.0 - alpha
+    for i in range(start + 1, len(values)):
+        out[i] = prev = prev * alpha1 + values[i] * alpha
+    return out
+
+
+def ema(values, period):
+    return smoothing(values, period, 2.0 / (1.0 + period))
+
+
+def smma(values, period):
+    # Wilder 平滑 (SmoothedMovingAverage)
+    return smoothing(values, period, 1.0 / period)
+
+
+def atr(high, low, close, period=14):
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+    true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+    true_range[0] = np.nan
+    return smma(true_range, period)
+
+
+def bollinger(close, period=20, devfactor=2.0):
+    mid = sma(close, period)
+    meansq = sma(close ** 2, period)
+    stddev = np.abs(meansq - mid ** 2) ** 0.5
+    return {'mid': mid, 'top': mid + devfactor * stddev, 'bot': mid - devfactor * stddev}
+
+
+def macd(close, period_me1=12, period_me2=26, period_signal=9):
+    line = ema(close, period_me1) - ema(close, period_me2)
+    signal = ema(line, period_signal)
+    return {'macd': line, 'signal': signal, 'histo': line - signal}
+
+
+def rsi_ema(close, period=14, lookback=1):
+    change = np.full(len(close), np.nan)
+    change[lookback:] = close[lookback:] - close[:-lookback]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        upday = np.where(np.isnan(change), np.nan, np.maximum(change, 0.0))
+        downday = np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0))
+        rs = ema(upday, period) / ema(downday, period)
+        return 100.0 - 100.0 / (1.0 + rs)
+
+
+def roc100(close, period=12):
+    out = np.full(len(close), np.nan)
+    out[period:] = 100.0 * ((close[period:] - close[:-period]) / close[:-period])
+    return out
+
+
+def _column(df, name):
+    return df[name].to_numpy(dtype=np.float64)
+
+
+def _sma_lines(df, period):
+    return {'sma': sma(_column(df, 'Close'), period)}
+
+
+def _atr_lines(df, period):
+    return {'atr': atr(_column(df, 'High'), _column(df, 'Low'), _column(df, 'Close'), period)}
+
+
+def _bollinger_lines(df, period, devfactor):
+    return bollinger(_column(df, 'Close'), period, devfactor)
+
+
+def _macd_lines(df, period_me1, period_me2, period_signal):
+    return macd(_column(df, 'Close'), period_me1, period_me2, period_signal)
+
+
+def _rsi_lines(df, period):
+    return {'rsi': rsi_ema(_column(df, 'Close'), period)}
+
+
+def _roc100_lines(df, period):
+    return {'roc100': roc100(_column(df, 'Close'), period)}
+
+
+# 指标类型 -> (计算函数, 默认参数, 线名称, 是否单独画子图)
+INDICATORS = {
+    'SMA': (_sma_lines, {'period': 30}, ('sma',), False),
+    'ATR': (_atr_lines, {'period': 14}, ('atr',), True),
+    'BollingerBands': (_bollinger_lines, {'period': 20, 'devfactor': 2.0}, ('mid', 'top', 'bot'), False),
+    'MACD': (_macd_lines, {'period_me1': 12, 'period_me2': 26, 'period_signal': 9},
+             ('macd', 'signal', 'histo'), True),
+    'RSI_EMA': (_rsi_lines, {'period': 14}, ('rsi',), True),
+    'ROC100': (_roc100_lines, {'period': 12}, ('roc100',), True),
+}
+
+
+class IndicatorCache:
+    # 以 (数据指纹, 指标类型, 参数) 为键的 LRU 缓存，max_bytes 为内存预算
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, df, name, fingerprint=None, **params):
+        # 返回 {线名称: 数组}；fingerprint 可以预先算好传入，省去重复哈希
+        func, defaults, _, _ = INDICATORS[name]
+        params = {**defaults, **params}
+        key = (fingerprint or data_fingerprint(df), name, tuple(sorted(params.items())))
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        lines = func(df, **params)
+        for values in lines.values():
+            values.setflags(write=False)
+        self._entries[key] = lines
+        self.nbytes += sum(v.nbytes for v in lines.values())
+        # 超出预算时淘汰最久未使用的条目 (刚放入的条目保留)
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes -= sum(v.nbytes for v in old.values())
+        return lines
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+# 进程内共享的默认缓存，同一个优化子进程里的所有策略实例都会命中它
+default_cache = IndicatorCache()
+
+
+class PrecomputedIndicator(bt.Indicator):
+    # 把预先算好的数组作为指标的 line，按 bar 位置直接取值
+    params = (('values', None), ('minperiod', 1))
+
+    def __init__(self):
+        self.addminperiod(self.p.minperiod)
+
+    def next(self):
+        i = len(self.data) - 1
+        for line, values in zip(self.lines, self.p.values):
+            line[0] = values[i]
+
+    def once(self, start, end):
+        for line, values in zip(self.lines, self.p.values):
+            line.array[start:end] = array('d', values[start:end].tolist())
+
+
+_indicator_classes = {}
+
+
+def _indicator_class(name):
+    # 每种指标类型动态生成一个带有对应线名称的子类，与 backtrader 指标的属性名一致
+    # 类注册为本模块的属性：cerebro.optstrategy 多进程运行时，子进程返回的结果需要按名称 pickle
+    if name not in _indicator_classes:
+        _, _, lines, subplot = INDICATORS[name]
+        cls = type(f'Cached{name}', (PrecomputedIndicator,),
+                   {'lines': lines, 'plotinfo': dict(subplot=subplot), '__module__': __name__})
+        globals()[cls.__name__] = _indicator_classes[name] = cls
+    return _indicator_classes[name]
+
+
+# 导入时就生成全部子类，主进程反序列化子进程的结果时才能找到
+for _name in INDICATORS:
+    _indicator_class(_name)
+
+
+def _feed_frame(data):
+    # 预计算指标按 bar 序号取值，所以数组必须与数据源实际送出的 bar 一一对应：
+    # 只支持以日期为索引的 PandasData，按 fromdate / todate 截取与 PandasData 相同的区间；
+    # 加了过滤器 (resampledata / replaydata 等) 的数据源会改变 bar 序列，直接报错
+    if not isinstance(data, bt.feeds.PandasData):
+        raise TypeError(f"cached_indicator 只支持 bt.feeds.PandasData，收到 {type(data).__name__}；"
+                        f"请改用 bt.indicators 中的原生指标")
+    if data.p.datetime is not None or data._filters:
+        raise ValueError("cached_indicator 只支持以日期为索引、没有过滤器 (resample / replay) 的 PandasData")
+    df = data.p.dataname
+    keep = np.ones(len(df), dtype=bool)
+    if data.p.fromdate is not None:
+        keep &= df.index >= pd.Timestamp(data.p.fromdate)
+    if data.p.todate is not None:
+        keep &= df.index <= pd.Timestamp(data.p.todate)
+    return df if keep.all() else df[keep]
+
+
+def cached_indicator(data, name, cache=None, **params):
+    # 在策略的 __init__ 中替代 bt.indicators.XXX(...)：
+    #   self.fast_ma = cached_indicator(self.datas[0], 'SMA', period=self.p.fast_length)
+    # data 必须是 bt.feeds.PandasData，原始 DataFrame 通过 data.p.dataname 取得 (按 fromdate / todate 截取)
+    cache = cache or default_cache
+    df = getattr(data, '_indicator_frame', None)
+    if df is None:
+        df = data._indicator_frame = _feed_frame(data)
+        data._indicator_fingerprint = data_fingerprint(df)
+    fingerprint = data._indicator_fingerprint
+    lines = cache.get(df, name, fingerprint=fingerprint, **params)
+    _, _, line_names, _ = INDICATORS[name]
+    values = [lines[line] for line in line_names]
+    # minperiod 取第一个非 NaN 的位置，与 backtrader 指标的预热长度一致
+    valid = [np.flatnonzero(~np.isnan(v)) for v in values]
+    minperiod = max((v[0] + 1 if len(v) else len(df)) for v in valid)
+    return _indicator_class(name)(data, values=values, minperiod=minperiod)
@@ -0,0 +1,479 @@
+# 增量 (逐 bar) 信号引擎
+# 每天收盘后的信号任务只想知道"今天"的信号，但用 Cerebro 就要把 25 年的 bar 全部重放一遍。
+# 这里把 DualMovingAverage (ATR 移动止损)、BOLL、MACD、RSI 四个策略的指标和交易状态写成可以
+# 逐 bar 更新的小对象：
+#   - SMA：最近 period 个值的环形缓冲 + 窗口和的精确分量 (Shewchuk 算法)，
+#     math.fsum 对精确和做一次舍入，与 backtrader 每根 bar 做 math.fsum(窗口) 的结果逐位相同
+#   - EMA / SMMA (Wilder ATR)：只保存上一个值，预热阶段与 backtrader 一样用前 period 个值的均值做种子
+#   - 布林带：收盘价和收盘价平方两个 SMA，按 backtrader 的 sqrt(|E[x²] - E[x]²|) 计算标准差
+#   - 持仓、现金、挂单、stop_price 等策略变量，成交规则与 backtrader 的默认 broker 一致
+#     (下一根 bar 开盘价成交，下单时和成交时各检查一次现金)
+# 一次运行结束时可以把全部状态保存成一个小 JSON，新 bar 到来时从快照恢复，每根 bar 只做 O(1) 的计算。
+# 信号和状态与从头重放逐位相同 (float 在 JSON 中按 repr 精确往返)。
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+NAN = float('nan')
+STATE_DIR = '.live_state'
+
+
+def _grow(partials, x):
+    # Shewchuk 精确求和：把 x 加入互不重叠的分量列表，分量之和严格等于所有加入值之和
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+class _Stateful:
+    # 状态就是实例属性；嵌套的指标对象递归处理，其余属性必须是 JSON 可以表示的值
+    def state(self):
+        return {k: (v.state() if isinstance(v, _Stateful) else v) for k, v in vars(self).items()}
+
+    def restore(self, state):
+        for k, v in state.items():
+            current = getattr(self, k, None)
+            if isinstance(current, _Stateful):
+                current.restore(v)
+            else:
+                setattr(self, k, v)
+
+
+class LiveSMA(_Stateful):
+    def __init__(self, period):
+        self.period = period
+        self.window = []
+        self.pos = 0
+        self.partials = []
+        self.value = NAN
+
+    def update(self, x):
+        _grow(self.partials, x)
+        if len(self.window) < self.period:
+            self.window.append(x)
+        else:
+            _grow(self.partials, -self.window[self.pos])
+            self.window[self.pos] = x
+            self.pos = (self.pos + 1) % self.period
+        if len(self.window) == self.period:
+            self.value = math.fsum(self.partials) / self.period
+        return self.value
+
+
+class LiveEMA(_Stateful):
+    # ExponentialSmoothing：alpha 默认为 EMA 的 2 / (1 + period)，SMMA 传入 1 / period
+    def __init__(self, period, alpha=None):
+        self.period = period
+        self.alpha = 2.0 / (1.0 + period) if alpha is None else alpha
+        self.alpha1 = 1.0 - self.alpha
+        self.seed = []
+        self.value = NAN
+
+    def update(self, x):
+        if self.seed is not None:
+            self.seed.append(x)
+            if len(self.seed) == self.period:
+                self.value = math.fsum(self.seed) / self.period
+                self.seed = None
+        else:
+            self.value = self.value * self.alpha1 + x * self.alpha
+        return self.value
+
+
+class LiveATR(_Stateful):
+    # TR = max(high, 前收) - min(low, 前收)，ATR 为 TR 的 SMMA
+    def __init__(self, period):
+        self.smma = LiveEMA(period, alpha=1.0 / period)
+        self.prev_close = None
+        self.value = NAN
+
+    def update(self, high, low, close):
+        if self.prev_close is not None:
+            tr = max(high, self.prev_close) - min(low, self.prev_close)
+            self.value = self.smma.update(tr)
+        self.prev_close = close
+        return self.value
+
+
+class LiveBollinger(_Stateful):
+    def __init__(self, period, devfactor):
+        self.devfactor = devfactor
+        self.mean = LiveSMA(period)
+        self.meansq = LiveSMA(period)
+        self.mid = self.top = self.bot = NAN
+
+    def update(self, x):
+        mid = self.mean.update(x)
+        meansq = self.meansq.update(x ** 2)
+        if not math.isnan(mid):
+            stddev = self.devfactor * abs(meansq - mid ** 2) ** 0.5
+            self.mid, self.top, self.bot = mid, mid + stddev, mid - stddev
+        return self.mid
+
+
+class LiveMACD(_Stateful):
+    def __init__(self, period_me1, period_me2, period_signal):
+        self.me1 = LiveEMA(period_me1)
+        self.me2 = LiveEMA(period_me2)
+        self.signal_ema = LiveEMA(period_signal)
+        self.macd = self.signal = NAN
+
+    def update(self, x):
+        me1, me2 = self.me1.update(x), self.me2.update(x)
+        if not (math.isnan(me1) or math.isnan(me2)):
+            self.macd = me1 - me2
+            self.signal = self.signal_ema.update(self.macd)
+        return self.macd
+
+
+class LiveRSI(_Stateful):
+    # RSI_EMA：上涨幅度和下跌幅度分别做 EMA
+    def __init__(self, period):
+        self.up = LiveEMA(period)
+        self.down = LiveEMA(period)
+        self.prev_close = None
+        self.value = NAN
+
+    def update(self, x):
+        if self.prev_close is not None:
+            maup = self.up.update(max(x - self.prev_close, 0.0))
+            madown = self.down.update(max(self.prev_close - x, 0.0))
+            if not math.isnan(maup):
+                if madown:
+                    rs = maup / madown
+                else:
+                    rs = math.inf if maup else NAN
+                self.value = 100.0 - 100.0 / (1.0 + rs)
+        self.prev_close = x
+        return self.value
+
+
+class LiveStrategy(_Stateful):
+    # 逐 bar 的策略 + 默认 broker。子类实现 update_indicators / minperiod / next，
+    # 可选 notify_fill (对应 backtrader 的 notify_order 中订单完成的分支)
+    name = None
+    params = {}
+
+    def __init__(self, cash=100000.0, commission=0.0001, **params):
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"{self.name} 没有参数 {sorted(unknown)}")
+        self.p = dict(self.params, **params)
+        self.cash = cash
+        self.commission = commission
+        self.bars = 0
+        self.last_date = None
+        self.position = 0
+        self.position_price = 0.0
+        self.entry_comm = 0.0
+        self.pending = []  # 挂单：{'size', 'created_price', 'created_date'}，下一根 bar 开盘成交
+        self.order = None  # 与原策略的 self.order 一致：有未完成订单时为 True
+        self.close_price = NAN
+        self.events = []
+
+    # ----- broker -----
+    def _buy(self, size):
+        self.pending.append({'size': size, 'created_price': self.close_price, 'created_date': self.last_date})
+        return True
+
+    def _close(self):
+        if self.position:
+            self.pending.append({'size': -self.position, 'created_price': self.close_price,
+                                 'created_date': self.last_date})
+            return True
+        return None
+
+    def _opened_cash(self, cash, size, price):
+        # 开仓后剩余现金，运算顺序与 BackBroker._execute 相同
+        cash -= abs(size) * price
+        cash -= abs(size) * self.commission * price
+        return cash
+
+    def _execute(self, date, open_):
+        # 对应 BackBroker.next：先按下单时的收盘价预执行检查现金，再按开盘价真正成交
+        orders, self.pending = self.pending, []
+        for order in orders:
+            size = order['size']
+            if size > 0 and (self._opened_cash(self.cash, size, order['created_price']) < 0.0
+                             or self._opened_cash(self.cash, size, open_) < 0.0):
+                self._event(date, 'margin', size=size)
+                self.order = None
+                continue
+            comm = abs(size) * self.commission * open_
+            if size > 0:
+                self.cash = self._opened_cash(self.cash, size, open_)
+                self.position, self.position_price, self.entry_comm = size, open_, comm
+                self._event(date, 'buy', price=open_, size=size, comm=comm)
+            else:
+                closed = -size
+                pnl = closed * (open_ - self.position_price)
+                self.cash += abs(closed) * self.position_price + pnl
+                self.cash -= comm
+                self.position = 0
+                self._event(date, 'sell', price=open_, size=size, comm=comm)
+                self._event(date, 'trade', pnl=pnl, pnlcomm=pnl - self.entry_comm - comm)
+            self.notify_fill(size, open_)
+            self.order = None
+
+    def _event(self, date, kind, **fields):
+        self.events.append(dict(date=date, type=kind, **fields))
+
+    @property
+    def value(self):
+        return self.cash + self.position * self.close_price
+
+    # ----- 逐 bar 入口 -----
+    def on_bar(self, date, open_, high, low, close):
+        # 处理一根新 bar，返回这根 bar 上产生的事件列表
+        self.events = []
+        self.bars += 1
+        self.close_price = close
+        self.update_indicators(high, low, close)
+        self._execute(date, open_)
+        self.last_date = date
+        if self.bars >= self.minperiod():
+            self.next(date, close)
+        self.after_next()
+        return self.events
+
+    def notify_fill(self, size, price):
+        pass
+
+    def after_next(self):
+        # 保存本根 bar 的指标值，供下一根 bar 作为 [-1] 使用
+        pass
+
+
+class LiveDualMovingAverage(LiveStrategy):
+    # SMA_ATR_Strategy.py 的 DualMovingAverage
+    name = 'DualMovingAverage'
+    params = {'fast_length': 25, 'slow_length': 200, 'atr_period': 14, 'atr_multiple': 2.0, 'size': 10}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.fast_ma = LiveSMA(self.p['fast_length'])
+        self.slow_ma = LiveSMA(self.p['slow_length'])
+        self.atr = LiveATR(self.p['atr_period'])
+        self.prev_fast = self.prev_slow = NAN
+        self.stop_price = None
+
+    def minperiod(self):
+        return max(self.p['fast_length'], self.p['slow_length'], self.p['atr_period'] + 1)
+
+    def update_indicators(self, high, low, close):
+        self.fast_ma.update(close)
+        self.slow_ma.update(close)
+        self.atr.update(high, low, close)
+
+    def notify_fill(self, size, price):
+        if size > 0:
+            # 买入后立即设置初始止损价
+            self.stop_price = price - (self.atr.value) * self.p['atr_multiple']
+
+    def next(self, date, close):
+        if self.order:
+            return
+        fast, slow = self.fast_ma.value, self.slow_ma.value
+        if self.position:
+            if self.stop_price is not None and close < self.stop_price:
+                self._event(date, 'stop_signal', close=close, stop_price=self.stop_price)
+                self._close()
+                self.stop_price = None
+                return
+            new_stop_price = close - (self.atr.value * self.p['atr_multiple'])
+            if self.stop_price is None or new_stop_price > self.stop_price:
+                self.stop_price = new_stop_price
+            if fast < slow and self.prev_fast > self.prev_slow:
+                self._event(date, 'sell_signal', close=close, fast=fast, slow=slow)
+                self._close()
+                self.stop_price = None
+        else:
+            if fast > slow and self.prev_fast < self.prev_slow:
+                self.order = self._buy(self.p['size'])
+                self._event(date, 'buy_signal', close=close, fast=fast, slow=slow)
+
+    def after_next(self):
+        self.prev_fast, self.prev_slow = self.fast_ma.value, self.slow_ma.value
+
+
+class LiveBOLL(LiveStrategy):
+    # strategies.BOLL_Strategy
+    name = 'BOLL_Strategy'
+    params = {'boll_period': 20, 'boll_devfactor': 2.0, 'size': 10}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.boll = LiveBollinger(self.p['boll_period'], self.p['boll_devfactor'])
+        self.prev_close = self.prev_top = self.prev_bot = NAN
+
+    def minperiod(self):
+        return self.p['boll_period']
+
+    def update_indicators(self, high, low, close):
+        self.boll.update(close)
+
+    def next(self, date, close):
+        boll = self.boll
+        if not self.position:
+            if close <= boll.bot and self.prev_close >= self.prev_bot:
+                self.order = self._buy(self.p['size'])
+                self._event(date, 'buy_signal', close=close, bot=boll.bot, mid=boll.mid)
+        else:
+            if close >= boll.top and self.prev_close <= self.prev_top:
+                self.order = self._close()
+                self._event(date, 'sell_signal', close=close, top=boll.top, mid=boll.mid)
+
+    def after_next(self):
+        self.prev_close, self.prev_top, self.prev_bot = self.close_price, self.boll.top, self.boll.bot
+
+
+class LiveMACDStrategy(LiveStrategy):
+    # strategies.MACD_Strategy
+    name = 'MACD_Strategy'
+    params = {'macd_fast': 14, 'macd_slow': 26, 'macd_signal': 9, 'size': 10}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.macd = LiveMACD(self.p['macd_fast'], self.p['macd_slow'], self.p['macd_signal'])
+        self.prev_macd = self.prev_signal = NAN
+
+    def minperiod(self):
+        return max(self.p['macd_fast'], self.p['macd_slow']) + self.p['macd_signal'] - 1
+
+    def update_indicators(self, high, low, close):
+        self.macd.update(close)
+
+    def next(self, date, close):
+        macd, signal = self.macd.macd, self.macd.signal
+        if not self.position:
+            if macd > signal and self.prev_macd < self.prev_signal:
+                self.order = self._buy(self.p['size'])
+                self._event(date, 'buy_signal', close=close, macd=macd, signal=signal)
+        else:
+            if macd < signal and self.prev_macd > self.prev_signal:
+                self.order = self._close()
+                self._event(date, 'sell_signal', close=close, macd=macd, signal=signal)
+
+    def after_next(self):
+        self.prev_macd, self.prev_signal = self.macd.macd, self.macd.signal
+
+
+class LiveRSIStrategy(LiveStrategy):
+    # strategies.RSI_Strategy
+    name = 'RSI_Strategy'
+    params = {'rsi_period': 14, 'oversold': 30, 'overbought': 70, 'size': 10}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rsi = LiveRSI(self.p['rsi_period'])
+
+    def minperiod(self):
+        return self.p['rsi_period'] + 1
+
+    def update_indicators(self, high, low, close):
+        self.rsi.update(close)
+
+    def next(self, date, close):
+        rsi = self.rsi.value
+        if not self.position:
+            if rsi < self.p['oversold']:
+                self.order = self._buy(self.p['size'])
+                self._event(date, 'buy_signal', close=close, rsi=rsi)
+        else:
+            if rsi > self.p['overbought']:
+                self.order = self._close()
+                self._event(date, 'sell_signal', close=close, rsi=rsi)
+
+
+# 按 backtrader 策略类名查找对应的增量实现
+LIVE_STRATEGIES = {cls.name: cls for cls in (LiveDualMovingAverage, LiveBOLL, LiveMACDStrategy, LiveRSIStrategy)}
+
+
+def _bars(df):
+    dates = pd.DatetimeIndex(df.index).strftime('%Y-%m-%d').tolist()
+    columns = [df[c].to_numpy(dtype=np.float64).tolist() for c in ('Open', 'High', 'Low', 'Close')]
+    return zip(dates, *columns)
+
+
+def run_bars(strategy, df):
+    # 把 df 中的 bar 依次交给策略，返回全部事件
+    events = []
+    for bar in _bars(df):
+        events.extend(strategy.on_bar(*bar))
+    return events
+
+
+def snapshot(strategy):
+    return {'strategy': strategy.name, 'params': strategy.p, 'state': strategy.state()}
+
+
+def from_snapshot(snap):
+    strategy = LIVE_STRATEGIES[snap['strategy']](**snap['params'])
+    strategy.restore(snap['state'])
+    return strategy
+
+
+def save_snapshot(strategy, path):
+    # 先写临时文件再替换，任务中途被杀掉也不会留下半个快照
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot(strategy), f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    with open(path) as f:
+        return from_snapshot(json.load(f))
+
+
+def resume(strategy, df):
+    # 只处理 df 中晚于快照最后一根 bar 的新 bar，返回这些 bar 上的事件
+    if strategy.last_date is not None:
+        df = df[df.index > pd.Timestamp(strategy.last_date)]
+    return run_bars(strategy, df)
+
+
+def state_path_for(strategy):
+    # 默认快照路径：策略名 + 参数摘要，不同参数的任务各自保存状态，不会互相覆盖
+    digest = hashlib.sha1(json.dumps(strategy.p, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(STATE_DIR, f"{strategy.name}-{digest}.json")
+
+
+def daily_signals(df, strategy_name, state_path=None, **params):
+    # 每日信号任务的入口：有快照就增量更新，没有就从头跑一遍并保存快照
+    strategy = LIVE_STRATEGIES[strategy_name](**params)
+    state_path = state_path or state_path_for(strategy)
+    if os.path.exists(state_path):
+        saved = load_snapshot(state_path)
+        if saved.name != strategy.name or saved.p != strategy.p:
+            raise ValueError(f"快照 {state_path} 的策略参数 {saved.name} {saved.p} "
+                             f"与本次请求的 {strategy.name} {strategy.p} 不一致")
+        strategy = saved
+        events = resume(strategy, df)
+    else:
+        events = run_bars(strategy, df)
+    save_snapshot(strategy, state_path)
+    return strategy, events
+
+if __name__ == '__main__':
+    from data_cache import load_price_csv
+
+    df = load_price_csv("GC=F_historical_data.csv")
+    for name in LIVE_STRATEGIES:
+        strategy, events = daily_signals(df, name)
+        today = [e for e in events if e['date'] == strategy.last_date]
+        print(f"{name}: 最后一根 bar {strategy.last_date}, 持仓 {strategy.position}, "
+              f"账户总值 {strategy.value:.2f}, 今日事件 {today or '无'}")
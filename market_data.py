@@ -0,0 +1,327 @@
+# 并发、增量缓存的行情下载
+# download_data.ipynb 和 Momentum_Strategy.ipynb 里逐个调用 yf.Ticker(...).history() / yf.download()，
+# 动量组合的 7 只股票要串行请求 7 次，而且每次运行都重新下载全部历史。这里：
+#   - 下载器可替换：生产环境用 YFinanceFetcher，离线测试用 FixtureFetcher (内存中的 DataFrame 或 CSV 目录)
+#   - 用 asyncio 并发请求多个代码，Semaphore 限制同时进行的请求数，RateLimiter 限制每秒请求数
+#   - 每个代码在本地有一份列式存储 (复用 data_cache 的 .npy 格式)，只下载缺失的日期区间并追加，
+#     刷新 500 只股票的组合时每只只需一次增量请求；meta.json 记录已经请求过的最早日期，
+#     上市晚于请求起点的代码不会在每次刷新时重复回补开头
+#   - 复权数据 (auto_adjust=True) 在拆股 / 分红后整段历史都会按新基准重算，只追加新行会拼出假的暴跌；
+#     增量请求会重新下载倒数第二根 bar 做对照，价格不一致或新行里有 Stock Splits / Dividends 时
+#     重新下载整个已请求区间并整体替换
+#   - 输出统一成策略使用的 OHLCV 列 (去掉 Dividends / Stock Splits / Repaired? 等列)
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_cache import COLUMNS, read_meta, read_store, read_yf_csv, write_store
+
+STORE_DIR = '.market_data'
+# yfinance 附带的、策略不需要的列
+EXTRA_COLUMNS = ['Dividends', 'Stock Splits', 'Repaired?', 'Capital Gains']
+# 出现非零值说明复权基准变了
+CORPORATE_ACTION_COLUMNS = ['Stock Splits', 'Dividends']
+# 对照 bar 的价格相对误差超过它就认为复权基准变了
+REBASE_RTOL = 1e-6
+
+
+def normalize_ohlcv(df):
+    # 统一成 COLUMNS 的列顺序：去掉多余列，展平 yf.download 的两层列名，
+    # 去掉时区 (只保留日期)，按日期排序并去重
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df.drop(columns=[c for c in EXTRA_COLUMNS if c in df.columns])
+    if 'Adj Close' not in df.columns:
+        df['Adj Close'] = df['Close']
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df.index = index.normalize().as_unit('ns')
+    df.index.name = 'Date'
+    df = df[COLUMNS].astype(np.float64)
+    df = df[~df.index.duplicated(keep='last')]
+    return df.sort_index()
+
+
+def write_yf_csv(df, path, ticker):
+    # 按 yf.download(...).to_csv() 的三行表头格式保存，data_cache.load_price_csv 可以直接读取
+    columns = [c for c in COLUMNS if c != 'Adj Close']
+    with open(path, 'w') as f:
+        f.write(','.join(['Price'] + columns) + '\n')
+        f.write(','.join(['Ticker'] + [ticker] * len(columns)) + '\n')
+        f.write('Date' + ',' * len(columns) + '\n')
+        df[columns].to_csv(f, header=False, date_format='%Y-%m-%d')
+
+
+class YFinanceFetcher:
+    # 生产环境的下载器：与 Momentum_Strategy.ipynb 相同的 history(auto_adjust=True, repair=True)
+    def __init__(self, auto_adjust=True, repair=True):
+        self.auto_adjust = auto_adjust
+        self.repair = repair
+
+    def fetch(self, ticker, start, end):
+        # 区间为 [start, end)，与 yfinance 的 end 不包含在内一致
+        import yfinance as yf
+
+        return yf.Ticker(ticker).history(start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'),
+                                         auto_adjust=self.auto_adjust, repair=self.repair)
+
+
+class FixtureFetcher:
+    # 离线测试用的下载器：从给定的 {代码: DataFrame} 中按日期区间切片返回，
+    # 可以模拟网络延迟，并记录每次请求 (代码, 起始, 结束) 以便检查增量下载是否只请求了缺失区间
+    def __init__(self, frames, latency=0.0):
+        self.frames = frames
+        self.latency = latency
+        self.calls = []
+
+    @classmethod
+    def from_csv_dir(cls, path, latency=0.0):
+        # 目录中的每个 yfinance CSV (例如 GC=F_historical_data.csv) 作为一个代码
+        frames = {}
+        for name in sorted(os.listdir(path)):
+            if name.endswith('_historical_data.csv'):
+                frames[name[:-len('_historical_data.csv')]] = read_yf_csv(os.path.join(path, name))
+        return cls(frames, latency=latency)
+
+    def fetch(self, ticker, start, end):
+        self.calls.append((ticker, start, end))
+        if self.latency:
+            time.sleep(self.latency)
+        if ticker not in self.frames:
+            raise KeyError(f"没有 {ticker} 的数据")
+        df = self.frames[ticker]
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return df[(index >= start) & (index < end)]
+
+
+class RateLimiter:
+    # 令牌间隔限速：任意两次请求的开始时间至少相隔 1 / rate 秒
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_time = max(now, self.next_time) + self.interval
+
+
+def _safe_name(ticker):
+    # 代码作为目录名：^GSPC 之类的特殊字符替换成下划线
+    return re.sub(r'[^A-Za-z0-9=._-]', '_', ticker)
+
+
+class MarketDataStore:
+    def __init__(self, root=STORE_DIR, fetcher=None, max_concurrency=8, requests_per_second=4.0,
+                 retries=2, retry_delay=1.0):
+        self.root = root
+        self.fetcher = fetcher or YFinanceFetcher()
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def store_dir(self, ticker):
+        return os.path.join(self.root, _safe_name(ticker))
+
+    def stored(self, ticker):
+        # 本地已有的数据，没有时返回 None
+        store_dir = self.store_dir(ticker)
+        if not os.path.isdir(store_dir):
+            return None
+        return read_store(store_dir, mmap=False)
+
+    def coverage_start(self, ticker):
+        # 已经请求过的最早日期 (meta.json 的 coverage_start)，没有记录时返回 None
+        store_dir = self.store_dir(ticker)
+        if not os.path.isdir(store_dir):
+            return None
+        coverage = read_meta(store_dir).get('coverage_start')
+        return None if coverage is None else pd.Timestamp(coverage)
+
+    def load(self, ticker, start=None, end=None):
+        # 读取本地数据，区间为 [start, end)
+        df = self.stored(ticker)
+        if df is None:
+            raise KeyError(f"本地没有 {ticker} 的数据，请先调用 refresh")
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return df
+
+    def load_many(self, tickers, start=None, end=None):
+        return {ticker: self.load(ticker, start, end) for ticker in tickers}
+
+    def missing_ranges(self, ticker, start, end, df=None, coverage=None):
+        # 需要下载的区间列表。已有数据时只补已请求区间之前和最后一根 bar 之后的部分；
+        # 最后一根 bar 会重新下载一次，避免保存的是盘中未收盘的数据；倒数第二根 bar 也一起下载，
+        # 它已经收盘，用来对照复权基准 (见 _rebased)
+        if df is None:
+            df = self.stored(ticker)
+        if df is None or len(df) == 0:
+            return [(start, end)]
+        if coverage is None:
+            coverage = self.coverage_start(ticker)
+        first, last = df.index[0], df.index[-1]
+        # 旧版本的存储没有 coverage_start，退回到第一根 bar 的日期
+        covered = first if coverage is None else min(coverage, first)
+        ranges = []
+        if start < covered:
+            ranges.append((start, covered))
+        if last + pd.Timedelta(days=1) < end:
+            anchor = df.index[-2] if len(df) > 1 else last
+            ranges.append((max(anchor, start), end))
+        return ranges
+
+    def _rebased(self, old, new):
+        # 新下载的数据 (normalize 之前，还带着 Stock Splits / Dividends 列) 与本地数据是否处于不同的复权基准：
+        #   - 本地最后一根 bar 之后出现拆股或分红，之前的价格都会被重新调整
+        #   - 对照 bar (本地倒数第二根，已经收盘) 重新下载后的价格与本地不一致
+        raw_index = pd.DatetimeIndex(new.index)
+        if raw_index.tz is not None:
+            raw_index = raw_index.tz_localize(None)
+        later = raw_index.normalize() > old.index[-1]
+        for col in CORPORATE_ACTION_COLUMNS:
+            if col in new.columns and (np.nan_to_num(new[col].to_numpy(dtype=np.float64))[later] != 0).any():
+                return True
+        fetched = normalize_ohlcv(new)
+        anchor = old.index[-2] if len(old) > 1 else old.index[-1]
+        if anchor not in fetched.index:
+            return False
+        fetched = fetched.loc[anchor, ['Open', 'High', 'Low', 'Close']].to_numpy()
+        stored = old.loc[anchor, ['Open', 'High', 'Low', 'Close']].to_numpy()
+        return not np.allclose(fetched, stored, rtol=REBASE_RTOL, atol=0.0, equal_nan=True)
+
+    def _write_coverage(self, ticker, coverage):
+        # 只更新 meta.json 的 coverage_start，先写临时文件再替换
+        store_dir = self.store_dir(ticker)
+        meta = dict(read_meta(store_dir), coverage_start=coverage.strftime('%Y-%m-%d'))
+        tmp_path = os.path.join(store_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(store_dir, 'meta.json'))
+
+    def _append(self, ticker, new, old=None, coverage=None):
+        # 把新数据合并进本地存储：同一日期以新下载的为准，整体写到新目录后替换旧目录；
+        # coverage 为合并后已经请求过的最早日期，写入 meta.json
+        df = normalize_ohlcv(new) if old is None else normalize_ohlcv(pd.concat([old, normalize_ohlcv(new)]))
+        if old is not None and df.index.equals(old.index) and np.array_equal(df.to_numpy(), old.to_numpy(),
+                                                                             equal_nan=True):
+            # 只重新下载了最后一根 bar 或回补的区间里没有数据，不必重写，只更新已请求的区间
+            if coverage is not None and coverage != self.coverage_start(ticker):
+                self._write_coverage(ticker, coverage)
+            return 0
+        store_dir = self.store_dir(ticker)
+        new_dir, old_dir = store_dir + '.new', store_dir + '.old'
+        shutil.rmtree(new_dir, ignore_errors=True)
+        meta = None if coverage is None else {'coverage_start': coverage.strftime('%Y-%m-%d')}
+        write_store(df, new_dir, meta=meta)
+        if os.path.isdir(store_dir):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.rename(store_dir, old_dir)
+        os.rename(new_dir, store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return len(df) - (0 if old is None else len(old))
+
+    async def _fetch_range(self, ticker, start, end, semaphore, limiter):
+        for attempt in range(self.retries + 1):
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    return await asyncio.to_thread(self.fetcher.fetch, ticker, start, end)
+                except KeyError:
+                    raise
+                except Exception:
+                    if attempt == self.retries:
+                        raise
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _refresh_one(self, ticker, start, end, semaphore, limiter):
+        old = await asyncio.to_thread(self.stored, ticker)
+        coverage = await asyncio.to_thread(self.coverage_start, ticker)
+        ranges = self.missing_ranges(ticker, start, end, old, coverage)
+        frames = [await self._fetch_range(ticker, s, e, semaphore, limiter) for s, e in ranges]
+        frames = [f for f in frames if f is not None and len(f)]
+        if old is not None and len(old):
+            coverage = min(start, old.index[0] if coverage is None else coverage)
+        else:
+            coverage = start
+        if old is not None and len(old) and frames and self._rebased(old, frames[-1]):
+            # 复权基准变了：本地数据整体作废，重新下载整个已请求区间后替换
+            full = await self._fetch_range(ticker, coverage, end, semaphore, limiter)
+            rows = await asyncio.to_thread(self._append, ticker, full, None, coverage)
+            return {'requests': len(ranges) + 1, 'rows_added': rows - len(old), 'rebased': True}
+        if frames:
+            rows_added = await asyncio.to_thread(self._append, ticker, pd.concat(frames), old, coverage)
+        else:
+            rows_added = 0
+            if old is not None and coverage != self.coverage_start(ticker):
+                await asyncio.to_thread(self._write_coverage, ticker, coverage)
+        return {'requests': len(ranges), 'rows_added': rows_added, 'rebased': False}
+
+    async def arefresh(self, tickers, start, end=None):
+        # 并发刷新一组代码，返回 {代码: {'requests': 请求次数, 'rows_added': 新增行数,
+        # 'rebased': 是否因复权基准变化整体重新下载, 'error': 异常}}
+        start = pd.Timestamp(start).normalize()
+        end = (pd.Timestamp(end) if end is not None else pd.Timestamp.today() + pd.Timedelta(days=1)).normalize()
+        os.makedirs(self.root, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = RateLimiter(self.requests_per_second)
+        tickers = list(dict.fromkeys(tickers))
+        results = await asyncio.gather(*(self._refresh_one(t, start, end, semaphore, limiter) for t in tickers),
+                                       return_exceptions=True)
+        report = {}
+        for ticker, result in zip(tickers, results):
+            if isinstance(result, Exception):
+                report[ticker] = {'requests': 0, 'rows_added': 0, 'rebased': False, 'error': result}
+                print(f"下载 {ticker} 失败: {result!r}")
+            else:
+                report[ticker] = dict(result, error=None)
+        return report
+
+    def refresh(self, tickers, start, end=None):
+        # 同步入口；在 Jupyter 等已有事件循环的环境中请使用 await store.arefresh(...)
+        return asyncio.run(self.arefresh(tickers, start, end))
+
+
+def fetch_universe(tickers, start, end=None, root=STORE_DIR, fetcher=None, **kwargs):
+    # 一步完成：增量刷新后返回 {代码: DataFrame}
+    store = MarketDataStore(root=root, fetcher=fetcher, **kwargs)
+    report = store.refresh(tickers, start, end)
+    ok = [t for t in report if report[t]['error'] is None and os.path.isdir(store.store_dir(t))]
+    return store.load_many(ok, start, end)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    from benchmark import synthetic_ohlcv
+
+    # 离线演示：500 个合成代码，先下载到 2023 年底，再增量刷新到 2024 年底；
+    # 最后一次刷新没有新数据，每个代码仍需一次请求确认
+    tickers = [f"SYN{i:03d}" for i in range(500)]
+    frames = {t: synthetic_ohlcv(2500, seed=i, start='2015-01-01') for i, t in enumerate(tickers)}
+    fetcher = FixtureFetcher(frames, latency=0.01)
+    with tempfile.TemporaryDirectory() as root:
+        store = MarketDataStore(root=root, fetcher=fetcher, max_concurrency=16, requests_per_second=0)
+        for label, end in [('首次下载', '2024-01-01'), ('增量刷新', '2025-01-01'), ('再次刷新', '2025-01-01')]:
+            fetcher.calls.clear()
+            t0 = time.perf_counter()
+            report = store.refresh(tickers, '2015-01-01', end)
+            rows = sum(r['rows_added'] for r in report.values())
+            print(f"{label}: {len(fetcher.calls)} 次请求, 新增 {rows} 行, 用时 {time.perf_counter() - t0:.2f} 秒")
@@ -0,0 +1,334 @@
+# 分钟线的大数据模式：分块流式读取的 backtrader 数据源
+# 策略脚本都是把 GC=F_historical_data.csv 整个读进 df 再交给 PandasData，时间框架写死为日线。
+# 几年的 1 分钟黄金期货数据有几千万行，整表读入内存不可行，这里：
+#   - ChunkedMinuteData 按固定行数 (block_size) 从磁盘分块读取，内存中只有当前块；
+#     数据源可以是列式存储目录 (data_cache 的 .npy 格式)、CSV 文件，或返回 DataFrame 块的函数
+#   - 列式存储按文件偏移直接读取，不做内存映射，常驻内存不随已读过的历史增长
+#   - 配合 cerebro.run(exactbars=1)：不预加载数据，各条 line 只保留指标需要的回看窗口
+#     (例如 SMA_ATR 策略的 max(slow_length, atr_period))，内存与历史长度无关
+#   - resample=True 时在流中把分钟线合成日线 (按交易日分组，跨块的那一天留到下一块再合成)，
+#     引擎只需要处理日线，向量化的合成几乎不增加耗时
+#   - write_store_blocks / csv_to_store 以同样的分块方式把超大 CSV 转换成列式存储
+#
+# 用法示例 (需要 exactbars=1，此时 cerebro.plot() 不可用)：
+#   data = ChunkedMinuteData(dataname='.minute_data/GC=F', resample=True)
+#   cerebro.adddata(data)
+#   cerebro.run(exactbars=1)
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from data_cache import COLUMNS
+
+BLOCK_SIZE = 100_000
+DAY_NS = 86_400 * 10**9
+# datetime(1970, 1, 1).toordinal()，纳秒时间戳换算成 backtrader 日期数值的基准
+EPOCH_ORDINAL = 719_163
+
+
+def _read_npy_header(f):
+    # 返回 .npy 文件的 (dtype, 行数)，文件指针停在数据开始处
+    version = np.lib.format.read_magic(f)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, _, dtype = read_header(f)
+    return dtype, shape[0]
+
+
+def iter_store_blocks(store_dir, block_size=BLOCK_SIZE, start=None, end=None):
+    # 分块读取列式存储中 [start, end] 区间 (纳秒时间戳) 的数据，每块是 {列名: ndarray}
+    with open(os.path.join(store_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    columns = ['Date'] + meta['columns']
+    # 用内存映射只做二分查找，只会访问到 log2(行数) 个页面
+    dates = np.load(os.path.join(store_dir, 'Date.npy'), mmap_mode='r')
+    first = 0 if start is None else int(np.searchsorted(dates, start, side='left'))
+    last = len(dates) if end is None else int(np.searchsorted(dates, end, side='right'))
+    del dates
+    files = {col: open(os.path.join(store_dir, f'{col}.npy'), 'rb') for col in columns}
+    try:
+        dtypes = {}
+        for col, f in files.items():
+            dtypes[col], _ = _read_npy_header(f)
+            f.seek(first * dtypes[col].itemsize, os.SEEK_CUR)
+        for pos in range(first, last, block_size):
+            count = min(block_size, last - pos)
+            yield {col: np.fromfile(f, dtype=dtypes[col], count=count) for col, f in files.items()}
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def _parse_dates(values):
+    # 带时区偏移的时间 (yf.download(interval='1m') 导出的 CSV) 统一转成 UTC 后去掉时区，
+    # 不带时区的按原样保留
+    return pd.to_datetime(values, utc=True).tz_localize(None).as_unit('ns').asi8
+
+
+def frame_block(df):
+    # DataFrame (日期为索引) 转换成数据块，缺少 Volume / Adj Close 时分别补 0 和 Close
+    block = {'Date': _parse_dates(df.index)}
+    for col in COLUMNS:
+        if col in df.columns:
+            block[col] = df[col].to_numpy(dtype=np.float64)
+        elif col == 'Volume':
+            block[col] = np.zeros(len(df))
+        else:
+            block[col] = df['Close'].to_numpy(dtype=np.float64)
+    return block
+
+
+def iter_csv_blocks(path, block_size=BLOCK_SIZE):
+    # 分块解析 CSV：支持 yfinance 的三行表头格式，以及第一列为日期的普通 CSV
+    with open(path) as f:
+        first_line = f.readline().strip().split(',')
+    if first_line[0] == 'Price':
+        reader = pd.read_csv(path, header=None, skiprows=3, names=['Date'] + first_line[1:], index_col=0,
+                             chunksize=block_size)
+    else:
+        reader = pd.read_csv(path, index_col=0, chunksize=block_size)
+    with reader:
+        for chunk in reader:
+            yield frame_block(chunk)
+
+
+def _slice_block(block, start, stop):
+    return {col: values[start:stop] for col, values in block.items()}
+
+
+def _aggregate_days(block, day):
+    # 一块完整交易日的分钟线合成日线，日期为交易日的零点 (与日线 CSV 一致)
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    ends = np.r_[starts[1:], len(day)] - 1
+    return {
+        'Date': day[starts] * DAY_NS,
+        'Open': block['Open'][starts],
+        'High': np.maximum.reduceat(block['High'], starts),
+        'Low': np.minimum.reduceat(block['Low'], starts),
+        'Close': block['Close'][ends],
+        'Volume': np.add.reduceat(block['Volume'], starts),
+        'Adj Close': block['Adj Close'][ends],
+    }
+
+
+def resample_daily(blocks, session_offset=0):
+    # 流式合成日线：交易日 = (时间 + session_offset 小时) 所在的日期。
+    # 例如 COMEX 黄金的交易日从前一天 18:00 (美东) 开始，可以用 session_offset=6 把晚盘归到下一个交易日。
+    # 每块最后一个交易日可能还没结束，留到下一块合并后再输出
+    offset = int(session_offset * 3600 * 10**9)
+    carry = None
+    for block in blocks:
+        if carry is not None:
+            block = {col: np.concatenate((carry[col], block[col])) for col in block}
+        if len(block['Date']) == 0:
+            continue
+        day = (block['Date'] + offset) // DAY_NS
+        last_start = int(np.searchsorted(day, day[-1]))
+        carry = _slice_block(block, last_start, None)
+        if last_start:
+            yield _aggregate_days(_slice_block(block, 0, last_start), day[:last_start])
+    if carry is not None and len(carry['Date']):
+        yield _aggregate_days(carry, (carry['Date'] + offset) // DAY_NS)
+
+
+def _date2num(dates):
+    # 与 backtrader 的 date2num 逐位一致：序数日 + 时 / 24 + 分 / 1440 + 秒 / 86400 + 微秒 / 86400e6 (fsum)
+    days, rest = np.divmod(dates, DAY_NS)
+    hour, rest = np.divmod(rest, 3_600 * 10**9)
+    minute, rest = np.divmod(rest, 60 * 10**9)
+    second, rest = np.divmod(rest, 10**9)
+    parts = zip((days + EPOCH_ORDINAL).astype(np.float64).tolist(), (hour / 24.0).tolist(),
+                (minute / 1440.0).tolist(), (second / 86400.0).tolist(), ((rest // 1000) / 86400e6).tolist())
+    return [math.fsum(p) for p in parts]
+
+
+class ChunkedMinuteData(bt.feeds.DataBase):
+    # dataname 可以是：列式存储目录、CSV 文件路径、DataFrame，或者每次调用返回 DataFrame 块迭代器的函数
+    # (参数优化时每次运行都会重新 start，数据源需要能够重复读取)
+    params = (
+        ('timeframe', bt.TimeFrame.Minutes),
+        ('block_size', BLOCK_SIZE),
+        ('resample', False),      # True: 在流中把分钟线合成日线
+        ('session_offset', 0),    # 合成日线时交易日相对自然日提前的小时数
+    )
+
+    def __init__(self):
+        if self.p.resample:
+            # 时间框架在 __init__ 之后才从参数读取，这里改参数即可
+            self.p.timeframe = bt.TimeFrame.Days
+            self.p.compression = 1
+
+    def _iter_source(self, start, end):
+        source = self.p.dataname
+        if isinstance(source, str) and os.path.isdir(source):
+            yield from iter_store_blocks(source, self.p.block_size, start, end)
+            return
+        if isinstance(source, str):
+            blocks = iter_csv_blocks(source, self.p.block_size)
+        elif isinstance(source, pd.DataFrame):
+            blocks = (frame_block(source.iloc[i:i + self.p.block_size])
+                      for i in range(0, len(source), self.p.block_size))
+        else:
+            blocks = (frame_block(df) for df in source())
+        for block in blocks:
+            dates = block['Date']
+            if end is not None and len(dates) and dates[0] > end:
+                return
+            keep = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                keep &= dates >= start
+            if end is not None:
+                keep &= dates <= end
+            yield block if keep.all() else {col: values[keep] for col, values in block.items()}
+
+    def _iter_blocks(self):
+        start = None if self.p.fromdate is None else pd.Timestamp(self.p.fromdate).value
+        end = None if self.p.todate is None else pd.Timestamp(self.p.todate).value
+        blocks = self._iter_source(start, end)
+        if self.p.resample:
+            blocks = resample_daily(blocks, self.p.session_offset)
+        return blocks
+
+    def start(self):
+        super().start()
+        self._blocks = self._iter_blocks()
+        self._rows = iter(())
+
+    def stop(self):
+        super().stop()
+        self._blocks = self._rows = None
+
+    def _next_block(self):
+        for block in self._blocks:
+            if len(block['Date']):
+                self._rows = zip(_date2num(block['Date']), block['Open'].tolist(), block['High'].tolist(),
+                                 block['Low'].tolist(), block['Close'].tolist(), block['Volume'].tolist())
+                return True
+        return False
+
+    def _load(self):
+        row = next(self._rows, None)
+        if row is None:
+            if not self._next_block():
+                return False
+            row = next(self._rows)
+        lines = self.lines
+        lines.datetime[0], lines.open[0], lines.high[0], lines.low[0], lines.close[0], lines.volume[0] = row
+        lines.openinterest[0] = 0.0
+        return True
+
+
+def write_store_blocks(blocks, store_dir):
+    # 分块写入列式存储 (格式与 data_cache.write_store 相同，read_store 可以直接读取)。
+    # 每列先追加写到原始二进制文件，最后补上 .npy 表头，整个过程只在内存中保留一块
+    parent = os.path.dirname(store_dir) or '.'
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        columns = ['Date'] + COLUMNS
+        raw = {col: open(os.path.join(tmp_dir, f'{col}.bin'), 'wb') for col in columns}
+        rows, last_date = 0, None
+        try:
+            for block in blocks:
+                dates = np.asarray(block['Date'], dtype=np.int64)
+                if len(dates) == 0:
+                    continue
+                if (np.diff(dates) < 0).any() or (last_date is not None and dates[0] < last_date):
+                    raise ValueError("分钟数据必须按时间升序排列")
+                last_date = dates[-1]
+                raw['Date'].write(dates.tobytes())
+                for col in COLUMNS:
+                    raw[col].write(np.asarray(block[col], dtype=np.float64).tobytes())
+                rows += len(dates)
+        finally:
+            for f in raw.values():
+                f.close()
+        for col in columns:
+            bin_path = os.path.join(tmp_dir, f'{col}.bin')
+            dtype = np.dtype(np.int64 if col == 'Date' else np.float64)
+            with open(os.path.join(tmp_dir, f'{col}.npy'), 'wb') as out, open(bin_path, 'rb') as src:
+                np.lib.format.write_array_header_1_0(
+                    out, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (rows,)})
+                shutil.copyfileobj(src, out, 1 << 24)
+            os.remove(bin_path)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'columns': COLUMNS, 'rows': rows}, f)
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.rename(tmp_dir, store_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return rows
+
+
+def csv_to_store(csv_path, store_dir, block_size=BLOCK_SIZE):
+    # 超大的分钟线 CSV 只需转换一次，之后按文件偏移读取比逐块解析 CSV 快得多
+    return write_store_blocks(iter_csv_blocks(csv_path, block_size), store_dir)
+
+
+def synthetic_minute_blocks(n_days, seed=0, start_price=1800.0, start='2015-01-01', block_size=BLOCK_SIZE):
+    # 几何随机游走生成的 24 小时连续交易的 1 分钟 OHLCV，逐块生成，不会一次性占用内存
+    rng = np.random.default_rng(seed)
+    first = pd.Timestamp(start).value
+    total = n_days * 1440
+    price = start_price
+    for pos in range(0, total, block_size):
+        count = min(block_size, total - pos)
+        close = price * np.exp(np.cumsum(rng.normal(0.0, 0.0004, count)))
+        open_ = np.r_[price, close[:-1]]
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0.0, 0.0002, count)))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0.0, 0.0002, count)))
+        price = close[-1]
+        yield {'Date': first + (pos + np.arange(count, dtype=np.int64)) * 60 * 10**9,
+               'Open': open_, 'High': high, 'Low': low, 'Close': close,
+               'Volume': rng.integers(1, 500, count).astype(np.float64), 'Adj Close': close}
+
+
+if __name__ == '__main__':
+    import argparse
+    import contextlib
+    import io
+    import time
+
+    from profiling import MemorySampler
+
+    parser = argparse.ArgumentParser(description="分钟线分块流式回测演示 (SMA_ATR 双均线策略)")
+    parser.add_argument('--days', type=int, default=3650, help="合成分钟线的天数 (每天 1440 根)")
+    parser.add_argument('--minute-days', type=int, default=30, help="直接在分钟线上回测最后多少天")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from SMA_ATR_Strategy import DualMovingAverage
+
+    def run(label, **feed_kwargs):
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(ChunkedMinuteData(dataname=store_dir, block_size=args.block_size, **feed_kwargs))
+        cerebro.addstrategy(DualMovingAverage)
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+        cerebro.broker.setcash(100000.0)
+        cerebro.broker.setcommission(commission=0.0001)
+        sampler = MemorySampler(0.05)
+        sampler.start()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            strat = cerebro.run(exactbars=1)[0]
+        elapsed = time.perf_counter() - t0
+        sampler.stop()
+        bars = len(strat.data)
+        print(f"{label}: {bars} 根 bar, 用时 {elapsed:.2f} 秒, 交易 {strat.analyzers.trade_analyzer.get_analysis().total.total} 次, "
+              f"最终资金 {cerebro.broker.getvalue():.2f}, 峰值内存 {max(sampler.samples):.1f} MB")
+
+    with tempfile.TemporaryDirectory() as root:
+        store_dir = os.path.join(root, 'SYN')
+        t0 = time.perf_counter()
+        rows = write_store_blocks(synthetic_minute_blocks(args.days, block_size=args.block_size), store_dir)
+        print(f"写入 {rows} 行分钟线, 用时 {time.perf_counter() - t0:.2f} 秒")
+        run("分钟线流式合成日线", resample=True)
+        last = pd.Timestamp('2015-01-01') + pd.Timedelta(days=args.days)
+        run(f"最后 {args.minute_days} 天的分钟线", fromdate=last - pd.Timedelta(days=args.minute_days))
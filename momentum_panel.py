@@ -0,0 +1,183 @@
+# 面板化的截面动量引擎
+# Momentum_Strategy.ipynb 里的 RelativeMomentumStrategy 为每个标的创建一个 bt.indicators.ROC100，
+# 再在每次再平衡时用 Python 循环遍历 self.datas 排序，7 只股票没问题，500 到 3000 只就太慢了。
+# 这里把所有标的对齐成一个 (日期 x 标的) 的收盘价矩阵：
+#   - 按每个标的自己的 bar 计算滚动 ROC100 (没有缺失 bar 的标的整块计算)
+#   - 对所有再平衡日同时用 argpartition 选出动量最高的 top_n，再按 long_only_momentum_threshold 过滤
+#   - 按 backtrader 的成交规则模拟调仓 (信号日收盘决策，该标的下一根 bar 开盘成交，先平仓后买入，含佣金)
+# 在 7 只股票的场景下，成交记录和最终资金与 backtrader 版本一致。
+import numpy as np
+import pandas as pd
+
+
+def align_panel(frames, field):
+    # frames 为 {标的名: OHLCV DataFrame}，按日期外连接对齐，缺失的 bar 为 NaN
+    panel = pd.concat({ticker: df[field] for ticker, df in frames.items()}, axis=1, sort=True)
+    return panel.sort_index()
+
+
+def rolling_roc100(close, period):
+    # 与 bt.indicators.ROC100 相同：100 * (close - close[-period]) / close[-period]
+    roc = np.full(close.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roc[period:] = 100.0 * ((close[period:] - close[:-period]) / close[:-period])
+    return roc
+
+
+def ticker_roc100(close, period):
+    # 每个标的只在自己有 bar 的行上计算 ROC100 (与 backtrader 里每个 data 各自挂一个指标相同)，
+    # 没有 bar 的行沿用该标的最近一根 bar 的指标值
+    valid = ~np.isnan(close)
+    full = valid.all(axis=0)
+    roc = np.full(close.shape, np.nan)
+    # 没有缺失 bar 的标的整块计算，有缺失的逐个压缩后计算再放回原位置
+    roc[:, full] = rolling_roc100(close[:, full], period)
+    for j in np.flatnonzero(~full):
+        rows = np.flatnonzero(valid[:, j])
+        roc[rows, j] = rolling_roc100(close[rows, j], period)
+    return pd.DataFrame(roc).ffill().to_numpy()
+
+
+def rebalance_rows(dates, rebalance_months, start):
+    # 复现策略里的再平衡判断：当前月份在 rebalance_months 中且与上一次再平衡的月份不同
+    months = pd.DatetimeIndex(dates).month.to_numpy()
+    allowed = np.isin(months, list(rebalance_months))
+    # 只有每个月的第一根 bar (以及 start 这一根) 可能触发再平衡
+    candidates = np.flatnonzero(allowed & np.r_[True, months[1:] != months[:-1]])
+    candidates = candidates[candidates > start]
+    if allowed[start]:
+        candidates = np.r_[start, candidates]
+    rows, last_month = [], None
+    for row in candidates:
+        if months[row] != last_month:
+            rows.append(row)
+            last_month = months[row]
+    return np.asarray(rows, dtype=np.int64)
+
+
+def select_top(momentum, top_n, threshold):
+    # momentum 为 (再平衡日数 x 标的数) 的矩阵，返回每个再平衡日按动量从高到低排列的标的下标
+    k, n = momentum.shape
+    with np.errstate(invalid='ignore'):
+        eligible = momentum > threshold
+    score = np.where(eligible, momentum, -np.inf)
+    top_n = min(top_n, n)
+    if top_n < n:
+        # 部分排序：只把前 top_n 名挪到前面，O(标的数) 而不是 O(标的数 * log)
+        part = np.argpartition(-score, top_n - 1, axis=1)[:, :top_n]
+    else:
+        part = np.tile(np.arange(n), (k, 1))
+    part_score = np.take_along_axis(score, part, axis=1)
+    # 前 top_n 名内部按动量降序，动量相同时按标的顺序 (与 list.sort 的稳定排序一致)
+    order = np.lexsort((part, -part_score), axis=1)
+    ranked = np.take_along_axis(part, order, axis=1)
+    ranked_score = np.take_along_axis(part_score, order, axis=1)
+    return [row[np.isfinite(s)] for row, s in zip(ranked, ranked_score)]
+
+
+def run_momentum_panel(frames, momentum_period=30 * 4, top_n=1, rebalance_months=range(1, 13),
+                       long_only_momentum_threshold=0.0, cash=100000.0, commission=0.0001):
+    # 返回 dict：equity (每根 bar 收盘后的账户总值)、fills (成交记录)、
+    # rebalances (每次再平衡的目标标的)、final_value
+    tickers = list(frames)
+    open_panel = align_panel(frames, 'Open')
+    close_panel = align_panel(frames, 'Close')
+    dates = close_panel.index
+    open_ = open_panel.to_numpy(dtype=np.float64)
+    close = close_panel.to_numpy(dtype=np.float64)
+    has_bar = ~np.isnan(close)
+    # 某个标的当天没有 bar 时，backtrader 沿用它最近一根 bar 的收盘价 (估值、下单时的 close[0] 都是它)
+    mark = close_panel.ffill().to_numpy(dtype=np.float64)
+    n_bars = len(dates)
+
+    momentum = ticker_roc100(close, momentum_period)
+    # ROC100 的 minperiod 为 period + 1：每个标的都要有 period + 1 根自己的 bar 后策略才开始运行 next()
+    counts = has_bar.cumsum(axis=0)
+    ready = counts[-1] > momentum_period if n_bars else np.zeros(len(tickers), dtype=bool)
+    rows = []
+    if n_bars and ready.all():
+        start = int((counts > momentum_period).argmax(axis=0).max())
+        rows = rebalance_rows(dates, rebalance_months, start)
+    targets = select_top(momentum[rows], top_n, long_only_momentum_threshold) if len(rows) else []
+    schedule = dict(zip((int(row) for row in rows), targets))
+
+    size = np.zeros(len(tickers))   # 当前持仓数量
+    entry = np.zeros(len(tickers))  # 持仓成本价
+    equity = np.empty(n_bars)
+    fills, rebalances = [], []
+    submitted = []  # 上一根 bar 提交、等待 broker 检查资金的订单 (标的下标, 数量, 下单价, 下单的行)
+    pending = []    # 已接受、等待该标的下一根 bar 开盘成交的订单，按提交顺序排列
+    prev_row = 0
+    row = int(rows[0]) if len(rows) else n_bars
+    while row < n_bars:
+        # broker 在每根 bar 先按下单时的收盘价预估资金 (check_submitted)，资金不足的订单直接拒绝
+        pseudo_cash = cash
+        for i, qty, price, created in submitted:
+            pseudo_cash -= qty * price
+            pseudo_cash -= abs(qty) * price * commission
+            if pseudo_cash >= 0.0:
+                pending.append((i, qty, created))
+        submitted = []
+
+        # 订单只在该标的自己的下一根 bar 开盘成交，标的当天没有 bar 就继续挂着
+        waiting = []
+        for order in pending:
+            i, qty, created = order
+            if created >= row or not has_bar[row, i]:
+                waiting.append(order)
+                continue
+            # 持仓变化前的账户总值用矩阵运算一次算出
+            held = np.flatnonzero(size)
+            equity[prev_row:row] = cash + mark[prev_row:row][:, held] @ size[held]
+            prev_row = row
+            price = open_[row, i]
+            if qty < 0:
+                qty = size[i]
+                cash += qty * entry[i] + (price - entry[i]) * qty
+                cash -= qty * price * commission
+                fills.append({'date': dates[row], 'ticker': tickers[i], 'size': -qty, 'price': price,
+                              'pnl': (price - entry[i]) * qty, 'commission': qty * price * commission})
+                size[i] = 0.0
+                entry[i] = 0.0
+            else:
+                if cash - qty * price - qty * price * commission < 0.0:
+                    continue  # 开盘跳空导致资金不足，订单被拒绝 (Margin)
+                cash -= qty * price
+                cash -= qty * price * commission
+                size[i] = qty
+                entry[i] = price
+                fills.append({'date': dates[row], 'ticker': tickers[i], 'size': float(qty), 'price': price,
+                              'pnl': 0.0, 'commission': qty * price * commission})
+        pending = waiting
+
+        target = schedule.get(row)
+        if target is not None:
+            rebalances.append({'date': dates[row], 'targets': [tickers[i] for i in target]})
+            # 先平掉不在目标里的持仓，再为目标中尚未持有的标的按可用现金均分买入
+            target_set = set(target.tolist())
+            for i in np.flatnonzero(size):
+                if i not in target_set:
+                    submitted.append((i, -size[i], mark[row, i], row))
+            if len(target):
+                cash_per_asset = cash / len(target)
+                for i in target:
+                    if size[i] == 0 and cash_per_asset > mark[row, i]:
+                        qty = int(cash_per_asset // mark[row, i])
+                        if qty > 0:
+                            submitted.append((i, qty, mark[row, i], row))
+
+        if submitted or pending:
+            row += 1
+        else:
+            # 没有在途订单时直接跳到下一个再平衡日
+            later = np.searchsorted(rows, row, side='right')
+            row = int(rows[later]) if later < len(rows) else n_bars
+
+    held = np.flatnonzero(size)
+    equity[prev_row:] = cash + mark[prev_row:][:, held] @ size[held]
+    return {
+        'equity': pd.Series(equity, index=dates, name='value'),
+        'fills': pd.DataFrame(fills, columns=['date', 'ticker', 'size', 'price', 'pnl', 'commission']),
+        'rebalances': rebalances,
+        'final_value': float(equity[-1]) if n_bars else cash,
+    }
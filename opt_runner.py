@@ -0,0 +1,157 @@
+# 多进程、分块的参数优化运行器
+# cerebro.optstrategy 会把所有策略实例 (连同指标的 line 缓冲区) 一直保存到优化结束，
+# 参数网格一大内存就会爆。这里把参数网格切成小块分给进程池，每个子进程跑完一次回测后
+# 只返回一条很小的记录 (参数、rtot、交易次数、夏普比率、最大回撤)，策略对象随即释放，
+# 主进程按完成顺序逐条拿到记录，可以边跑边更新最佳参数，内存占用不随网格增大而增长。
+import contextlib
+import itertools
+import multiprocessing
+import os
+
+import backtrader as bt
+import numpy as np
+
+from profiling import PROFILE_DIR, RunProfiler
+
+# 子进程中的共享数据，由进程池的 initializer 设置一次，避免每个分块重复传输 DataFrame
+_worker_state = {}
+
+
+def param_grid(**params):
+    # 与 cerebro.optstrategy 的写法一致：每个参数给一个可迭代对象，返回所有组合的参数字典列表
+    keys = list(params)
+    values = [v if isinstance(v, (list, tuple, range)) else [v] for v in params.values()]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+class EquityCurve(bt.Analyzer):
+    # 记录每根 bar 收盘后的账户总值
+    def start(self):
+        self.values = []
+
+    def next(self):
+        self.values.append(self.strategy.broker.getvalue())
+
+    def get_analysis(self):
+        return self.values
+
+
+class TradeList(bt.Analyzer):
+    # 记录每笔交易开仓 / 平仓成交所在 bar 的序号 (从 0 开始) 和扣除佣金后的净盈亏 (pnlcomm)，
+    # 回测结束时仍未平仓的交易 exit 为 -1、pnl 为 NaN；格式与 report.make_trades 一致
+    def start(self):
+        self.opened = {}
+        self.closed = []
+
+    def notify_trade(self, trade):
+        bar = len(self.strategy.data) - 1
+        if trade.justopened:
+            self.opened[trade.ref] = bar
+        elif trade.isclosed:
+            self.closed.append((self.opened.pop(trade.ref), bar, trade.pnlcomm))
+
+    def get_analysis(self):
+        rows = sorted(self.closed + [(entry, -1, float('nan')) for entry in self.opened.values()])
+        entry, exit, pnl = zip(*rows) if rows else ((), (), ())
+        return {'entry': np.asarray(entry, dtype=np.int64), 'exit': np.asarray(exit, dtype=np.int64),
+                'pnl': np.asarray(pnl, dtype=np.float64)}
+
+
+def run_single(strategy_cls, df, params, cash=100000.0, commission=0.0001, quiet=True, keep_equity=False,
+               profiler=None):
+    # 跑一次完整的 backtrader 回测，只返回汇总记录；keep_equity=True 时附带资金曲线和交易列表数组
+    # profiler 为 profiling.RunProfiler 时对这次运行计时，剖析结果放在记录的 'profile' 中
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df, timeframe=bt.TimeFrame.Days))
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addstrategy(strategy_cls, **params)
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+    cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown_analyzer")
+    if keep_equity:
+        cerebro.addanalyzer(EquityCurve, _name="equity_curve")
+        cerebro.addanalyzer(TradeList, _name="trade_list")
+    run = cerebro.run if profiler is None else (lambda: profiler.run(cerebro))
+    if quiet:
+        # 策略里的交易日志在优化时没有意义，直接丢弃
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            strat = run()[0]
+    else:
+        strat = run()[0]
+    record = strategy_record(strat, params)
+    if keep_equity:
+        record['equity'] = np.asarray(strat.analyzers.equity_curve.get_analysis(), dtype=np.float64)
+        record['trades'] = strat.analyzers.trade_list.get_analysis()
+    if profiler is not None:
+        record['profile'] = profiler.summary()
+    return record
+
+
+def strategy_record(strat, params):
+    # 从策略实例的分析器中提取一条小记录
+    trade_analyzer = strat.analyzers.trade_analyzer.get_analysis()
+    returns_analyzer = strat.analyzers.returns_analyzer.get_analysis()
+    sharpe_ratio = strat.analyzers.sharpe_ratio.get_analysis()
+    drawdown = strat.analyzers.drawdown_analyzer.get_analysis()
+    record = dict(params)
+    record['rtot'] = returns_analyzer['rtot'] if 'rtot' in returns_analyzer else 0.0
+    record['total_trades'] = (trade_analyzer.total.closed
+                              if 'total' in trade_analyzer and 'closed' in trade_analyzer.total else 0)
+    record['sharpe_ratio'] = sharpe_ratio.get('sharperatio') if sharpe_ratio else None
+    record['max_drawdown'] = drawdown.max.drawdown if 'max' in drawdown else 0.0
+    return record
+
+
+def _init_worker(strategy_cls, df, cash, commission, quiet, keep_equity=False, profile_index=None,
+                 profile_dir=PROFILE_DIR):
+    _worker_state.update(strategy_cls=strategy_cls, df=df, cash=cash, commission=commission, quiet=quiet,
+                         keep_equity=keep_equity, profile_index=profile_index, profile_dir=profile_dir)
+
+
+def _run_chunk(chunk):
+    # chunk 为 [(网格中的序号, 参数), ...]；序号等于 profile_index 的那一次运行做性能剖析
+    st = _worker_state
+    records = []
+    for index, params in chunk:
+        profiler = None
+        if index == st['profile_index']:
+            name = '-'.join(f"{k}={v}" for k, v in params.items())
+            profiler = RunProfiler(profile_path=os.path.join(st['profile_dir'], f"{index:05d}-{name}.pstats"))
+        records.append(run_single(st['strategy_cls'], st['df'], params, st['cash'], st['commission'],
+                                  st['quiet'], st['keep_equity'], profiler))
+    return records
+
+
+def iter_optimize(strategy_cls, df, grid, workers=None, chunk_size=4, cash=100000.0,
+                  commission=0.0001, quiet=True, maxtasksperchild=None, keep_equity=False,
+                  profile_index=None, profile_dir=PROFILE_DIR):
+    # 生成器：按完成顺序逐条产出每个参数组合的记录
+    # workers 为进程数 (默认 CPU 核数)，chunk_size 为每个任务包含的参数组合数
+    # workers=1 时在当前进程内顺序执行，方便调试
+    # profile_index 为网格中某一组参数的序号：这一次运行会做性能剖析，cProfile 结果写到 profile_dir，
+    # 汇总放在该记录的 'profile' 中 (可用 profiling.print_summary 打印)
+    grid = list(enumerate(grid))
+    chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    initargs = (strategy_cls, df, cash, commission, quiet, keep_equity, profile_index, profile_dir)
+    if workers == 1:
+        _init_worker(*initargs)
+        for chunk in chunks:
+            yield from _run_chunk(chunk)
+        return
+    with multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=initargs,
+                              maxtasksperchild=maxtasksperchild) as pool:
+        for records in pool.imap_unordered(_run_chunk, chunks):
+            yield from records
+
+
+def optimize(strategy_cls, df, grid, key='rtot', **kwargs):
+    # 跑完整个网格，增量维护最佳记录，返回 (最佳记录, 全部记录)
+    best, records = None, []
+    for record in iter_optimize(strategy_cls, df, grid, **kwargs):
+        records.append(record)
+        if record[key] is not None and (best is None or record[key] > best[key]):
+            best = record
+    return best, records
@@ -0,0 +1,229 @@
+# 自适应参数搜索：逐次减半 (successive halving) 与 TPE (Tree-structured Parzen Estimator)
+# SMA_Opt_Strategy.py 的嵌套 range() 网格是乘法增长的，再加上 SMA_ATR_Strategy 的 atr_period、
+# atr_multiple，75 次回测会变成几千次。这里的搜索器接受与 cerebro.optstrategy 相同写法的参数空间：
+#   - 离散参数：range / list / tuple，例如 fast_length=range(10, 31, 5)
+#   - 连续参数：Real(low, high)，例如 atr_multiple=Real(1.0, 4.0)
+# 两种方法：
+#   - halving：先在最近的一小段历史上给大量候选打分，每一轮保留前 1/eta，
+#     并把历史长度放大 eta 倍，最后一轮才在全部 ~6000 根 bar 上回测
+#   - tpe：先随机评估若干组，再按"好/差"两组参数的 Parzen 密度比 l(x)/g(x) 选下一组，
+#     适合 atr_multiple 这类连续参数
+# 预算以"完整回测次数"计 (评估的 bar 总数 / 全部 bar 数)，返回最佳参数和完整的评估历史。
+# 每一批候选通过 opt_runner.iter_optimize 运行，可以多进程并行。
+import itertools
+import math
+
+import numpy as np
+
+from opt_runner import iter_optimize
+
+
+class Real:
+    # 连续参数的取值区间 [low, high]
+    def __init__(self, low, high):
+        self.low = float(low)
+        self.high = float(high)
+
+    def __repr__(self):
+        return f"Real({self.low}, {self.high})"
+
+
+def _is_real(values):
+    return isinstance(values, Real)
+
+
+def _discrete(values):
+    return list(values) if isinstance(values, (list, tuple, range)) else [values]
+
+
+def sample_params(space, rng):
+    # 在参数空间中随机抽取一组参数
+    params = {}
+    for name, values in space.items():
+        if _is_real(values):
+            params[name] = float(rng.uniform(values.low, values.high))
+        else:
+            choices = _discrete(values)
+            params[name] = choices[rng.integers(len(choices))]
+    return params
+
+
+def space_size(space):
+    # 离散空间的组合总数；含连续参数时为无穷大
+    if any(_is_real(v) for v in space.values()):
+        return math.inf
+    return math.prod(len(_discrete(v)) for v in space.values())
+
+
+def _score(record, metric):
+    value = record.get(metric)
+    return -math.inf if value is None else value
+
+
+def _evaluate(strategy_cls, df, candidates, n_bars, workers, run_kwargs):
+    # 在最近 n_bars 根 bar 上评估一批候选，返回与候选顺序一致的记录
+    sub = df.iloc[-n_bars:]
+    records = list(iter_optimize(strategy_cls, sub, candidates, workers=workers, chunk_size=1, **run_kwargs))
+    # 多进程时记录按完成顺序返回，这里按参数还原原来的顺序
+    order = {tuple(sorted(c.items())): i for i, c in enumerate(candidates)}
+    records.sort(key=lambda r: order[tuple(sorted((k, r[k]) for k in candidates[0]))])
+    return records
+
+
+def successive_halving(strategy_cls, df, space, n_candidates=None, eta=3, min_bars=None, budget=None,
+                       metric='rtot', seed=0, workers=1, **run_kwargs):
+    # 逐次减半。n_candidates 默认取离散网格的全部组合 (含连续参数时默认 81 组)；
+    # min_bars 为第一轮使用的历史长度，默认取最大参数值的 3 倍 (保证均线等指标有足够的预热和交易机会)
+    rng = np.random.default_rng(seed)
+    full_bars = len(df)
+    if min_bars is None:
+        longest = max(max(_discrete(v)) if not _is_real(v) else 0 for v in space.values())
+        min_bars = max(3 * int(longest), 252)
+    min_bars = min(min_bars, full_bars)
+    # 轮数：历史长度从 min_bars 开始每轮乘以 eta，直到覆盖全部数据
+    rounds = max(int(math.floor(math.log(full_bars / min_bars, eta))), 0) + 1
+
+    discrete_only = not any(_is_real(v) for v in space.values())
+    grid = ([dict(zip(space, combo)) for combo in itertools.product(*(_discrete(v) for v in space.values()))]
+            if discrete_only else None)
+    if n_candidates is None:
+        n_candidates = len(grid) if grid is not None else eta ** 4
+    if budget is not None:
+        # 每一轮的成本约为 n_candidates / eta^(rounds-1) 次完整回测
+        n_candidates = min(n_candidates, int(budget * eta ** (rounds - 1) / rounds))
+    n_candidates = max(n_candidates, 1)
+    if grid is not None and n_candidates >= len(grid):
+        candidates = grid
+    elif grid is not None:
+        candidates = [grid[i] for i in rng.choice(len(grid), n_candidates, replace=False)]
+    else:
+        candidates = [sample_params(space, rng) for _ in range(n_candidates)]
+
+    history, used = [], 0.0
+    for rung in range(rounds):
+        n_bars = full_bars if rung == rounds - 1 else min(int(min_bars * eta ** rung), full_bars)
+        records = _evaluate(strategy_cls, df, candidates, n_bars, workers, run_kwargs)
+        used += len(candidates) * n_bars / full_bars
+        for record in records:
+            record.update(rung=rung, bars=n_bars)
+            history.append(record)
+        if rung == rounds - 1:
+            break
+        keep = max(1, math.ceil(len(candidates) / eta))
+        ranked = sorted(range(len(records)), key=lambda i: _score(records[i], metric), reverse=True)
+        candidates = [candidates[i] for i in ranked[:keep]]
+
+    final = [r for r in history if r['bars'] == full_bars]
+    best = max(final, key=lambda r: _score(r, metric))
+    return {'best_params': {k: best[k] for k in space}, 'best': best,
+            'history': history, 'full_backtests_used': used}
+
+
+def _parzen_logpdf(x, points, low, high, bandwidth):
+    # 一维 Parzen 估计：以观测点为中心的高斯核，外加一个均匀先验分量
+    weights = 1.0 / (len(points) + 1)
+    pdf = weights / (high - low)
+    if len(points):
+        z = (x[:, None] - points[None, :]) / bandwidth
+        pdf = pdf + weights * np.exp(-0.5 * z ** 2).sum(axis=1) / (bandwidth * math.sqrt(2 * math.pi))
+    return np.log(pdf)
+
+
+def _propose(space, good, bad, rng, n_ei_candidates):
+    # 从"好"参数的分布中抽样 n_ei_candidates 组，按 log l(x) - log g(x) 打分
+    samples = {}
+    score = np.zeros(n_ei_candidates)
+    for name, values in space.items():
+        good_vals = np.array([g[name] for g in good])
+        bad_vals = np.array([b[name] for b in bad])
+        if _is_real(values):
+            low, high = values.low, values.high
+            bandwidth = max((high - low) * len(good) ** -0.2 / 4, (high - low) * 0.02)
+            centers = good_vals[rng.integers(len(good_vals), size=n_ei_candidates)]
+            x = np.clip(centers + rng.normal(0.0, bandwidth, n_ei_candidates), low, high)
+            score += (_parzen_logpdf(x, good_vals, low, high, bandwidth)
+                      - _parzen_logpdf(x, bad_vals, low, high, bandwidth))
+            samples[name] = x
+        else:
+            choices = _discrete(values)
+            # 类别分布加一平滑
+            p_good = np.array([(good_vals == c).sum() + 1.0 for c in choices])
+            p_bad = np.array([(bad_vals == c).sum() + 1.0 for c in choices])
+            p_good, p_bad = p_good / p_good.sum(), p_bad / p_bad.sum()
+            idx = rng.choice(len(choices), size=n_ei_candidates, p=p_good)
+            score += np.log(p_good[idx]) - np.log(p_bad[idx])
+            samples[name] = [choices[i] for i in idx]
+    order = np.argsort(-score)
+    proposals = []
+    for i in order:
+        params = {}
+        for name, values in space.items():
+            params[name] = float(samples[name][i]) if _is_real(values) else samples[name][i]
+        proposals.append(params)
+    return proposals
+
+
+def tpe_search(strategy_cls, df, space, budget=30, n_startup=10, gamma=0.25, n_ei_candidates=64,
+               batch_size=1, metric='rtot', seed=0, workers=1, **run_kwargs):
+    # TPE：每次评估都在全部数据上进行，budget 即完整回测的次数
+    rng = np.random.default_rng(seed)
+    size = space_size(space)
+    history, seen = [], set()
+    while len(history) < budget and len(seen) < size:
+        n_batch = min(batch_size, budget - len(history))
+        if len(history) < n_startup:
+            proposals = [sample_params(space, rng) for _ in range(n_batch * 4)]
+        else:
+            ranked = sorted(history, key=lambda r: _score(r, metric), reverse=True)
+            n_good = max(1, int(math.ceil(gamma * len(ranked))))
+            proposals = _propose(space, ranked[:n_good], ranked[n_good:], rng, n_ei_candidates)
+        batch = []
+        for params in proposals:
+            key = tuple(sorted(params.items()))
+            if key not in seen:
+                seen.add(key)
+                batch.append(params)
+            if len(batch) == n_batch:
+                break
+        # 抽到的都评估过时重新随机抽样补足这一批，直到离散空间真正用完
+        while len(batch) < n_batch and len(seen) < size:
+            params = sample_params(space, rng)
+            key = tuple(sorted(params.items()))
+            if key not in seen:
+                seen.add(key)
+                batch.append(params)
+        for record in _evaluate(strategy_cls, df, batch, len(df), workers, run_kwargs):
+            record.update(iteration=len(history), bars=len(df))
+            history.append(record)
+    best = max(history, key=lambda r: _score(r, metric))
+    return {'best_params': {k: best[k] for k in space}, 'best': best,
+            'history': history, 'full_backtests_used': float(len(history))}
+
+
+def search(strategy_cls, df, space, method='halving', **kwargs):
+    # 统一入口：method 为 'halving' 或 'tpe'
+    if method == 'halving':
+        return successive_halving(strategy_cls, df, space, **kwargs)
+    if method == 'tpe':
+        return tpe_search(strategy_cls, df, space, **kwargs)
+    raise ValueError(f"未知的搜索方法: {method}")
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from SMA_ATR_Strategy import DualMovingAverage, df
+
+    # 与 SMA_Opt_Strategy.py 相同的均线网格，再加上 ATR 止损的两个参数
+    space = dict(fast_length=range(10, 31, 5), slow_length=range(50, 200, 10),
+                 atr_period=range(10, 31, 5), atr_multiple=Real(1.0, 4.0),
+                 use_indicator_cache=True)
+    for method, kwargs in [('halving', dict(budget=60)), ('tpe', dict(budget=40, n_startup=15))]:
+        result = search(DualMovingAverage, df, space, method=method, **kwargs)
+        best = result['best']
+        print(f"--- {method} 搜索结果 ---")
+        print(f"  最佳参数: {result['best_params']}")
+        print(f"  总收益率: {best['rtot'] * 100:.2f}%, 交易总数: {best['total_trades']}")
+        print(f"  评估次数: {len(result['history'])}, 折合完整回测: {result['full_backtests_used']:.1f} 次")
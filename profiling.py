@@ -0,0 +1,192 @@
+# 回测运行的可选性能剖析
+# 参数优化跑得慢时，看不出时间花在 PandasData 数据加载、指标 __init__、策略 next()、broker 撮合，
+# 还是每个脚本都挂上的 TradeAnalyzer / Returns / SharpeRatio / DrawDown 分析器上。
+# RunProfiler 在一次 cerebro.run() 外面套一层计时：
+#   - 阶段耗时：数据加载 (run 开始到策略 __init__)、指标初始化 (策略 __init__)、事件循环
+#   - 事件循环内按回调统计调用次数和累计耗时：策略的 next / notify_order / notify_trade、
+#     broker.next (订单撮合)、各分析器的 next 和通知回调，剩余部分为引擎本身和指标计算
+#   - 后台线程定时读取进程 RSS 做内存采样，不在逐 bar 的路径上增加开销
+#   - 可选把整次运行的 cProfile 结果保存为 .pstats 文件 (snakeviz / flameprof 可以直接打开或转成火焰图)
+# 计时是通过动态子类和替换 broker 实例方法实现的，不启用时策略、分析器和 broker 都是原来的对象，没有任何额外开销。
+import cProfile
+import os
+import threading
+import time
+from collections import defaultdict
+
+STRATEGY_CALLBACKS = ('next', 'notify_order', 'notify_trade')
+ANALYZER_CALLBACKS = ('_prenext', '_next', '_notify_order', '_notify_trade', '_notify_cashvalue', '_notify_fund')
+PROFILE_DIR = '.profiles'
+
+
+def _timed(func, stat):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stat[0] += 1
+            stat[1] += time.perf_counter() - start
+    return wrapper
+
+
+def _rss_mb():
+    # 当前进程的常驻内存 (MB)，只在 Linux 的 /proc 上可用
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval=0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = _rss_mb()
+            if rss is None:
+                return
+            self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = _rss_mb()
+        if rss is not None:
+            self.samples.append(rss)
+
+
+class RunProfiler:
+    def __init__(self, memory=True, memory_interval=0.02, profile_path=None):
+        self.memory = memory
+        self.memory_interval = memory_interval
+        self.profile_path = profile_path
+        self.stats = defaultdict(lambda: [0, 0.0])  # 名称 -> [调用次数, 累计秒数]
+        self.marks = {}
+        self.memory_samples = []
+
+    def _strategy_class(self, strategy_cls):
+        marks, stats = self.marks, self.stats
+
+        class Profiled(strategy_cls):
+            def __init__(self, *args, **kwargs):
+                start = time.perf_counter()
+                marks.setdefault('init_start', start)
+                super().__init__(*args, **kwargs)
+                end = time.perf_counter()
+                marks['init_end'] = end
+                stats['strategy.__init__'][0] += 1
+                stats['strategy.__init__'][1] += end - start
+
+        for name in STRATEGY_CALLBACKS:
+            setattr(Profiled, name, _timed(getattr(strategy_cls, name), stats[f'strategy.{name}']))
+        Profiled.__name__ = Profiled.__qualname__ = strategy_cls.__name__
+        return Profiled
+
+    def _analyzer_class(self, analyzer_cls, label):
+        class Profiled(analyzer_cls):
+            pass
+
+        for name in ANALYZER_CALLBACKS:
+            setattr(Profiled, name, _timed(getattr(analyzer_cls, name), self.stats[f'analyzer.{label}']))
+        Profiled.__name__ = Profiled.__qualname__ = analyzer_cls.__name__
+        return Profiled
+
+    def attach(self, cerebro):
+        # 在 cerebro.run() 之前调用：替换已添加的策略类、分析器类，以及 broker 的 next 方法
+        cerebro.strats = [[(self._strategy_class(cls), args, kwargs) for cls, args, kwargs in strat]
+                          for strat in cerebro.strats]
+        cerebro.analyzers = [(self._analyzer_class(cls, kwargs.get('_name', cls.__name__)), args, kwargs)
+                             for cls, args, kwargs in cerebro.analyzers]
+        broker = cerebro.broker
+        broker.next = _timed(broker.next, self.stats["broker.next"])
+        return cerebro
+
+    def run(self, cerebro, **kwargs):
+        # 计时运行 cerebro.run(**kwargs)，返回值与 cerebro.run 相同
+        self.attach(cerebro)
+        sampler = MemorySampler(self.memory_interval) if self.memory else None
+        if sampler is not None:
+            sampler.start()
+        profile = cProfile.Profile() if self.profile_path else None
+        start = time.perf_counter()
+        try:
+            if profile is not None:
+                results = profile.runcall(cerebro.run, **kwargs)
+            else:
+                results = cerebro.run(**kwargs)
+        finally:
+            end = time.perf_counter()
+            del cerebro.broker.next
+            if sampler is not None:
+                sampler.stop()
+                self.memory_samples = sampler.samples
+        self.marks.update(run_start=start, run_end=end)
+        if profile is not None:
+            os.makedirs(os.path.dirname(self.profile_path) or '.', exist_ok=True)
+            profile.dump_stats(self.profile_path)
+        return results
+
+    def summary(self):
+        marks = self.marks
+        total = marks['run_end'] - marks['run_start']
+        init_start = marks.get('init_start', marks['run_start'])
+        init_end = marks.get('init_end', init_start)
+        event_loop = marks['run_end'] - init_end
+        callbacks = {name: {'calls': calls, 'seconds': seconds}
+                     for name, (calls, seconds) in self.stats.items() if name != 'strategy.__init__'}
+        summary = {
+            'wall_time': total,
+            'phases': {
+                'data_load': init_start - marks['run_start'],
+                'indicator_setup': init_end - init_start,
+                'event_loop': event_loop,
+            },
+            'callbacks': callbacks,
+            # 事件循环中除上述回调以外的时间：引擎调度、指标计算 (runonce 模式下集中在这里)
+            'engine_other': event_loop - sum(c['seconds'] for c in callbacks.values()),
+            'profile_path': self.profile_path,
+        }
+        if self.memory_samples:
+            summary['memory'] = {'start_rss_mb': self.memory_samples[0],
+                                 'peak_rss_mb': max(self.memory_samples),
+                                 'samples': len(self.memory_samples)}
+        return summary
+
+
+def format_summary(summary):
+    # 与脚本里的结果汇总放在一起打印的表格
+    total = summary['wall_time'] or 1e-12
+    lines = ["--- 性能剖析 ---",
+             f"  {'阶段 / 回调':<30}{'调用次数':>10}{'耗时(秒)':>12}{'占比':>8}{'每次(微秒)':>12}"]
+
+    def row(name, seconds, calls=None):
+        per_call = f"{seconds / calls * 1e6:.1f}" if calls else ''
+        calls = '' if calls is None else calls
+        lines.append(f"  {name:<30}{calls:>10}{seconds:>12.4f}{seconds / total * 100:>7.1f}%{per_call:>12}")
+
+    phases = summary['phases']
+    row('数据加载', phases['data_load'])
+    row('指标初始化', phases['indicator_setup'])
+    row('事件循环', phases['event_loop'])
+    for name, c in sorted(summary['callbacks'].items(), key=lambda kv: -kv[1]['seconds']):
+        row(f"  {name}", c['seconds'], c['calls'])
+    row('  引擎调度 / 指标计算', summary['engine_other'])
+    row('合计', summary['wall_time'])
+    memory = summary.get('memory')
+    if memory:
+        lines.append(f"  内存 (RSS): 起始 {memory['start_rss_mb']:.1f} MB, 峰值 {memory['peak_rss_mb']:.1f} MB, "
+                     f"采样 {memory['samples']} 次")
+    if summary.get('profile_path'):
+        lines.append(f"  cProfile 结果: {summary['profile_path']} (snakeviz / flameprof 可视化)")
+    return '\n'.join(lines)
+
+
+def print_summary(summary):
+    print(format_summary(summary))
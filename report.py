@@ -0,0 +1,275 @@
+# 回测结果的向量化分析与报告
+# 脚本和笔记本在每次回测后逐个翻 TradeAnalyzer / Returns / SharpeRatio / DrawDown 的 AutoOrderedDict，
+# 手工计算胜率、盈亏比，然后调用 cerebro.plot() —— 6000 多根 bar、dpi=300 时要把每根 bar 的每条 line 都画一遍，非常慢。
+# 这里只需要两类数组：资金曲线和交易列表。
+#   - compute_metrics 对形状为 (运行数, bar 数) 的资金曲线矩阵一次性算出全部指标：
+#     CAGR、夏普比率 (与 SharpeRatio(timeframe=Years) 一致的版本和按日收益年化的版本)、Sortino、
+#     最大回撤及其持续 bar 数 (与 DrawDown 分析器一致)、胜率、盈亏比、持仓时间占比；单次运行是只有一行的特例
+#   - 交易列表是扁平数组 (所属运行、开仓 bar、平仓 bar、扣除佣金后的净盈亏)，用 bincount 按运行汇总
+#   - sweep_metrics 把 opt_runner / vector_sma / result_store 的记录 (keep_equity=True) 整理成一张表
+#   - plot_heatmap 画 fast/slow 参数网格上的指标热力图；plot_equity 先按桶保留最小/最大值降采样，
+#     每条曲线只画几千个点，回撤的谷底和高点不会丢
+import math
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from vector_sma import year_end_index
+
+# 每块同时处理的运行数，避免一次性生成 (运行数 x bar 数) 的多个临时矩阵
+CHUNK_SIZE = 512
+# 收益率的标准差小于这个值视为 0 (没有交易的组合资金不变，舍入误差会让标准差变成 1e-18 量级)，夏普比率记为 NaN
+TINY = 1e-12
+METRIC_LABELS = {
+    'final_value': '最终资金',
+    'total_return': '总收益率 (%)',
+    'rtot': '对数总收益 (rtot)',
+    'cagr': '年化收益率 CAGR (%)',
+    'sharpe_ratio': '夏普比率 (年度收益，同 SharpeRatio 分析器)',
+    'sharpe_annual': '夏普比率 (日收益年化)',
+    'sortino': '索提诺比率 (日收益年化)',
+    'max_drawdown': '最大回撤 (%)',
+    'max_drawdown_duration': '最长回撤持续 (bar)',
+    'total_trades': '交易次数',
+    'win_rate': '胜率 (%)',
+    'profit_factor': '盈亏比',
+    'exposure': '持仓时间占比 (%)',
+}
+# 记录中不属于参数的字段
+RESULT_FIELDS = set(METRIC_LABELS) | {'equity', 'trades', 'entries', 'exits', 'profile', 'cached'}
+
+
+def make_trades(entry, exit, pnl, run=None):
+    # 交易列表：entry / exit 为成交所在 bar 的序号 (从 0 开始)，未平仓的交易 exit 为 -1、pnl 为 NaN
+    entry = np.asarray(entry, dtype=np.int64)
+    trades = {'entry': entry, 'exit': np.asarray(exit, dtype=np.int64), 'pnl': np.asarray(pnl, dtype=np.float64)}
+    trades['run'] = np.zeros(len(entry), dtype=np.int64) if run is None else np.asarray(run, dtype=np.int64)
+    return trades
+
+
+def concat_trades(trade_lists):
+    # 每次运行一份交易列表 -> 一份扁平的交易列表，run 为所在运行的序号
+    trade_lists = [make_trades(t['entry'], t['exit'], t['pnl']) for t in trade_lists]
+    run = np.repeat(np.arange(len(trade_lists)), [len(t['entry']) for t in trade_lists])
+    return make_trades(*(np.concatenate([t[k] for t in trade_lists]) if trade_lists else []
+                         for k in ('entry', 'exit', 'pnl')), run=run)
+
+
+def _curve_metrics(values, year_idx, cash, riskfreerate, periods_per_year, years):
+    n = values.shape[1]
+    final_value = values[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = final_value / cash
+        positive = np.where(growth > 0, growth, 0.0)
+        metrics = {
+            'final_value': final_value,
+            'total_return': (growth - 1.0) * 100,
+            'rtot': np.log(positive),
+            'cagr': (positive ** (1.0 / years) - 1.0) * 100 if years > 0 else np.full(len(values), np.nan),
+        }
+
+        # 按 bar 的收益率：第一根 bar 相对初始资金
+        prev = np.concatenate((np.full((len(values), 1), cash), values[:, :-1]), axis=1)
+        excess = values / prev - 1.0 - ((1.0 + riskfreerate) ** (1.0 / periods_per_year) - 1.0)
+        mean = excess.mean(axis=1)
+        std = excess.std(axis=1, ddof=1) if n > 1 else np.zeros(len(values))
+        downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2, axis=1))
+        metrics['sharpe_annual'] = np.where(std > TINY, mean / std, np.nan) * math.sqrt(periods_per_year)
+        metrics['sortino'] = np.where(downside > TINY, mean / downside, np.nan) * math.sqrt(periods_per_year)
+
+        # SharpeRatio(timeframe=Years) 的默认计算：年收益减无风险利率，均值 / 总体标准差，不年化
+        if year_idx is not None:
+            year_values = values[:, year_idx]
+            year_prev = np.concatenate((np.full((len(values), 1), cash), year_values[:, :-1]), axis=1)
+            year_excess = year_values / year_prev - 1.0 - riskfreerate
+            year_std = year_excess.std(axis=1)
+            metrics['sharpe_ratio'] = np.where(year_std > TINY, year_excess.mean(axis=1) / year_std, np.nan)
+        else:
+            metrics['sharpe_ratio'] = np.full(len(values), np.nan)
+
+        # DrawDown 分析器：峰值从初始资金开始计，持续长度在回到峰值时清零
+        peak = np.maximum.accumulate(np.concatenate((np.full((len(values), 1), cash), values), axis=1),
+                                     axis=1)[:, 1:]
+        drawdown = 100.0 * (peak - values) / peak
+    metrics['max_drawdown'] = drawdown.max(axis=1)
+    index = np.arange(n)
+    last_peak = np.maximum.accumulate(np.where(drawdown == 0, index, -1), axis=1)
+    metrics['max_drawdown_duration'] = (index - last_peak).max(axis=1)
+    return metrics
+
+
+def _trade_metrics(trades, n_runs, n_bars):
+    run, entry, exit, pnl = trades['run'], trades['entry'], trades['exit'], trades['pnl']
+    closed = exit >= 0
+    won = closed & (pnl >= 0)  # 与 TradeAnalyzer 一致：净盈亏为 0 也算盈利
+    lost = closed & ~won
+    total = np.bincount(run[closed], minlength=n_runs)
+    gross_profit = np.bincount(run[won], weights=pnl[won], minlength=n_runs)
+    gross_loss = np.abs(np.bincount(run[lost], weights=pnl[lost], minlength=n_runs))
+    held = np.bincount(run, weights=np.where(closed, exit, n_bars) - entry, minlength=n_runs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'total_trades': total,
+            'win_rate': np.where(total > 0, np.bincount(run[won], minlength=n_runs) / total * 100, 0.0),
+            'profit_factor': np.where(gross_loss > 0, gross_profit / gross_loss, np.inf),
+            'exposure': held / n_bars * 100,
+        }
+
+
+def compute_metrics(equity, trades=None, dates=None, cash=100000.0, riskfreerate=0.01, periods_per_year=252,
+                    chunk_size=CHUNK_SIZE):
+    # equity：一条资金曲线 (bar 数,) 或多条 (运行数, bar 数)；trades：make_trades / concat_trades 的结果
+    # dates：bar 的日期，用于 CAGR 的年数和年度夏普比率；没有时按 periods_per_year 折算年数
+    # 返回 {指标名: 长度为运行数的数组}
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.ndim == 1:
+        equity = equity[None, :]
+    n_runs, n_bars = equity.shape
+    if dates is not None:
+        dates = pd.DatetimeIndex(dates)
+        years = (dates[-1] - dates[0]).days / 365.25
+        year_idx = year_end_index(dates)
+    else:
+        years, year_idx = n_bars / periods_per_year, None
+    chunks = [_curve_metrics(equity[i:i + chunk_size], year_idx, cash, riskfreerate, periods_per_year, years)
+              for i in range(0, n_runs, chunk_size)]
+    metrics = {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+    if trades is not None:
+        metrics.update(_trade_metrics(trades, n_runs, n_bars))
+    return metrics
+
+
+def run_metrics(equity, trades=None, dates=None, **kwargs):
+    # 单次运行：返回 {指标名: 数值}
+    metrics = compute_metrics(equity, trades, dates, **kwargs)
+    return {k: v[0].item() for k, v in metrics.items()}
+
+
+def sweep_metrics(records, dates=None, cash=100000.0, **kwargs):
+    # records：带 'equity' (以及可选 'trades') 的优化记录列表 (opt_runner / result_store / vector_sma，keep_equity=True)
+    # 返回每个参数组合一行的 DataFrame：参数列 + 全部指标
+    records = list(records)
+    params = pd.DataFrame([{k: v for k, v in r.items() if k not in RESULT_FIELDS and np.ndim(v) == 0}
+                           for r in records])
+    has_trades = all('trades' in r for r in records)
+    parts = []
+    for i in range(0, len(records), CHUNK_SIZE):
+        chunk = records[i:i + CHUNK_SIZE]
+        trades = concat_trades([r['trades'] for r in chunk]) if has_trades else None
+        parts.append(compute_metrics(np.stack([r['equity'] for r in chunk]), trades, dates, cash=cash, **kwargs))
+    metrics = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return pd.concat([params, pd.DataFrame(metrics)], axis=1)
+
+
+def format_metrics(metrics):
+    # 与脚本里的结果汇总放在一起打印
+    lines = ["--- 回测指标 ---"]
+    for key, label in METRIC_LABELS.items():
+        if key not in metrics:
+            continue
+        value = metrics[key]
+        text = str(value) if isinstance(value, (int, np.integer)) else f"{value:.4f}"
+        lines.append(f"  {label}: {text}")
+    return '\n'.join(lines)
+
+
+def print_metrics(metrics):
+    print(format_metrics(metrics))
+
+
+def downsample_minmax(values, max_points=2000):
+    # 降采样后要画的点的序号：分成 max_points / 2 个桶，每个桶保留最小值和最大值所在的点，再加上首尾两点
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    width = -(-n // buckets)
+    padded = np.concatenate((values, np.full(buckets * width - n, values[-1]))).reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    index = np.concatenate(([0, n - 1], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)))
+    return np.unique(np.minimum(index, n - 1))
+
+
+def plot_equity(equity, dates=None, labels=None, max_points=2000, ax=None):
+    # 一条或多条资金曲线，每条降采样到最多约 max_points 个点
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.ndim == 1:
+        equity = equity[None, :]
+    if ax is None:
+        _, ax = plt.subplots(figsize=(12, 5))
+    x = np.asarray(pd.DatetimeIndex(dates)) if dates is not None else np.arange(equity.shape[1])
+    labels = labels if labels is not None else [None] * len(equity)
+    for values, label in zip(equity, labels):
+        index = downsample_minmax(values, max_points)
+        ax.plot(x[index], values[index], linewidth=1, label=label)
+    # 默认字体没有中文字形，图上的文字用英文
+    ax.set_title("Equity curve")
+    ax.set_ylabel("Portfolio value")
+    if any(label is not None for label in labels):
+        ax.legend(loc='upper left', fontsize='small')
+    ax.grid(True, alpha=0.3)
+    return ax
+
+
+def plot_heatmap(table, metric, x='slow_length', y='fast_length', ax=None, annotate=None, cmap='RdYlGn'):
+    # table：sweep_metrics 的结果 (或任何含 x / y / metric 列的表)；同一格有多条记录时取平均
+    grid = table.pivot_table(index=y, columns=x, values=metric, aggfunc='mean')
+    if ax is None:
+        _, ax = plt.subplots(figsize=(max(6, 0.5 * grid.shape[1] + 2), max(4, 0.4 * grid.shape[0] + 1)))
+    data = grid.to_numpy(dtype=np.float64)
+    finite = np.where(np.isfinite(data), data, np.nan)
+    # max_drawdown 之类越小越好的指标反转颜色
+    image = ax.imshow(finite, aspect='auto', origin='lower',
+                      cmap=cmap + '_r' if metric in ('max_drawdown', 'max_drawdown_duration') else cmap)
+    ax.figure.colorbar(image, ax=ax, label=metric)
+    # 网格很大时每隔几格标一个刻度
+    xstep, ystep = max(1, grid.shape[1] // 10), max(1, grid.shape[0] // 10)
+    ax.set_xticks(np.arange(0, grid.shape[1], xstep), labels=grid.columns[::xstep])
+    ax.set_yticks(np.arange(0, grid.shape[0], ystep), labels=grid.index[::ystep])
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(metric)
+    if annotate if annotate is not None else data.size <= 100:
+        for (i, j), value in np.ndenumerate(data):
+            ax.text(j, i, f"{value:.2f}", ha='center', va='center', fontsize=7)
+    return ax
+
+
+def sweep_report(records, dates=None, metrics=('sharpe_ratio', 'cagr', 'max_drawdown'), sort_by='rtot', top_n=5,
+                 x='slow_length', y='fast_length', max_points=2000, **kwargs):
+    # 整个参数网格的报告：指标表 + 各指标的热力图 + 按 sort_by 排名前 top_n 的资金曲线
+    # 返回 (指标表, matplotlib Figure)，保存图片用 fig.savefig(...)
+    records = list(records)
+    table = sweep_metrics(records, dates, **kwargs)
+    fig, axes = plt.subplots(1, len(metrics) + 1, figsize=(6 * (len(metrics) + 1), 5))
+    for ax, metric in zip(axes, metrics):
+        plot_heatmap(table, metric, x=x, y=y, ax=ax)
+    top = table.sort_values(sort_by, ascending=False).index[:top_n]
+    plot_equity(np.stack([records[i]['equity'] for i in top]), dates,
+                labels=[f"{y}={table.at[i, y]}, {x}={table.at[i, x]}" for i in top], max_points=max_points,
+                ax=axes[-1])
+    fig.tight_layout()
+    return table, fig
+
+
+if __name__ == '__main__':
+    import time
+
+    from data_cache import load_price_csv
+    from vector_sma import run_vector_grid
+
+    # 10,000 组参数的报告：向量化引擎跑完网格后，指标计算和作图只需几秒
+    df = load_price_csv("GC=F_historical_data.csv")
+    t0 = time.perf_counter()
+    records = run_vector_grid(df, range(5, 105), range(110, 310, 2), keep_equity=True)
+    print(f"向量化回测 {len(records)} 组参数: {time.perf_counter() - t0:.2f} 秒")
+    t0 = time.perf_counter()
+    table = sweep_metrics(records, df.index)
+    print(f"计算全部指标: {time.perf_counter() - t0:.2f} 秒")
+    t0 = time.perf_counter()
+    table, fig = sweep_report(records, df.index)
+    fig.savefig('sweep_report.png', dpi=150)
+    print(f"指标 + 热力图 + 资金曲线并保存到 sweep_report.png: {time.perf_counter() - t0:.2f} 秒")
+    print(table.sort_values('rtot', ascending=False).head(10).to_string(index=False))
@@ -0,0 +1,150 @@
+# 回测结果的本地持久化存储 (SQLite)
+# 每次改动后重新运行 SMA_Opt_Strategy.py，75 个参数组合都会重新计算，哪怕数据文件和大部分参数都没变。
+# 这里把每次完成的回测按以下内容的哈希作为键存进 SQLite：
+#   数据指纹、策略类源码、参数、初始资金、佣金
+# 运行前先查表，命中就直接返回 (含分析器汇总，可选资金曲线)；网格不变或扩大时只计算缺失的组合。
+# 也可以直接查询已有结果做排序。
+import hashlib
+import inspect
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from indicator_cache import data_fingerprint
+from opt_runner import iter_optimize
+
+STORE_FILE = '.backtest_results.sqlite'
+
+# 单独存成列的汇总字段，方便用 SQL 排序
+SUMMARY_FIELDS = ('rtot', 'total_trades', 'sharpe_ratio', 'max_drawdown')
+
+
+def strategy_source(strategy_cls):
+    # 策略类的源码；在笔记本或交互环境中定义、取不到源码时退回类的完整名称
+    try:
+        return inspect.getsource(strategy_cls)
+    except (OSError, TypeError):
+        return f"{strategy_cls.__module__}.{strategy_cls.__qualname__}"
+
+
+def run_key(strategy_cls, data_fp, params, cash, commission):
+    payload = json.dumps({
+        'data': data_fp,
+        'strategy': strategy_source(strategy_cls),
+        'params': params,
+        'cash': cash,
+        'commission': commission,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                key TEXT PRIMARY KEY,
+                strategy TEXT NOT NULL,
+                data_fp TEXT NOT NULL,
+                params TEXT NOT NULL,
+                cash REAL NOT NULL,
+                commission REAL NOT NULL,
+                rtot REAL,
+                total_trades INTEGER,
+                sharpe_ratio REAL,
+                max_drawdown REAL,
+                record TEXT NOT NULL,
+                equity BLOB,
+                created_at REAL NOT NULL
+            )""")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key, with_equity=False):
+        # 命中返回记录 dict (with_equity=True 且存过资金曲线时附带 'equity')，否则返回 None
+        row = self.conn.execute("SELECT record, equity FROM runs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        if with_equity and row[1] is not None:
+            record['equity'] = np.frombuffer(row[1], dtype=np.float64)
+            if 'trades' in record:
+                record['trades'] = {k: np.asarray(v, dtype=np.float64 if k == 'pnl' else np.int64)
+                                    for k, v in record['trades'].items()}
+        else:
+            record.pop('trades', None)
+        return record
+
+    def put(self, key, strategy_cls, data_fp, params, cash, commission, record):
+        record = dict(record)
+        record.pop('profile', None)  # 性能剖析只属于那一次运行，不存
+        equity = record.pop('equity', None)
+        blob = None if equity is None else np.asarray(equity, dtype=np.float64).tobytes()
+        if 'trades' in record:
+            # 交易列表随资金曲线一起保存，数组转成列表存进 JSON
+            record['trades'] = {k: np.asarray(v).tolist() for k, v in record['trades'].items()}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, strategy_cls.__qualname__, data_fp, json.dumps(params, sort_keys=True, default=str),
+             cash, commission, *(record.get(f) for f in SUMMARY_FIELDS),
+             json.dumps(record, default=str), blob, time.time()))
+        self.conn.commit()
+
+    def top(self, metric='rtot', n=10, strategy=None, data_fp=None):
+        # 按某个汇总字段从高到低排序，返回前 n 条记录
+        if metric not in SUMMARY_FIELDS:
+            raise ValueError(f"只能按 {SUMMARY_FIELDS} 排序")
+        sql = f"SELECT record FROM runs WHERE {metric} IS NOT NULL"
+        args = []
+        if strategy is not None:
+            sql += " AND strategy = ?"
+            args.append(strategy if isinstance(strategy, str) else strategy.__qualname__)
+        if data_fp is not None:
+            sql += " AND data_fp = ?"
+            args.append(data_fp)
+        sql += f" ORDER BY {metric} DESC LIMIT ?"
+        args.append(n)
+        return [json.loads(row[0]) for row in self.conn.execute(sql, args)]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+
+def cached_optimize(store, strategy_cls, df, grid, cash=100000.0, commission=0.0001,
+                    keep_equity=False, profile_index=None, **kwargs):
+    # 生成器：先从 store 中取出已完成的组合，只把缺失的组合交给 opt_runner 计算，
+    # 新结果一完成就写入 store。每条记录带 'cached' 字段标明是否命中缓存
+    # profile_index 为 grid 中要做性能剖析的组合序号：这一组即使已有缓存也重新计算
+    data_fp = data_fingerprint(df)
+    missing = []
+    missing_profile_index = None
+    for index, params in enumerate(grid):
+        key = run_key(strategy_cls, data_fp, params, cash, commission)
+        record = None if index == profile_index else store.get(key, with_equity=keep_equity)
+        if record is not None and (not keep_equity or 'equity' in record):
+            record['cached'] = True
+            yield record
+        else:
+            if index == profile_index:
+                missing_profile_index = len(missing)
+            missing.append(params)
+    if not missing:
+        return
+    for record in iter_optimize(strategy_cls, df, missing, cash=cash, commission=commission,
+                                keep_equity=keep_equity, profile_index=missing_profile_index, **kwargs):
+        params = {k: record[k] for k in missing[0]}
+        store.put(run_key(strategy_cls, data_fp, params, cash, commission),
+                  strategy_cls, data_fp, params, cash, commission, record)
+        record['cached'] = False
+        yield record
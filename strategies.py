@@ -0,0 +1,317 @@
+# 笔记本中的策略类
+# BOLL_Strategy.ipynb / MACD_Strategy.ipynb / RSI_Strategy.ipynb / Momentum_Strategy.ipynb 使用的策略，
+# 只在这里定义一次：笔记本通过 from strategies import ... 使用，基准测试、批量回测等脚本也直接 import，
+# 与它们做一致性检查的永远是同一份代码
+import backtrader as bt
+
+
+# 来自 BOLL_Strategy.ipynb
+class BOLL_Strategy(bt.Strategy):
+    # 定义参数
+    params = (
+        ('boll_period', 20),
+        ('boll_devfactor', 2.0))
+
+    def __init__(self):
+        self.order = None
+        self.buy_price = None
+        self.comm = None
+
+        self.dataclose = self.datas[0].close
+        self.boll = bt.indicators.BollingerBands(
+            self.dataclose, 
+            period=self.p.boll_period, 
+            devfactor=self.p.boll_devfactor)
+        
+    def notify_order(self, order):
+        if order.status in [order.Submitted, order.Accepted]:
+            return
+        # 如果订单是完成状态 (买入/卖出)
+        if order.status in [order.Completed]:
+            if order.isbuy():
+                self.buyprice = order.executed.price
+                self.comm = order.executed.comm
+                print(f"买入执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+            elif order.issell():
+                print(f"卖出执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+            self.bar_executed = len(self) # 记录订单执行时的 bar 数量
+        # 如果订单是取消、保证金不足、拒绝等状态
+        elif order.status in [order.Canceled, order.Margin, order.Rejected]:
+            print(f"订单状态: {order.Status[order.status]} - 日期: {self.data.datetime.date()}")
+        self.order = None
+
+    def notify_trade(self, trade):
+        # 交易完成（平仓）时调用
+        if not trade.isclosed:
+            return
+        print(f"交易完成 - 毛利润: {trade.pnl:.2f}, 净利润: {trade.pnlcomm:.2f}")
+
+    def next(self):
+        current_close = self.dataclose[0]
+        last_close = self.dataclose[-1]
+        boll_top = self.boll.top[0]
+        last_boll_top = self.boll.top[-1]
+        boll_mid = self.boll.mid[0]
+        boll_bot = self.boll.bot[0]
+        last_boll_bot = self.boll.bot[-1]
+
+        # ====买入规则====
+        if not self.position:
+            if current_close <= boll_bot and last_close >= last_boll_bot:
+                self.order = self.buy(size=10) # 假设买入10个单位
+                print(f"发出买入信号(穿下线) - 日期：{self.data.datetime.date()}," 
+                      f"收盘：{current_close:.2f} - 布林下线：{boll_bot:.2f} - 布林中线{boll_mid:.2f}")
+        # ====卖出规则====
+        else:
+            if current_close >= boll_top and last_close <= last_boll_top:
+                self.order = self .close() # 平仓所有仓位 
+                print(f"发出平仓信号(穿上线) - 日期：{self.data.datetime.date()}," 
+                      f"收盘：{current_close:.2f} - 布林上线：{boll_top:.2f} - 布林中线{boll_mid:.2f}")
+
+        # ====特殊情况====
+        if self.p.boll_period > len(self):
+            return
+        if self.order:
+            return
+
+
+# 来自 MACD_Strategy.ipynb
+class MACD_Strategy(bt.Strategy):
+    # 定义策略的参数
+    params = (('macd_fast', 14),
+              ('macd_slow', 26),
+              ('macd_signal', 9))
+                 
+    def __init__(self):
+        # 记录收盘价，方便后续使用
+        self.dataclose = self.datas[0].close
+        # 用来跟踪未完成的订单
+        self.order = None
+        self.buyprice = None # 记录买入价格
+        self.comm = None     # 记录佣金
+        self.macd = bt.indicators.MACD(self.data,
+                                       period_me1=self.p.macd_fast,
+                                       period_me2=self.p.macd_slow,
+                                       period_signal=self.p.macd_signal)
+        self.macd_hist = self.macd.macd - self.macd.signal
+
+    def notify_order(self, order):
+        if order.status in [order.Submitted, order.Accepted]:
+            return
+        # 如果订单是完成状态 (买入/卖出)
+        if order.status in [order.Completed]:
+            if order.isbuy():
+                self.buyprice = order.executed.price
+                self.comm = order.executed.comm
+                print(f"买入执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+            elif order.issell():
+                print(f"卖出执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+            self.bar_executed = len(self) # 记录订单执行时的 bar 数量
+        # 如果订单是取消、保证金不足、拒绝等状态
+        elif order.status in [order.Canceled, order.Margin, order.Rejected]:
+            print(f"订单状态: {order.Status[order.status]} - 日期: {self.data.datetime.date()}")
+        self.order = None
+
+    def notify_trade(self, trade):
+        # 交易完成（平仓）时调用
+        if not trade.isclosed:
+            return
+        print(f"交易完成 - 毛利润: {trade.pnl:.2f}, 净利润: {trade.pnlcomm:.2f}")
+        
+    def next(self):        
+        current_close = self.dataclose[0]
+        macd_line = self.macd.macd[0]
+        last_macd_line = self.macd.macd[-1]
+        macd_signal_line = self.macd.signal[0]
+        last_macd_signal_line = self.macd.signal[-1]
+
+        # ====买入信号====
+        if not self.position:
+            if macd_line > macd_signal_line and last_macd_line < last_macd_signal_line:
+                self.order = self.buy(size=10) # 假设买入10个单位
+                print(f"发出买入信号 - 日期: {self.data.datetime.date()}, "
+                      f"收盘: {current_close:.2f}, MACD: {macd_line:.2f}, 信号: {macd_signal_line:.2f}")
+        # ====卖出信号====
+        else:
+            if macd_line < macd_signal_line and last_macd_line > last_macd_signal_line:
+                self.order = self.close() # 平仓所有持仓
+                print(f"发出卖出信号 - 日期: {self.data.datetime.date()}, "
+                      f"收盘: {current_close:.2f}, MACD: {macd_line:.2f}, 信号: {macd_signal_line:.2f}")
+                
+        # ====特殊情况====
+        max_period = max(self.p.macd_slow, self.p.macd_signal)                
+        if len(self) < max_period:
+            return
+        if self.order:
+            return
+
+
+# 来自 RSI_Strategy.ipynb
+class RSI_Strategy(bt.Strategy):
+    params = (
+        ('rsi_period', 14), 
+        ('oversold', 30),  # 超卖区
+        ('overbought', 70)  # 超买区
+    )
+    def __init__(self):
+        self.order = None
+        self.buy_price = None
+        self.comm = None
+        self.dataclose = self.datas[0].close
+        self.rsi = bt.indicators.RSI_EMA(
+            self.dataclose, 
+            period=self.p.rsi_period
+        )
+
+    def notify_order(self, order):
+        if order.status in [order.Submitted, order.Accepted]:
+            return
+        # 如果订单是完成状态 (买入/卖出)
+        if order.status in [order.Completed]:
+            if order.isbuy():
+                self.buyprice = order.executed.price
+                self.comm = order.executed.comm
+                print(f"买入执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f} \n ----")
+            elif order.issell():
+                print(f"卖出执行 - 日期: {self.data.datetime.date()}, 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f} \n ----")
+            self.bar_executed = len(self) # 记录订单执行时的 bar 数量
+        # 如果订单是取消、保证金不足、拒绝等状态
+        elif order.status in [order.Canceled, order.Margin, order.Rejected]:
+            print(f"订单状态: {order.Status[order.status]} - 日期: {self.data.datetime.date()}")
+        self.order = None
+
+    def notify_trade(self, trade):
+        # 交易完成（平仓）时调用
+        if not trade.isclosed:
+            return
+        print(f"交易完成 - 毛利润: {trade.pnl:.2f}, 净利润: {trade.pnlcomm:.2f} \n ========")
+
+    def next(self):
+        current_rsi = self.rsi[0]
+        current_close = self.dataclose[0]
+        # ====买入信号====
+        if not self.position:
+            if current_rsi < self.p.oversold:
+                self.order = self.buy(size=10)
+                print(f"======== \n 发出买入信号 - 日期：{self.data.datetime.date()}, 收盘：{current_close:.2f}, RSI：{current_rsi:.2f}")
+        # ====卖出信号====
+        else:
+            if current_rsi > self.p.overbought:
+                self.order = self.close()
+                print(f"发出卖出信号 - 日期：{self.data.datetime.date()}, 收盘：{current_close:.2f}, RSI：{current_rsi:.2f}")
+
+        # ====特殊情况====
+        if self.p.rsi_period > len(self):
+            return
+        if self.order is not None:
+            return
+
+
+# 来自 Momentum_Strategy.ipynb
+class RelativeMomentumStrategy(bt.Strategy):
+    params = (
+        ('momentum_period', 30 * 4),
+        ('top_n', 1),
+        ('rebalance_months', [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12] ),
+        ('long_only_momentum_threshold', 0.0))
+
+    def __init__(self):      
+        self.momenta = []
+        for i, data in enumerate(self.datas):
+            self.momenta.append(bt.indicators.ROC100(data.close, period=self.p.momentum_period))
+        # 初始化再平衡月份
+        self.last_rebalance_month = None
+        self.order = None
+
+    def notify_order(self, order):
+        if order.status in [order.Submitted, order.Accepted]:
+            # 订单已提交或被接受，等待执行
+            return
+        # 订单完成 (买入/卖出)
+        if order.status in [order.Completed]:
+            if order.isbuy():
+                print(f"买入执行 - {order.data._name} - 日期: {self.data.datetime.date()}, "
+                      f"价格: {order.executed.price:.2f}, 数量: {order.executed.size:.0f}, "
+                      f"成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+            elif order.issell():
+                print(f"卖出执行 - {order.data._name} - 日期: {self.data.datetime.date()}, "
+                      f"价格: {order.executed.price:.2f}, 数量: {order.executed.size:.0f}, "
+                      f"成本: {order.executed.value:.2f}, 佣金: {order.executed.comm:.2f}")
+        # 订单取消、保证金不足、拒绝等状态
+        elif order.status in [order.Canceled, order.Margin, order.Rejected]:
+            print(f"订单状态: {order.Status[order.status]} - {order.data._name} - 日期: {self.data.datetime.date()}")
+        # 重置 self.order，以便可以发出新的订单
+        # 注意：在多资产策略中，此处的 self.order 仅代表最近一个订单，
+        # 如果需要更复杂的订单管理，需要维护一个订单列表或字典。
+        self.order = None
+
+    def notify_trade(self, trade):
+        # 交易完成（平仓）时调用
+        if not trade.isclosed:
+            return
+        print(f"交易完成 - {trade.data._name} - 毛利润: {trade.pnl:.2f}, 净利润: {trade.pnlcomm:.2f}")
+
+    def next(self):
+        # ====确保有足够数据====
+        if any(len(self.data) < self.p.momentum_period for data in self.datas):
+            return
+        # 如果有未完成的订单，等待其完成 (简化的处理方式，在复杂多资产中可能需要更细致的判断)
+        if self.order and self.order.status in [self.order.Submitted, self.order.Accepted]:
+            return
+        
+        # ====判断是否为再平衡周期
+        current_month = self.datetime.date().month
+        if current_month in self.p.rebalance_months and current_month != self.last_rebalance_month:
+            # 重置上一次再平衡月份
+            self.last_rebalance_month = current_month
+            ranked_assets = []
+            for i, data in enumerate(self.datas):
+                # 再次检查数据是否准备好，确保指标有值
+                if len(data) < self.p.momentum_period:
+                    continue # 如果这个数据源还没准备好，跳过它
+                momentum_value = self.momenta[i][0] # 获取当前动量值
+                # 只有当动量值大于我们定义的最低阈值时，才考虑这个资产
+                if momentum_value > self.p.long_only_momentum_threshold:
+                    ranked_assets.append((momentum_value, data))
+            # 根据动量值从高到低排序
+            ranked_assets.sort(key=lambda x: x[0], reverse=True)
+            # ====确定目标资产====
+            # 选出动量最高的 N 个资产
+            target_assets = [item[1] for item in ranked_assets[:self.p.top_n]]
+            # 打印当前所有资产的动量 (调试用)
+            print(f"--- {self.datetime.date()} - 再平衡开始 ---")
+            for m_val, data_item in ranked_assets:
+                print(f"  资产: {data_item._name}, 动量: {m_val:.2f}%")
+            print(f"  目标资产: {[data._name for data in target_assets]}")
+            # ====卖出/平仓逻辑 (先处理要卖出的) ====
+            # 遍历当前所有持仓
+            for data in self.datas: # 遍历所有可能持有或想持有的数据源
+                # 检查这个数据源是否有持仓
+                if self.getposition(data).size > 0: # 如果对这个资产有持仓
+                    # 并且这个资产不在我们的目标资产列表中
+                    if data not in target_assets:
+                        self.close(data=data) # 平仓这个资产
+                        print(f"  平仓: {data._name} - 不再是目标资产")
+            # ====买入逻辑 (再处理要买入的) ====
+            # 为了简化，我们假设将所有可用资金分配给选中的资产
+            # 如果选了多个，就均分
+            if target_assets: # 确保有目标资产可以买入
+                cash_per_asset = self.broker.getcash() / len(target_assets)
+                for data in target_assets:
+                    # 如果还没有持仓，就买入
+                    if self.getposition(data).size == 0:
+                        # 计算可以买入的股数（为了简单，这里直接买入，你可以考虑更多细节）
+                        # 确保有足够的资金
+                        if cash_per_asset > data.close[0]:
+                            # 计算可买入的整数股数
+                            size_to_buy = int(cash_per_asset // data.close[0])
+                            if size_to_buy > 0: # 确保计算出来的数量大于0
+                                self.buy(data=data, size=size_to_buy)
+                                print(f"  执行买入: {data._name}, 数量: {size_to_buy:.0f} @ {data.close[0]:.2f}")
+                    # else: 已经持有目标资产，不需要操作 (或者可以考虑再平衡持仓比例)
+            else: # 如果没有目标资产（所有资产动量都小于阈值），保持空仓
+                 print("  所有资产动量均不符合要求，保持空仓。")
+        # ----------------------------------------------------
+        # 如果不是再平衡时间，我们也可以在这里加入其他逻辑，例如止损
+        # 但对于相对动量策略，通常只在再平衡时进行交易决策
+        # ----------------------------------------------------
@@ -0,0 +1,92 @@
+# 批量回测的每个标的结果与单独跑 Cerebro 一致，各标的的日期不完全对齐 (随机缺失部分 bar、上市日期不同)
+# 运行: python -m unittest discover -s tests
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import strategies  # noqa: E402
+from batch_backtest import RULES, batch_backtest  # noqa: E402
+from benchmark import synthetic_ohlcv  # noqa: E402
+
+
+def gapped_frames(n_tickers=4, n_bars=1200, drop=0.03, seed=7):
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for k in range(n_tickers):
+        df = synthetic_ohlcv(n_bars, seed=seed + k, start_price=40.0 + 25 * k)
+        keep = rng.random(n_bars) > drop
+        # 后两个标的晚一些上市
+        keep[:k * 60 if k >= n_tickers - 2 else 0] = False
+        frames[f'T{k}'] = df[keep]
+    return frames
+
+
+def cerebro_stats(strategy_cls, df):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=df))
+    cerebro.broker.setcash(100000.0)
+    cerebro.broker.setcommission(commission=0.0001)
+    cerebro.addstrategy(strategy_cls)
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+    cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
+    with contextlib.redirect_stdout(io.StringIO()):
+        s = cerebro.run()[0]
+    trades = s.analyzers.trade_analyzer.get_analysis()
+    closed = trades.total.closed if 'total' in trades and 'closed' in trades.total else 0
+    return {
+        'final_value': cerebro.broker.getvalue(),
+        'rtot': s.analyzers.returns_analyzer.get_analysis()['rtot'],
+        'total_trades': closed,
+        'won': trades.won.total if closed else 0,
+        'sharpe_ratio': s.analyzers.sharpe_ratio.get_analysis().get('sharperatio'),
+        'max_drawdown': s.analyzers.drawdown.get_analysis().max.drawdown,
+    }
+
+
+class BatchBacktestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.frames = gapped_frames()
+
+    def test_per_ticker_matches_cerebro_on_gapped_panel(self):
+        lengths = {len(df) for df in self.frames.values()}
+        self.assertGreater(len(lengths), 1)
+        for name in RULES:
+            per_ticker = batch_backtest(self.frames, name)['per_ticker']
+            for ticker, df in self.frames.items():
+                ref = cerebro_stats(getattr(strategies, name), df)
+                row = per_ticker.loc[ticker]
+                with self.subTest(strategy=name, ticker=ticker):
+                    self.assertEqual(row['total_trades'], ref['total_trades'])
+                    self.assertEqual(row['won'], ref['won'])
+                    self.assertAlmostEqual(row['final_value'], ref['final_value'], places=6)
+                    self.assertAlmostEqual(row['rtot'], ref['rtot'], places=9)
+                    self.assertAlmostEqual(row['max_drawdown'], ref['max_drawdown'], places=6)
+                    if ref['sharpe_ratio'] is None:
+                        self.assertIsNone(row['sharpe_ratio'])
+                    else:
+                        self.assertAlmostEqual(row['sharpe_ratio'], ref['sharpe_ratio'], places=9)
+
+    def test_aggregate_is_sum_of_ticker_accounts(self):
+        result = batch_backtest(self.frames, 'RSI_Strategy', keep_equity=True)
+        ticker_equity = result['ticker_equity']
+        np.testing.assert_allclose(result['equity'].to_numpy(), ticker_equity.sum(axis=1).to_numpy())
+        # 每个标的在自己最后一根 bar 之后沿用最后的资金
+        for ticker, df in self.frames.items():
+            self.assertAlmostEqual(ticker_equity[ticker].loc[df.index[-1]],
+                                   result['per_ticker'].loc[ticker, 'final_value'])
+        self.assertEqual(result['aggregate']['total_trades'], result['per_ticker']['total_trades'].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
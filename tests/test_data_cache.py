@@ -0,0 +1,68 @@
+# CSV 列式缓存：缓存按源文件的绝对路径区分，清理旧版本时不会误删其他文件的缓存
+# 运行: python -m unittest discover -s tests
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_cache import load_price_csv, read_yf_csv  # noqa: E402
+
+DATA_PATH = os.path.join(ROOT, 'GC=F_historical_data.csv')
+
+
+class LoadPriceCsvTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def copy(self, name, subdir=''):
+        os.makedirs(os.path.join(self.tmp, subdir), exist_ok=True)
+        path = os.path.join(self.tmp, subdir, name)
+        shutil.copyfile(DATA_PATH, path)
+        return path
+
+    def truncate(self, path, rows):
+        # 保留三行表头和前 rows 行数据，模拟源文件被更新
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines(lines[:3 + rows])
+
+    def test_roundtrip(self):
+        path = self.copy('a.csv')
+        pd.testing.assert_frame_equal(load_price_csv(path, self.cache_dir), read_yf_csv(path),
+                                      check_index_type=False, check_freq=False)
+
+    def test_prefix_names_do_not_evict(self):
+        a, a2 = self.copy('a.csv'), self.copy('a-2.csv')
+        self.truncate(a2, 100)
+        load_price_csv(a2, self.cache_dir)
+        load_price_csv(a, self.cache_dir)
+        self.truncate(a, 50)
+        load_price_csv(a, self.cache_dir)
+        # a.csv 的旧版本被清理，a-2.csv 的缓存保留
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertEqual(len(load_price_csv(a2, self.cache_dir)), 100)
+        self.assertEqual(len(load_price_csv(a, self.cache_dir)), 50)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_same_name_in_different_directories(self):
+        x, y = self.copy('data.csv', 'x'), self.copy('data.csv', 'y')
+        self.truncate(y, 30)
+        for _ in range(2):
+            self.assertEqual(len(load_price_csv(x, self.cache_dir)), len(read_yf_csv(DATA_PATH)))
+            self.assertEqual(len(load_price_csv(y, self.cache_dir)), 30)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
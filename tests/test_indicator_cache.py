@@ -0,0 +1,72 @@
+# 预计算指标与 backtrader 原生指标的逐 bar 对比，数据源设置了 fromdate / todate
+# 运行: python -m unittest discover -s tests
+import datetime
+import os
+import sys
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_cache import read_yf_csv  # noqa: E402
+from indicator_cache import IndicatorCache, cached_indicator  # noqa: E402
+
+DATA_PATH = os.path.join(ROOT, 'GC=F_historical_data.csv')
+
+
+class Compare(bt.Strategy):
+    params = (('cache', None),)
+
+    def __init__(self):
+        cache = self.p.cache
+        self.pairs = {
+            'SMA': (cached_indicator(self.data, 'SMA', cache=cache, period=30), bt.ind.SMA(self.data, period=30)),
+            'ATR': (cached_indicator(self.data, 'ATR', cache=cache, period=14), bt.ind.ATR(self.data, period=14)),
+            'RSI_EMA': (cached_indicator(self.data, 'RSI_EMA', cache=cache, period=14),
+                        bt.ind.RSI_EMA(self.data, period=14)),
+        }
+        self.rows = {name: [] for name in self.pairs}
+
+    def next(self):
+        for name, (cached, native) in self.pairs.items():
+            self.rows[name].append((cached[0], native[0]))
+
+
+class CachedIndicatorWindowTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = read_yf_csv(DATA_PATH)
+
+    def run_compare(self, runonce, **feed_kwargs):
+        cerebro = bt.Cerebro(stdstats=False, runonce=runonce)
+        cerebro.adddata(bt.feeds.PandasData(dataname=self.df, **feed_kwargs))
+        cerebro.addstrategy(Compare, cache=IndicatorCache())
+        return cerebro.run()[0].rows
+
+    def assert_matches(self, rows):
+        for name, pairs in rows.items():
+            cached, native = np.array(pairs).T
+            self.assertGreater(len(cached), 0)
+            np.testing.assert_allclose(cached, native, rtol=1e-9, atol=1e-9, err_msg=name)
+
+    def test_fromdate(self):
+        for runonce in (True, False):
+            self.assert_matches(self.run_compare(runonce, fromdate=datetime.datetime(2010, 1, 1)))
+
+    def test_fromdate_todate(self):
+        self.assert_matches(self.run_compare(True, fromdate=datetime.datetime(2012, 6, 1),
+                                             todate=datetime.datetime(2016, 3, 31)))
+
+    def test_unsupported_feeds(self):
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.resampledata(bt.feeds.PandasData(dataname=self.df), timeframe=bt.TimeFrame.Weeks)
+        cerebro.addstrategy(Compare)
+        with self.assertRaises(ValueError):
+            cerebro.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
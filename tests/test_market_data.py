@@ -0,0 +1,117 @@
+# 增量下载只请求缺失区间：上市晚于请求起点的代码 (GC=F 从 2000-08-30 开始) 不会每次刷新都回补开头；
+# 复权基准变化 (拆股、分红) 时整段重新下载，而不是把新旧基准的价格拼在一起
+# 运行: python -m unittest discover -s tests
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import synthetic_ohlcv  # noqa: E402
+from data_cache import read_yf_csv  # noqa: E402
+from market_data import FixtureFetcher, MarketDataStore, normalize_ohlcv  # noqa: E402
+
+
+class IncrementalRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = read_yf_csv(os.path.join(ROOT, 'GC=F_historical_data.csv'))
+        self.fetcher = FixtureFetcher({'GC=F': self.df})
+        self.store = MarketDataStore(root=self.tmp.name, fetcher=self.fetcher, requests_per_second=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def refresh(self, start, end):
+        self.fetcher.calls.clear()
+        report = self.store.refresh(['GC=F'], start, end)['GC=F']
+        self.assertIsNone(report['error'])
+        return [(s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')) for _, s, e in self.fetcher.calls]
+
+    def test_no_repeated_backfill(self):
+        first = self.df.index[0]
+        self.assertGreater(first, pd.Timestamp('2000-01-01'))
+        self.assertEqual(self.refresh('2000-01-01', '2010-01-01'), [('2000-01-01', '2010-01-01')])
+        # 再次刷新只重新请求最后一根 bar 之后的部分
+        # 倒数第二根 bar 一起重新下载，用来对照复权基准
+        anchor = self.store.load('GC=F').index[-2].strftime('%Y-%m-%d')
+        self.assertEqual(self.refresh('2000-01-01', '2011-01-01'), [(anchor, '2011-01-01')])
+        self.assertEqual(self.refresh('2000-01-01', '2011-01-01'), [])
+        # 更早的起点只回补一次，之后记录在 meta.json 中
+        self.assertEqual(self.refresh('1999-01-01', '2011-01-01'), [('1999-01-01', '2000-01-01')])
+        self.assertEqual(self.refresh('1999-01-01', '2011-01-01'), [])
+        self.assertEqual(self.store.coverage_start('GC=F'), pd.Timestamp('1999-01-01'))
+        loaded = self.store.load('GC=F')
+        expected = self.df[self.df.index < pd.Timestamp('2011-01-01')]
+        pd.testing.assert_frame_equal(loaded, expected, check_freq=False, check_index_type=False)
+
+
+
+def old_basis(df, action_date, factor):
+    # 公司行动之前 auto_adjust=True 下载到的样子：action_date 之前的价格还没有除以 factor
+    df = df.copy()
+    before = df.index < action_date
+    df.loc[before, ['Open', 'High', 'Low', 'Close', 'Adj Close']] *= factor
+    df.loc[before, 'Volume'] /= factor
+    return df
+
+
+class AdjustmentBasisTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # 复权后的平滑序列；第 450 根 bar 发生公司行动
+        adjusted = synthetic_ohlcv(600, seed=3, start_price=100.0, start='2020-01-01')
+        adjusted.index = adjusted.index.as_unit('ns')
+        self.adjusted = adjusted.assign(**{'Stock Splits': 0.0, 'Dividends': 0.0})
+        self.action_date = adjusted.index[450]
+        self.fetcher = FixtureFetcher({})
+        self.store = MarketDataStore(root=self.tmp.name, fetcher=self.fetcher, requests_per_second=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check_rebase(self, factor, column=None):
+        # 公司行动之前先下载前 400 根 bar，之后再增量刷新
+        self.fetcher.frames['SPL'] = old_basis(self.adjusted, self.action_date, factor)
+        self.store.refresh(['SPL'], '2020-01-01', self.adjusted.index[400])
+        current = self.adjusted.copy()
+        if column is None:
+            current = current.drop(columns=['Stock Splits', 'Dividends'])
+        else:
+            current.loc[self.action_date, column] = factor if column == 'Stock Splits' else 0.5
+        self.fetcher.frames['SPL'] = current
+        report = self.store.refresh(['SPL'], '2020-01-01', '2030-01-01')['SPL']
+        self.assertIsNone(report['error'])
+        self.assertTrue(report['rebased'])
+        stored = self.store.load('SPL')
+        pd.testing.assert_frame_equal(stored, normalize_ohlcv(current), check_freq=False)
+        # 没有假的暴跌：整段都是同一个复权基准
+        np.testing.assert_allclose(np.diff(np.log(stored['Close'])), np.diff(np.log(self.adjusted['Close'])))
+
+    def test_split_after_last_bar(self):
+        self.check_rebase(10.0, 'Stock Splits')
+
+    def test_dividend_after_last_bar(self):
+        self.check_rebase(1.02, 'Dividends')
+
+    def test_basis_change_without_action_columns(self):
+        # 下载器没有给出 Stock Splits / Dividends 列时，靠对照 bar 的价格变化发现
+        self.check_rebase(10.0)
+
+    def test_unchanged_basis_appends(self):
+        self.fetcher.frames['SPL'] = self.adjusted
+        self.store.refresh(['SPL'], '2020-01-01', self.adjusted.index[400])
+        self.fetcher.calls.clear()
+        report = self.store.refresh(['SPL'], '2020-01-01', '2030-01-01')['SPL']
+        self.assertFalse(report['rebased'])
+        self.assertEqual(len(self.fetcher.calls), 1)
+        pd.testing.assert_frame_equal(self.store.load('SPL'), normalize_ohlcv(self.adjusted), check_freq=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
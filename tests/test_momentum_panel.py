@@ -0,0 +1,74 @@
+# 面板动量引擎与 backtrader 版 RelativeMomentumStrategy 的成交记录、最终资金对比，
+# 各标的的日期不完全对齐 (随机缺失部分 bar、上市日期不同)
+# 运行: python -m unittest discover -s tests
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import backtrader as bt
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import synthetic_ohlcv  # noqa: E402
+from momentum_panel import run_momentum_panel  # noqa: E402
+from strategies import RelativeMomentumStrategy  # noqa: E402
+
+
+class RecordedMomentum(RelativeMomentumStrategy):
+    def __init__(self):
+        super().__init__()
+        self.fills = []
+
+    def notify_order(self, order):
+        super().notify_order(order)
+        if order.status == order.Completed:
+            self.fills.append((order.data.datetime.date(), order.data._name,
+                               order.executed.size, order.executed.price))
+
+
+def gapped_frames(n_tickers=5, n_bars=1500, drop=0.03, seed=1):
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for k in range(n_tickers):
+        df = synthetic_ohlcv(n_bars, seed=seed + k, start_price=50.0 + 20 * k)
+        keep = rng.random(n_bars) > drop
+        # 后两个标的晚一些上市
+        keep[:k * 40 if k >= n_tickers - 2 else 0] = False
+        frames[f'T{k}'] = df[keep]
+    return frames
+
+
+class MomentumPanelTest(unittest.TestCase):
+    def compare(self, frames, **params):
+        cerebro = bt.Cerebro(stdstats=False)
+        for name, df in frames.items():
+            cerebro.adddata(bt.feeds.PandasData(dataname=df), name=name)
+        cerebro.addstrategy(RecordedMomentum, **params)
+        cerebro.broker.setcash(100000.0)
+        cerebro.broker.setcommission(commission=0.0001)
+        with contextlib.redirect_stdout(io.StringIO()):
+            strat = cerebro.run()[0]
+        panel = run_momentum_panel(frames, cash=100000.0, commission=0.0001, **params)
+
+        fills = panel['fills']
+        self.assertFalse(np.isnan(panel['final_value']))
+        self.assertFalse(panel['equity'].isna().any())
+        self.assertGreater(len(fills), 4)
+        self.assertEqual([(d.date(), t, s) for d, t, s in zip(fills['date'], fills['ticker'], fills['size'])],
+                         [(d, t, s) for d, t, s, _ in strat.fills])
+        np.testing.assert_allclose(fills['price'].to_numpy(), [p for *_, p in strat.fills])
+        self.assertAlmostEqual(panel['final_value'], cerebro.broker.getvalue(), places=6)
+
+    def test_gapped_panel(self):
+        self.compare(gapped_frames(), momentum_period=60, top_n=2)
+
+    def test_gapped_panel_top1(self):
+        self.compare(gapped_frames(seed=7, drop=0.1), momentum_period=40, top_n=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
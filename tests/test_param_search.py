@@ -0,0 +1,39 @@
+# TPE 搜索在离散空间上：抽样重复时继续抽，只有组合全部评估过才提前停止
+# 运行: python -m unittest discover -s tests
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import strategies  # noqa: E402
+from data_cache import read_yf_csv  # noqa: E402
+from param_search import space_size, tpe_search  # noqa: E402
+
+
+class TpeSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = read_yf_csv(os.path.join(ROOT, 'GC=F_historical_data.csv')).iloc[-800:]
+
+    def evaluated(self, result, space):
+        return {tuple(r[k] for k in space) for r in result['history']}
+
+    def test_small_space_uses_full_budget(self):
+        space = dict(rsi_period=[10, 14], oversold=[25, 30])
+        self.assertEqual(space_size(space), 4)
+        for seed in range(3):
+            result = tpe_search(strategies.RSI_Strategy, self.df, space, budget=4, seed=seed)
+            self.assertEqual(len(result['history']), 4)
+            self.assertEqual(len(self.evaluated(result, space)), 4)
+
+    def test_stops_when_space_exhausted(self):
+        space = dict(rsi_period=[10, 14, 20], oversold=[25, 30])
+        result = tpe_search(strategies.RSI_Strategy, self.df, space, budget=20, n_startup=2)
+        self.assertEqual(len(result['history']), 6)
+        self.assertEqual(len(self.evaluated(result, space)), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# 结果缓存：第二次运行全部命中缓存；指定 profile_index 的组合强制重新计算并带上剖析结果
+# 运行: python -m unittest discover -s tests
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import strategies  # noqa: E402
+from data_cache import read_yf_csv  # noqa: E402
+from opt_runner import param_grid  # noqa: E402
+from result_store import ResultStore, cached_optimize  # noqa: E402
+
+
+class CachedOptimizeTest(unittest.TestCase):
+    def test_profile_index_recomputes(self):
+        df = read_yf_csv(os.path.join(ROOT, 'GC=F_historical_data.csv')).iloc[:1500]
+        grid = param_grid(rsi_period=[10, 14], oversold=[25, 30])
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ResultStore(os.path.join(tmp, 'runs.sqlite'))
+            kwargs = dict(workers=1, profile_dir=os.path.join(tmp, 'profiles'))
+            first = list(cached_optimize(store, strategies.RSI_Strategy, df, grid, **kwargs))
+            self.assertFalse(any(r['cached'] for r in first))
+            second = list(cached_optimize(store, strategies.RSI_Strategy, df, grid, profile_index=2, **kwargs))
+            recomputed = [r for r in second if not r['cached']]
+            self.assertEqual(len(recomputed), 1)
+            self.assertEqual({k: recomputed[0][k] for k in grid[2]}, grid[2])
+            self.assertIn('profile', recomputed[0])
+            self.assertEqual(len(os.listdir(kwargs['profile_dir'])), 1)
+            store.conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# 向量化引擎与 backtrader 的 cerebro.optstrategy 在 GC=F 的一部分参数网格上结果一致：
+# rtot、已平仓交易次数、夏普比率
+# 运行: python -m unittest discover -s tests
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import backtrader as bt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_cache import read_yf_csv  # noqa: E402
+from vector_sma import run_vector_grid  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from SMA_Opt_Strategy import DualMovingAverage  # noqa: E402
+
+
+class VectorGridParityTest(unittest.TestCase):
+    fast_lengths = (10, 20, 30)
+    slow_lengths = (50, 90, 150)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = read_yf_csv(os.path.join(ROOT, 'GC=F_historical_data.csv')).iloc[-2500:]
+
+    def cerebro_records(self):
+        cerebro = bt.Cerebro(maxcpus=1)
+        cerebro.adddata(bt.feeds.PandasData(dataname=self.df, timeframe=bt.TimeFrame.Days))
+        cerebro.broker.setcash(100000.0)
+        cerebro.broker.setcommission(commission=0.0001)
+        cerebro.optstrategy(DualMovingAverage, fast_length=self.fast_lengths, slow_length=self.slow_lengths)
+        cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trade_analyzer")
+        cerebro.addanalyzer(bt.analyzers.Returns, _name="returns_analyzer", timeframe=bt.TimeFrame.Days)
+        cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe_ratio", timeframe=bt.TimeFrame.Years)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = cerebro.run()
+        records = {}
+        for stratrun in results:
+            s = stratrun[0]
+            trades = s.analyzers.trade_analyzer.get_analysis()
+            records[(s.p.fast_length, s.p.slow_length)] = {
+                'rtot': s.analyzers.returns_analyzer.get_analysis()['rtot'],
+                'total_trades': trades.total.closed if 'total' in trades and 'closed' in trades.total else 0,
+                'sharpe_ratio': s.analyzers.sharpe_ratio.get_analysis().get('sharperatio'),
+            }
+        return records
+
+    def test_grid_matches_optstrategy(self):
+        expected = self.cerebro_records()
+        records = run_vector_grid(self.df, self.fast_lengths, self.slow_lengths,
+                                  size=10, commission=0.0001, initial_cash=100000.0)
+        self.assertEqual(len(records), len(expected))
+        for record in records:
+            ref = expected[(record['fast_length'], record['slow_length'])]
+            with self.subTest(fast_length=record['fast_length'], slow_length=record['slow_length']):
+                self.assertEqual(record['total_trades'], ref['total_trades'])
+                self.assertAlmostEqual(record['rtot'], ref['rtot'], places=9)
+                if ref['sharpe_ratio'] is None:
+                    self.assertIsNone(record['sharpe_ratio'])
+                else:
+                    self.assertAlmostEqual(record['sharpe_ratio'], ref['sharpe_ratio'], places=9)
+        self.assertTrue(any(ref['total_trades'] for ref in expected.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# 拼接后的样本外资金曲线必须是一条可交易的路径：窗口结束时的持仓在下一窗口第一根 bar 开盘价平仓并收佣金
+# 运行: python -m unittest discover -s tests
+import os
+import sys
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_cache import read_yf_csv  # noqa: E402
+from vector_sma import grid_signals  # noqa: E402
+from walk_forward import walk_forward, walk_forward_windows  # noqa: E402
+
+
+def replay(df, summary, windows, size, commission, cash):
+    # 逐 bar 按各窗口选出的参数交易：信号在 t 收盘，t+1 开盘成交；
+    # 窗口最后一根 bar 不再开仓，仍持有的仓位在下一窗口第一根 bar 开盘平仓
+    open_ = df['Open'].to_numpy(dtype=np.float64)
+    close = df['Close'].to_numpy(dtype=np.float64)
+    n = len(close)
+    values, position, pending = [], 0, None
+    for (_, _, start, end), (_, w) in zip(windows, summary.iterrows()):
+        golden, death = grid_signals(close, [(w['fast_length'], w['slow_length'])])
+        for t in range(start, end):
+            if pending == 'buy':
+                cash -= size * open_[t] * (1 + commission)
+                position = size
+            elif pending == 'sell':
+                cash += size * open_[t] * (1 - commission)
+                position = 0
+            pending = None
+            last = t == end - 1 and end < n
+            if position == 0 and golden[0, t] and not last and t < n - 1:
+                pending = 'buy'
+            elif position and (death[0, t] or last) and t < n - 1:
+                pending = 'sell'
+            values.append(cash + position * close[t])
+    return np.asarray(values)
+
+
+class WalkForwardTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = read_yf_csv(os.path.join(ROOT, 'GC=F_historical_data.csv')).iloc[-1500:]
+        cls.kwargs = dict(train_bars=500, test_bars=120, workers=1, size=10, commission=0.001, cash=100000.0)
+        cls.summary, cls.equity = walk_forward(cls.df, range(10, 31, 10), range(40, 101, 30), **cls.kwargs)
+        cls.windows = walk_forward_windows(len(cls.df), 500, 120)
+
+    def test_stitched_equity_matches_tradable_replay(self):
+        expected = replay(self.df, self.summary, self.windows, 10, 0.001, 100000.0)
+        np.testing.assert_allclose(self.equity.to_numpy(), expected, rtol=1e-12)
+        self.assertTrue(self.summary['forced_exit'].any())
+
+    def test_window_pnl_is_realized(self):
+        # 每个窗口都从空仓开始：第一根 bar 收盘时账户里只有现金，等于前面各窗口已实现盈亏的累计
+        offsets = 100000.0 + self.summary['test_pnl'].cumsum().to_numpy()
+        first = self.windows[0][2]
+        for (_, _, start, _), offset in zip(self.windows[1:], offsets[:-1]):
+            self.assertAlmostEqual(self.equity.iloc[start - first], offset, places=6)
+        self.assertAlmostEqual(self.equity.iloc[-1], offsets[-1], places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
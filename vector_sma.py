@@ -0,0 +1,172 @@
+# 双均线策略的向量化回测引擎
+# 与 SMA_Opt_Strategy.py 中 backtrader 的 DualMovingAverage 逐 bar 回测保持相同的成交规则：
+#   - 第 t 根 bar 收盘后出现金叉/死叉信号，订单在第 t+1 根 bar 的开盘价成交
+#   - 只做多，每次买入固定 size 个单位，死叉时平仓
+#   - 佣金按成交金额的比例收取 (与 cerebro.broker.setcommission(commission=...) 一致)
+# 同时复现 Returns 分析器的 rtot (对数总收益) 和 SharpeRatio(timeframe=Years) 的计算方式，
+# 这样可以先用它快速筛选大规模参数网格，再把最优参数交给 cerebro_best 做完整回放。
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def sma_table(close, periods):
+    # 用累计和一次性算出所有周期的简单移动平均线，返回 {周期: 数组}
+    # 前 period-1 个位置没有足够数据，填充 NaN (与 backtrader 指标的 minperiod 一致)
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    csum = np.concatenate(([0.0], np.cumsum(close)))
+    table = {}
+    for p in sorted(set(int(p) for p in periods)):
+        ma = np.full(n, np.nan)
+        if p <= n:
+            ma[p - 1:] = (csum[p:] - csum[:-p]) / p
+        table[p] = ma
+    return table
+
+
+def crossover_signals(fast, slow):
+    # fast / slow 为形状 (组合数, bar 数) 的二维数组
+    # 金叉：当前 fast > slow 且上一根 fast < slow；死叉相反
+    # NaN 参与比较时结果为 False，因此数据不足的区域不会产生信号
+    golden = np.zeros(fast.shape, dtype=bool)
+    death = np.zeros(fast.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        above = fast > slow
+        below = fast < slow
+    golden[:, 1:] = above[:, 1:] & below[:, :-1]
+    death[:, 1:] = below[:, 1:] & above[:, :-1]
+    return golden, death
+
+
+def simulate_long_only(golden_idx, death_idx, open_, close, size=10, commission=0.0001,
+                       initial_cash=100000.0):
+    # 按 backtrader 的执行顺序模拟单个参数组合：
+    # 空仓时遇到金叉下单，下一根 bar 开盘买入；持仓时遇到死叉下单，下一根 bar 开盘平仓
+    # 最后一根 bar 发出的订单没有机会成交，与 backtrader 一致
+    n = len(close)
+    entries, exits = [], []
+    cash = initial_cash
+    cur = 0
+    while True:
+        k = np.searchsorted(golden_idx, cur)
+        if k >= len(golden_idx) or golden_idx[k] >= n - 1:
+            break
+        g = golden_idx[k]
+        e = g + 1
+        # 下单时 broker 按信号 bar 的收盘价预估资金，成交时再按开盘价检查一次
+        if (cash - size * close[g] * (1 + commission) < 0.0
+                or cash - size * open_[e] * (1 + commission) < 0.0):
+            cur = g + 1
+            continue
+        entries.append(e)
+        cash -= size * open_[e] * (1 + commission)
+        k = np.searchsorted(death_idx, e)
+        if k >= len(death_idx) or death_idx[k] >= n - 1:
+            break
+        x = death_idx[k] + 1
+        exits.append(x)
+        cash += size * open_[x] * (1 - commission)
+        cur = x
+    return np.asarray(entries, dtype=np.int64), np.asarray(exits, dtype=np.int64)
+
+
+def equity_curve(entries, exits, open_, close, size=10, commission=0.0001, initial_cash=100000.0):
+    # 根据成交点还原每根 bar 收盘后的账户总值 (现金 + 持仓市值)
+    n = len(close)
+    cash_delta = np.zeros(n)
+    pos_delta = np.zeros(n)
+    cash_delta[entries] -= size * open_[entries] * (1 + commission)
+    pos_delta[entries] += size
+    cash_delta[exits] += size * open_[exits] * (1 - commission)
+    pos_delta[exits] -= size
+    cash = initial_cash + np.cumsum(cash_delta)
+    position = np.cumsum(pos_delta)
+    return cash + position * close
+
+
+def fill_trades(entries, exits, open_, size=10, commission=0.0001):
+    # 成交点 -> 交易列表 (格式与 report.make_trades 一致)：净盈亏与 backtrader 的 trade.pnlcomm 相同，
+    # 即价差收益减去开仓和平仓两次佣金；最后一笔没有平仓时 exit 为 -1、pnl 为 NaN
+    closed = len(exits)
+    exit_idx = np.full(len(entries), -1, dtype=np.int64)
+    exit_idx[:closed] = exits
+    pnl = np.full(len(entries), np.nan)
+    entry_price, exit_price = open_[entries[:closed]], open_[exits]
+    pnl[:closed] = size * (exit_price - entry_price) - size * commission * (entry_price + exit_price)
+    return {'entry': np.asarray(entries, dtype=np.int64), 'exit': exit_idx, 'pnl': pnl}
+
+
+def year_end_index(dates):
+    # 每个自然年最后一根 bar 的位置，用于复现 TimeReturn(timeframe=Years)
+    years = pd.DatetimeIndex(dates).year.to_numpy()
+    last = np.flatnonzero(np.diff(years) != 0)
+    return np.append(last, len(years) - 1)
+
+
+def sharpe_from_values(year_values, initial_cash=100000.0, riskfreerate=0.01):
+    # SharpeRatio(timeframe=Years) 的默认计算：年收益减无风险利率，均值 / 总体标准差，不年化
+    prev = np.concatenate(([initial_cash], year_values[:-1]))
+    rets = year_values / prev - 1.0
+    if len(rets) == 0:
+        return None
+    ret_free = rets - riskfreerate
+    dev = math.sqrt(np.mean((ret_free - ret_free.mean()) ** 2))
+    if dev == 0.0:
+        return None
+    return float(ret_free.mean() / dev)
+
+
+def evaluate_signals(golden_idx, death_idx, open_, close, year_idx, size=10, commission=0.0001,
+                     initial_cash=100000.0, riskfreerate=0.01, keep_equity=False):
+    # 给定一个参数组合的金叉/死叉位置，模拟成交并计算 rtot、交易次数、夏普比率
+    entries, exits = simulate_long_only(golden_idx, death_idx, open_, close, size=size,
+                                        commission=commission, initial_cash=initial_cash)
+    values = equity_curve(entries, exits, open_, close, size=size,
+                          commission=commission, initial_cash=initial_cash)
+    final_value = float(values[-1])
+    record = {
+        'rtot': math.log(final_value / initial_cash) if final_value > 0 else float('-inf'),
+        'total_trades': len(exits),
+        'sharpe_ratio': sharpe_from_values(values[year_idx], initial_cash, riskfreerate),
+        'final_value': final_value,
+    }
+    if keep_equity:
+        record['equity'] = values
+        record['entries'] = entries
+        record['exits'] = exits
+        record['trades'] = fill_trades(entries, exits, open_, size=size, commission=commission)
+    return record
+
+
+def grid_signals(close, combos):
+    # 对整段历史一次性计算所有参数组合的金叉/死叉矩阵，形状为 (组合数, bar 数)
+    table = sma_table(close, [p for combo in combos for p in combo])
+    fast = np.stack([table[f] for f, _ in combos])
+    slow = np.stack([table[s] for _, s in combos])
+    return crossover_signals(fast, slow)
+
+
+def run_vector_grid(df, fast_lengths, slow_lengths, size=10, commission=0.0001,
+                    initial_cash=100000.0, riskfreerate=0.01, chunk_size=512, keep_equity=False):
+    # 对 fast_lengths x slow_lengths 的整个参数网格做向量化回测
+    # 返回每个组合一条记录：fast_length, slow_length, rtot, total_trades, sharpe_ratio, final_value
+    open_ = df['Open'].to_numpy(dtype=np.float64)
+    close = df['Close'].to_numpy(dtype=np.float64)
+    year_idx = year_end_index(df.index)
+
+    combos = [(f, s) for f in fast_lengths for s in slow_lengths]
+    records = []
+    # 组合数很大时按块处理，避免一次性生成 (组合数 x bar 数) 的巨型矩阵
+    for start in range(0, len(combos), chunk_size):
+        chunk = combos[start:start + chunk_size]
+        golden, death = grid_signals(close, chunk)
+        for row, (f, s) in enumerate(chunk):
+            record = {'fast_length': f, 'slow_length': s}
+            record.update(evaluate_signals(np.flatnonzero(golden[row]), np.flatnonzero(death[row]),
+                                           open_, close, year_idx, size=size, commission=commission,
+                                           initial_cash=initial_cash, riskfreerate=riskfreerate,
+                                           keep_equity=keep_equity))
+            records.append(record)
+    return records
@@ -0,0 +1,142 @@
+# 双均线策略的滚动前推 (walk-forward) 优化
+# SMA_Opt_Strategy.py 在 2000-2025 整段历史上选出最佳 (fast_length, slow_length) 后又在同一段数据上回放，
+# 属于样本内结果。这里把历史切成若干 训练窗口 / 测试窗口：
+#   - rolling：训练窗口固定长度，随测试窗口一起向前滚动
+#   - anchored：训练窗口起点固定在历史开头，只向后扩展
+# 每个训练窗口上做参数优化，用选出的参数在紧接着的测试窗口上做样本外回测，最后把各测试窗口的
+# 资金曲线拼接起来。
+# 拼接出的资金曲线是一条可以实际交易的路径：测试窗口结束时仍持有的仓位在下一个窗口第一根 bar 的
+# 开盘价平仓并收取佣金 (与新窗口的策略切换参数、从空仓开始相对应)；测试窗口最后一根 bar 上的金叉
+# 不再开仓。只有最后一个窗口没有下一根 bar，未平仓的仓位按最后收盘价估值 (与 backtrader 数据结束时一致)。
+# 均线和金叉/死叉矩阵只在整段历史上计算一次，各窗口直接取切片：测试窗口开头的均线已经"预热"，
+# 窗口前进时不需要重建任何指标。各窗口之间相互独立，用进程池并行计算。
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from vector_sma import evaluate_signals, grid_signals, year_end_index
+
+# 子进程共享的全历史数据和信号矩阵，由进程池的 initializer 设置
+_shared = {}
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, anchored=False, step=None):
+    # 返回 [(train_start, train_end, test_start, test_end), ...]，区间左闭右开
+    step = step or test_bars
+    windows = []
+    test_start = train_bars
+    while test_start < n_bars:
+        test_end = min(test_start + test_bars, n_bars)
+        train_start = 0 if anchored else test_start - train_bars
+        windows.append((train_start, test_start, test_start, test_end))
+        test_start += step
+    return windows
+
+
+def _init_shared(state):
+    _shared.update(state)
+
+
+def _slice_signals(row, start, end):
+    golden, death = _shared['golden'], _shared['death']
+    return np.flatnonzero(golden[row, start:end]), np.flatnonzero(death[row, start:end])
+
+
+def _evaluate_window(window):
+    # 在训练窗口上评估全部参数组合，选出最佳参数后在测试窗口上回测
+    train_start, train_end, test_start, test_end = window
+    st = _shared
+    n_bars = len(st['close'])
+    open_, close, dates = st['open'], st['close'], st['dates']
+    kwargs = dict(size=st['size'], commission=st['commission'], initial_cash=st['cash'])
+    train_years = year_end_index(dates[train_start:train_end])
+    best = None
+    for row, combo in enumerate(st['combos']):
+        golden_idx, death_idx = _slice_signals(row, train_start, train_end)
+        record = evaluate_signals(golden_idx, death_idx, open_[train_start:train_end],
+                                  close[train_start:train_end], train_years, **kwargs)
+        score = record[st['metric']]
+        if score is not None and (best is None or score > best[1]):
+            best = (row, score)
+    # 所有组合的评分都无效 (例如夏普比率全为 None) 时退回第一个组合
+    row, train_score = best if best is not None else (0, None)
+    golden_idx, death_idx = _slice_signals(row, test_start, test_end)
+    # 后面还有数据时多带上下一窗口的第一根 bar：在测试窗口最后一根 bar 上强制发出平仓信号，
+    # 仓位在这根 bar 的开盘价平掉；同一根 bar 上的金叉去掉，不留下跨窗口的新仓位
+    exit_bar = test_end if test_end < n_bars else None
+    end = test_end + 1 if exit_bar is not None else test_end
+    if exit_bar is not None:
+        last = test_end - 1 - test_start
+        golden_idx = golden_idx[golden_idx < last]
+        death_idx = np.union1d(death_idx, [last])
+    test = evaluate_signals(golden_idx, death_idx, open_[test_start:end], close[test_start:end],
+                            year_end_index(dates[test_start:end]), keep_equity=True, **kwargs)
+    fast_length, slow_length = st['combos'][row]
+    forced_exit = exit_bar is not None and len(test['exits']) and test['exits'][-1] == end - 1 - test_start
+    return {
+        'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+        'test_start': dates[test_start], 'test_end': dates[test_end - 1],
+        'fast_length': fast_length, 'slow_length': slow_length,
+        f"train_{st['metric']}": train_score,
+        'test_rtot': test['rtot'], 'test_trades': test['total_trades'],
+        'test_sharpe_ratio': test['sharpe_ratio'],
+        'test_pnl': test['final_value'] - st['cash'],
+        'forced_exit': bool(forced_exit),
+        # 资金曲线只保留测试窗口自己的 bar，下一窗口第一根 bar 上的平仓已经计入 test_pnl
+        'equity': test['equity'][:test_end - test_start], 'test_slice': (test_start, test_end),
+    }
+
+
+def walk_forward(df, fast_lengths, slow_lengths, train_bars=252 * 5, test_bars=252, anchored=False,
+                 step=None, metric='rtot', workers=None, size=10, commission=0.0001, cash=100000.0):
+    # 返回 (每个窗口的结果 DataFrame, 拼接后的样本外资金曲线 Series)
+    combos = [(f, s) for f in fast_lengths for s in slow_lengths]
+    close = df['Close'].to_numpy(dtype=np.float64)
+    golden, death = grid_signals(close, combos)
+    state = {
+        'open': df['Open'].to_numpy(dtype=np.float64), 'close': close, 'dates': df.index,
+        'golden': golden, 'death': death, 'combos': combos, 'metric': metric,
+        'size': size, 'commission': commission, 'cash': cash,
+    }
+    windows = walk_forward_windows(len(df), train_bars, test_bars, anchored=anchored, step=step)
+    workers = min(workers or os.cpu_count() or 1, len(windows)) or 1
+    if workers == 1:
+        _init_shared(state)
+        results = [_evaluate_window(w) for w in windows]
+    else:
+        with multiprocessing.Pool(processes=workers, initializer=_init_shared, initargs=(state,)) as pool:
+            results = pool.map(_evaluate_window, windows)
+
+    # 拼接样本外资金曲线：上一个窗口的仓位已经在当前窗口第一根 bar 的开盘价平掉，每个测试窗口都从空仓开始，
+    # 策略每次固定买入 size 个单位，盈亏与起始资金无关，所以把前面各窗口的累计盈亏加到当前窗口的资金曲线上即可
+    pieces, offset = [], 0.0
+    for result in results:
+        start, end = result.pop('test_slice')
+        equity = result.pop('equity')
+        pieces.append(pd.Series(equity + offset, index=df.index[start:end]))
+        offset += result['test_pnl']
+    oos_equity = pd.concat(pieces) if pieces else pd.Series(dtype=np.float64)
+    oos_equity.name = 'value'
+    return pd.DataFrame(results), oos_equity
+
+
+if __name__ == '__main__':
+    from data_cache import load_price_csv
+
+    data_file = "GC=F_historical_data.csv"
+    df = load_price_csv(data_file)
+    initial_cash = 100000.0
+    # 训练 5 年，测试 1 年，训练窗口随测试窗口滚动
+    summary, oos_equity = walk_forward(df, range(10, 31, 5), range(50, 200, 10),
+                                       train_bars=252 * 5, test_bars=252, anchored=False,
+                                       metric='rtot', cash=initial_cash)
+    print("--- Walk-forward 各窗口结果 ---")
+    for _, w in summary.iterrows():
+        print(f"  训练 {w['train_start'].date()} ~ {w['train_end'].date()} | "
+              f"测试 {w['test_start'].date()} ~ {w['test_end'].date()} | "
+              f"fast_length: {w['fast_length']}, slow_length: {w['slow_length']} | "
+              f"样本外收益率: {w['test_rtot'] * 100:.2f}%, 交易次数: {w['test_trades']}")
+    print(f"\n样本外拼接后最终资金: {oos_equity.iloc[-1]:.2f}")
+    print(f"样本外总收益率: {(oos_equity.iloc[-1] / initial_cash - 1) * 100:.2f}%")